@@ -462,6 +462,77 @@
     }
   }
 
+  // ===========================================================
+  // STATIC SHARDS (manifest first, shards on demand)
+  // ===========================================================
+  // `api.py build-shards` splits tables_index.js and company_tickers.js into
+  // content-hashed files under API/shards/. Startup fetches only the manifest;
+  // a ticker's tables or a letter's companies load the first time they are
+  // needed. Without a manifest the monolithic scripts are injected instead.
+  const LEGACY_DATA_VERSION = '1771796694';
+  let _shardManifest = null;
+  const _shardCache = {};
+  const _scriptCache = {};
+
+  function loadShardManifest() {
+    if (!_shardManifest) {
+      _shardManifest = apiFetch('/shards/manifest.json', {}, 0).catch(() => null);
+    }
+    return _shardManifest;
+  }
+
+  function loadShard(file) {
+    if (!_shardCache[file]) {
+      _shardCache[file] = apiFetch(`/shards/${file}`).catch(err => {
+        delete _shardCache[file];
+        throw err;
+      });
+    }
+    return _shardCache[file];
+  }
+
+  function loadLegacyScript(name, globalName) {
+    if (window[globalName]) return Promise.resolve(window[globalName]);
+    if (!_scriptCache[name]) {
+      _scriptCache[name] = new Promise(resolve => {
+        const script = document.createElement('script');
+        script.src = `./${name}?v=${LEGACY_DATA_VERSION}`;
+        script.onload = () => resolve(window[globalName] || null);
+        script.onerror = () => resolve(null);
+        document.head.appendChild(script);
+      });
+    }
+    return _scriptCache[name];
+  }
+
+  // Must match company_shard_key() in api.py.
+  function companyShardKey(ticker) {
+    const first = ticker.charAt(0).toUpperCase();
+    return first >= 'A' && first <= 'Z' ? first : '_';
+  }
+
+  /**
+   * Company tickers as {TICKER: {cik, name}}. With a ticker, only the shard
+   * that can hold it is loaded; without one (search), every company shard.
+   */
+  let _allCompanyTickers = null;
+  async function loadCompanyTickers(ticker) {
+    const manifest = await loadShardManifest();
+    if (!manifest?.companies) return loadLegacyScript('company_tickers.js', '__COMPANY_TICKERS__');
+    const files = manifest.companies.files;
+    if (ticker) {
+      const file = files[companyShardKey(ticker)];
+      return file ? loadShard(file).catch(() => null) : null;
+    }
+    if (!_allCompanyTickers) {
+      _allCompanyTickers = Promise.all(Object.values(files).map(f => loadShard(f).catch(() => ({}))))
+        .then(shards => Object.assign({}, ...shards));
+    }
+    return _allCompanyTickers;
+  }
+
+  loadShardManifest();
+
   // Fuzzy matching helper — simple Levenshtein distance
   function levenshtein(a, b) {
     const m = a.length, n = b.length;
@@ -491,10 +562,11 @@
       searchIndex = [...data.searchIndex];
     }
 
-    // Load company_tickers from global (loaded via <script> tag)
-    if (window.__COMPANY_TICKERS__) {
+    // Load company tickers (all shards, fetched once on the first search)
+    const companyTickers = await loadCompanyTickers();
+    if (companyTickers) {
       const existingTickers = new Set(searchIndex.map(c => c.ticker.toUpperCase()));
-      for (const [ticker, entry] of Object.entries(window.__COMPANY_TICKERS__)) {
+      for (const [ticker, entry] of Object.entries(companyTickers)) {
         if (!existingTickers.has(ticker)) {
           searchIndex.push({
             ticker: ticker,
@@ -713,9 +785,10 @@
       return state.cikCache[ticker.toUpperCase()];
     }
 
-    // Check global company tickers (loaded via <script> tag)
-    if (window.__COMPANY_TICKERS__) {
-      const entry = window.__COMPANY_TICKERS__[ticker.toUpperCase()];
+    // Check company tickers (only the shard for this ticker's first letter)
+    const companyTickers = await loadCompanyTickers(ticker);
+    if (companyTickers) {
+      const entry = companyTickers[ticker.toUpperCase()];
       if (entry) {
         const cik = String(entry.cik).padStart(10, '0');
         if (!state.cikCache) state.cikCache = {};
@@ -742,10 +815,11 @@
     return null;
   }
 
-  async function edgarSearch(q, forms = '', page = 0) {
+  async function edgarSearch(q, forms = '', page = 0, source = '') {
     const params = { q };
     if (forms) params.forms = forms;
     params.page = page;
+    if (source) params.source = source;
     // Try CGI first, then fall back to CORS proxy to EDGAR full-text search
     try { return await apiFetch('/search', params); }
     catch(e) {
@@ -1981,7 +2055,7 @@
         <div id="compareResult"></div>
       `;
 
-      $('#compareBtn').addEventListener('click', () => {
+      $('#compareBtn').addEventListener('click', async () => {
         const a = $('#compareA').value;
         const b = $('#compareB').value;
         if (a === '' || b === '') { showToast('Select both filings', 'error'); return; }
@@ -2006,6 +2080,20 @@
           </div>
         </div>`;
 
+        // Server-side section/block diff of the full documents
+        if (cikNum && fA.primaryDocument && fB.primaryDocument) {
+          $('#compareResult').innerHTML = html + loadingSpinner();
+          try {
+            const diff = await apiFetch('/edgar/compare', {
+              cik: cikNum, a: fidA, a_file: fA.primaryDocument, b: fidB, b_file: fB.primaryDocument,
+            });
+            $('#compareResult').innerHTML = html + renderServerDiff(diff);
+            return;
+          } catch (e) {
+            console.warn('[WamSEC] Server comparison failed, using local comparison:', e);
+          }
+        }
+
         if (docA && docB) {
           // Rich section-based comparison
           html += `<div class="card mt-4 p-4">
@@ -2098,6 +2186,52 @@
         $('#compareResult').innerHTML = html;
       });
 
+      function renderServerDiff(diff) {
+        const sum = diff.summary || {};
+        const statusLabel = {
+          unchanged: '<span class="text-muted">Unchanged</span>',
+          changed: '<span class="text-warning">Changed</span>',
+          added: '<span class="text-success">Added</span>',
+          removed: '<span class="text-danger">Removed</span>',
+        };
+        let out = `<div class="card mt-4 p-4">
+          <h4 class="fw-600 mb-3">Section Comparison</h4>
+          <div class="diff-stats mb-3">
+            <span class="diff-stat-add">+${sum.blocks_inserted || 0} blocks added</span>
+            <span class="diff-stat-del">-${sum.blocks_deleted || 0} blocks removed</span>
+            <span class="text-muted text-sm">${sum.blocks_moved || 0} moved · ${sum.sections_changed || 0} sections changed</span>
+          </div>
+          <table class="data-table"><thead><tr>
+            <th>Section</th><th>Status</th><th>Blocks (A → B)</th>
+          </tr></thead><tbody>`;
+        for (const sec of diff.sections || []) {
+          out += `<tr>
+            <td>${escHtml(sec.title)}</td>
+            <td>${statusLabel[sec.status] || escHtml(sec.status)}</td>
+            <td>${sec.blocks_a} → ${sec.blocks_b}</td>
+          </tr>`;
+        }
+        out += '</tbody></table>';
+
+        // Changed blocks only; unchanged runs collapse to a count. Capped so
+        // a heavily rewritten filing can't stall the tab.
+        let budget = 2000;
+        for (const sec of diff.sections || []) {
+          if (sec.status === 'unchanged' || budget <= 0) continue;
+          out += `<details class="mt-3"${sec.status === 'changed' ? ' open' : ''}>
+            <summary class="fw-600">${escHtml(sec.title)}</summary><div class="diff-view mt-2">`;
+          for (const op of sec.ops) {
+            if (budget-- <= 0) { out += '<div class="text-muted text-sm">… more changes not shown</div>'; break; }
+            if (op.op === 'equal') out += `<div class="text-muted text-sm">… ${op.count} unchanged block${op.count === 1 ? '' : 's'} …</div>`;
+            else if (op.op === 'insert') out += `<div class="diff-add">${escHtml(op.text)}</div>`;
+            else if (op.op === 'delete') out += `<div class="diff-del">${escHtml(op.text)}</div>`;
+            else out += `<div class="diff-add"><span class="text-muted text-sm">(moved)</span> ${escHtml(op.text)}</div>`;
+          }
+          out += '</div></details>';
+        }
+        return out + '</div>';
+      }
+
       function generateFilingText(f) {
         const ft = f.secFormType || f.formType || '';
         const desc = f.documentType || f.description || '';
@@ -3111,6 +3245,7 @@
     const query = params.q || '';
     const formsParam = params.forms || '';
     const page = parseInt(params.page || '0');
+    const source = params.source || '';
 
     if (query && !state.recentSearches.includes(query)) {
       state.recentSearches.unshift(query);
@@ -3171,7 +3306,7 @@
       const embeddedResults = searchEmbeddedData(query, formsParam);
 
       try {
-        const data = await edgarSearch(query, formsParam, page);
+        const data = await edgarSearch(query, formsParam, page, source);
         renderSearchResults(data, query, page, embeddedResults);
       } catch (err) {
         // Show embedded results even if EDGAR fails
@@ -3232,9 +3367,15 @@
         </div>`;
       }
 
+      // Keep paging on the source the first page came from.
+      const local = data?.source === 'local';
+      const pageHash = p => `#/search?q=${encodeURIComponent(q)}&page=${p}${local ? '&source=local' : ''}`;
       if (hits.length > 0) {
         html += `<div class="search-results-section">
-          <h4 class="search-section-label">From EDGAR Full-Text Search <span class="text-muted text-sm">(${total.toLocaleString()} total results)</span></h4>`;
+          <h4 class="search-section-label">${local ? 'From Filings Already Opened' : 'From EDGAR Full-Text Search'} <span class="text-muted text-sm">(${total.toLocaleString()} ${local ? 'matches in opened filings only' : 'total results'})</span></h4>`;
+        if (local) {
+          html += `<p class="text-muted text-sm mb-2"><a class="text-link" href="#/search?q=${encodeURIComponent(q)}&source=efts">Search all of EDGAR →</a></p>`;
+        }
 
         hits.forEach(hit => {
           const src = hit._source || hit;
@@ -3264,11 +3405,11 @@
         const totalPages = Math.ceil(total / 20);
         if (totalPages > 1) {
           html += '<div class="pagination">';
-          html += `<button ${currentPage === 0 ? 'disabled' : ''} onclick="location.hash='#/search?q=${encodeURIComponent(q)}&page=${currentPage - 1}'">← Prev</button>`;
+          html += `<button ${currentPage === 0 ? 'disabled' : ''} onclick="location.hash='${pageHash(currentPage - 1)}'">← Prev</button>`;
           for (let i = 0; i < Math.min(totalPages, 10); i++) {
-            html += `<button class="${i === currentPage ? 'active' : ''}" onclick="location.hash='#/search?q=${encodeURIComponent(q)}&page=${i}'">${i + 1}</button>`;
+            html += `<button class="${i === currentPage ? 'active' : ''}" onclick="location.hash='${pageHash(i)}'">${i + 1}</button>`;
           }
-          html += `<button ${currentPage >= totalPages - 1 ? 'disabled' : ''} onclick="location.hash='#/search?q=${encodeURIComponent(q)}&page=${currentPage + 1}'">Next →</button>`;
+          html += `<button ${currentPage >= totalPages - 1 ? 'disabled' : ''} onclick="location.hash='${pageHash(currentPage + 1)}'">Next →</button>`;
           html += '</div>';
         }
       } else if (!embeddedResults.length) {
@@ -5033,16 +5174,34 @@
   // Live table index cache: window.__LIVE_TABLE_INDEX__[ticker] = array of match objects
   if (!window.__LIVE_TABLE_INDEX__) window.__LIVE_TABLE_INDEX__ = {};
 
-  async function loadTablesIndex() {
+  /**
+   * Tables index as {meta, tables}. From shards, `tables` holds only the
+   * given ticker's tables; the legacy tables_index.js fallback holds all.
+   */
+  async function loadTablesIndex(tkUpper) {
+    const manifest = await loadShardManifest();
+    if (manifest?.tables) {
+      const file = manifest.tables.tickers[tkUpper];
+      const shard = file ? await loadShard(file) : { tables: [] };
+      return { meta: manifest.tables.meta, tables: shard.tables };
+    }
     if (_tablesIndex) return _tablesIndex;
-    // Loaded via <script> tag as window.__TABLES_INDEX__
-    if (window.__TABLES_INDEX__) {
-      _tablesIndex = window.__TABLES_INDEX__;
-      console.log('[WamSEC] Tables index loaded from global:', _tablesIndex.meta?.tables_count, 'tables');
-      return _tablesIndex;
+    _tablesIndex = await loadLegacyScript('tables_index.js', '__TABLES_INDEX__');
+    if (_tablesIndex) {
+      console.log('[WamSEC] Tables index loaded from script:', _tablesIndex.meta?.tables_count, 'tables');
+    } else {
+      console.warn('[WamSEC] Tables index not available (no shard manifest or tables_index.js)');
     }
-    console.warn('[WamSEC] Tables index not available (window.__TABLES_INDEX__ not set)');
-    return null;
+    return _tablesIndex;
+  }
+
+  async function tablesIndexHasTicker(tkUpper) {
+    const manifest = await loadShardManifest();
+    // tables.db-only tickers (manifest.tables.db_tickers) have no addressable
+    // table HTML, so they stay on the live path.
+    if (manifest?.tables) return Boolean(manifest.tables.tickers[tkUpper]);
+    const index = await loadTablesIndex(tkUpper);
+    return Boolean(index?.meta?.companies?.[tkUpper]);
   }
 
   /**
@@ -5052,10 +5211,10 @@
    */
   async function findSimilarTablesAPI(signature, currentFilingId, ticker) {
     try {
-      const index = await loadTablesIndex();
+      const tkUpper = ticker.toUpperCase();
+      const index = await loadTablesIndex(tkUpper);
       if (!index || !index.tables) return null;
 
-      const tkUpper = ticker.toUpperCase();
       if (!index.meta.companies[tkUpper]) {
         return { matches: [], error: 'not_ingested', filings_scanned: 0, tables_scanned: 0 };
       }
@@ -5618,7 +5777,7 @@
     const signature = buildTableSignature(tableEl);
     const detectedTitle = signature.title || '';
     const tkUpper = ticker.toUpperCase();
-    const hasStaticIndex = window.__TABLES_INDEX__ && window.__TABLES_INDEX__.meta?.companies?.[tkUpper];
+    const hasStaticIndex = await tablesIndexHasTicker(tkUpper);
 
     // Remove any existing overlay
     document.getElementById('similarTablesOverlay')?.remove();
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Benchmark: /edgar/document processing, four regex passes vs. streaming.
+
+Generates synthetic inline-XBRL 10-K documents (dense ix:nonFraction facts
+inside financial tables, an ix:header block, relative and absolute links) and
+processes each one both ways:
+
+  legacy  — decode, four re.sub passes, encode, gzip.compress (the old handler)
+  stream  — transform_filing() over 64 KB chunks into a zlib gzip stream
+
+Reports best-of-3 wall time and peak traced memory (tracemalloc, in a
+separate run), and checks that both decompress to the same document.
+
+Usage:
+  python bench/bench_filing_transform.py [--sizes-mb 2,10,40]
+"""
+
+import argparse
+import gzip
+import os
+import random
+import re
+import sys
+import time
+import tracemalloc
+import zlib
+from functools import partial
+from io import BytesIO
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "cgi-bin"))
+
+from api import FILING_CHUNK_SIZE, transform_filing  # noqa: E402
+
+CIK, ACCESSION = "320193", "000032019325000079"
+
+
+def legacy(raw, cik, accession):
+    html = raw.decode("utf-8", errors="replace")
+    html = re.sub(r"<ix:[^>]+>", "", html, flags=re.IGNORECASE)
+    html = re.sub(r"</ix:[^>]+>", "", html, flags=re.IGNORECASE)
+    html = re.sub(r"<ix:header[\s\S]*?</ix:header>", "", html, flags=re.IGNORECASE)
+    base_path = f"https://www.sec.gov/Archives/edgar/data/{cik}/{accession}/"
+    html = re.sub(
+        r'(href|src)="(?!https?://|//|#|mailto:)([^"]*)"',
+        lambda m: f'{m.group(1)}="{base_path}{m.group(2)}"',
+        html,
+    )
+    return gzip.compress(html.encode("utf-8"))
+
+
+def streaming(raw, cik, accession):
+    stream = BytesIO(raw)
+    compressor = zlib.compressobj(9, zlib.DEFLATED, 31)
+    parts = []
+    for text in transform_filing(iter(partial(stream.read, FILING_CHUNK_SIZE), b""), cik, accession):
+        parts.append(compressor.compress(text.encode("utf-8")))
+    parts.append(compressor.flush())
+    return b"".join(parts)
+
+
+def make_filing(size, rng):
+    out = ['<html><head><title>10-K</title></head><body><div style="display:none"><ix:header>'
+           '<ix:hidden><ix:nonNumeric name="dei:DocumentType" contextRef="c-1">10-K</ix:nonNumeric>'
+           '</ix:hidden><ix:references><link:schemaRef xlink:href="aapl-20250927.xsd"/></ix:references>'
+           '</ix:header></div>']
+    total = len(out[0])
+    n = 0
+    while total < size:
+        n += 1
+        if n % 40 == 0:
+            piece = (f'<p id="s{n}">Item {n % 15}. Management’s discussion — see '
+                     f'<a href="#s{n - 1}">above</a>, <a href="ex{n % 9}.htm">Exhibit</a> and '
+                     f'<a href="https://www.sec.gov/">SEC</a>.</p><img src="g{n}.jpg" alt=""/>')
+        else:
+            cells = "".join(
+                f'<td style="padding:0 4px;text-align:right"><span style="font-family:Times New Roman">'
+                f'<ix:nonFraction unitRef="usd" contextRef="c-{rng.randrange(400)}" decimals="-6" '
+                f'name="us-gaap:Revenue{rng.randrange(50)}" format="ixt:num-dot-decimal" scale="6" '
+                f'id="f-{n}-{i}">{rng.randrange(10 ** 6):,}</ix:nonFraction></span></td>'
+                for i in range(4)
+            )
+            piece = f'<tr><td><span style="font-size:10pt">Line item {rng.randrange(10 ** 4)}</span></td>{cells}</tr>'
+        out.append(piece)
+        total += len(piece)
+    out.append("</body></html>")
+    return "".join(out).encode("utf-8")
+
+
+def measure(fn, raw):
+    """Best-of-3 wall time, then peak memory in a separate traced run (tracing slows it down)."""
+    secs = float("inf")
+    for _ in range(3):
+        start = time.perf_counter()
+        result = fn(raw, CIK, ACCESSION)
+        secs = min(secs, time.perf_counter() - start)
+    tracemalloc.start()
+    fn(raw, CIK, ACCESSION)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return secs, peak, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes-mb", default="2,10,40")
+    args = parser.parse_args()
+
+    for mb in (float(x) for x in args.sizes_mb.split(",")):
+        raw = make_filing(int(mb * 1024 * 1024), random.Random(0))
+        old_s, old_peak, old = measure(legacy, raw)
+        new_s, new_peak, new = measure(streaming, raw)
+        if gzip.decompress(old) != gzip.decompress(new):
+            sys.exit(f"outputs differ for the {mb} MB document")
+        print(f"{len(raw) / 1e6:6.1f} MB filing -> {len(new) / 1e6:5.2f} MB gzip")
+        print(f"  legacy  {old_s:7.2f} s  peak {old_peak / 1e6:8.1f} MB")
+        print(f"  stream  {new_s:7.2f} s  peak {new_peak / 1e6:8.1f} MB (of which output {len(new) / 1e6:.1f} MB)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark: levenshtein() vs levenshtein_within() on the full ticker list.
+
+Replays the fuzzy tier of /companies/search: for each query, every ticker is
+checked against the threshold max(2, len(q) // 2). Both functions must agree
+on which tickers fall within the threshold and at what distance.
+
+Usage:
+  python bench/bench_levenshtein.py [--queries N] [--seed S]
+
+Tickers come from cgi-bin/company_tickers.json when present, otherwise from
+the bundled company_tickers.js.
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "cgi-bin"))
+
+from api import levenshtein, levenshtein_within  # noqa: E402
+
+
+def load_tickers():
+    cached = os.path.join(ROOT, "cgi-bin", "company_tickers.json")
+    if os.path.exists(cached):
+        with open(cached) as f:
+            return [str(e.get("ticker", "")).upper() for e in json.load(f).values()]
+    with open(os.path.join(ROOT, "company_tickers.js")) as f:
+        text = f.read()
+    return [t.upper() for t in json.loads(text[text.index("{"):].rstrip().rstrip(";"))]
+
+
+def make_queries(tickers, n, rng):
+    """Typos of real tickers (the common case) plus random strings of 1-10 letters."""
+    letters = "ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+    queries = []
+    for t in rng.sample(tickers, n // 2):
+        chars = list(t)
+        if chars:
+            chars[rng.randrange(len(chars))] = rng.choice(letters)
+        queries.append("".join(chars) + rng.choice(["", rng.choice(letters)]))
+    while len(queries) < n:
+        queries.append("".join(rng.choice(letters) for _ in range(rng.randint(1, 10))))
+    return queries
+
+
+def run(fn, tickers, queries):
+    matches = []
+    start = time.perf_counter()
+    for q in queries:
+        threshold = max(2, len(q) // 2)
+        for t in tickers:
+            d = fn(q, t, threshold)
+            if d <= threshold:
+                matches.append((q, t, d))
+    return time.perf_counter() - start, matches
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    tickers = load_tickers()
+    queries = make_queries(tickers, args.queries, random.Random(args.seed))
+    comparisons = len(tickers) * len(queries)
+
+    full_s, full = run(lambda q, t, _: levenshtein(q, t), tickers, queries)
+    bounded_s, bounded = run(levenshtein_within, tickers, queries)
+    if full != bounded:
+        sys.exit("levenshtein_within disagrees with levenshtein")
+
+    print(f"{len(tickers)} tickers x {len(queries)} queries = {comparisons} comparisons, {len(full)} matches")
+    for label, secs in (("levenshtein", full_s), ("levenshtein_within", bounded_s)):
+        print(f"  {label:<20} {secs:8.3f} s  {secs / comparisons * 1e6:7.2f} us/comparison")
+    print(f"  speedup              {full_s / bounded_s:8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
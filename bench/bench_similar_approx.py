@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Recall vs. latency report: /tables/similar approximate (MinHash/LSH) mode
+against the exact token-index path.
+
+Uses the synthetic corpus from bench_similar_index.py. Queries are perturbed
+copies of tables already in the corpus (a few labels dropped or replaced), so
+each query has real neighbours. For each recall setting the report shows
+latency and the fraction of exact matches the approximate path returned,
+overall and within the exact top 10.
+
+Usage:
+  python bench/bench_similar_approx.py [--size 100000] [--queries N]
+                                       [--recalls 0.5,0.8,0.9,0.95,0.99] [--dir D]
+"""
+
+import argparse
+import json
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "cgi-bin"))
+
+from api import find_similar_tables, index_tables, lsh_score_cutoff  # noqa: E402
+from bench_similar_index import build_db, make_signature, pct, timed  # noqa: E402
+
+
+def perturb(labels, rng):
+    labels = [x for x in labels if rng.random() > 0.2]
+    if labels and rng.random() < 0.5:
+        labels[rng.randrange(len(labels))] = f"changed {rng.randrange(10 ** 6)}"
+    return labels
+
+
+def make_queries(conn, n, rng):
+    max_id = conn.execute("SELECT MAX(rowid) FROM tables").fetchone()[0]
+    queries = []
+    while len(queries) < n:
+        row = conn.execute("SELECT headers, row_labels FROM tables WHERE rowid = ?",
+                           (rng.randint(1, max_id),)).fetchone()
+        if row is None:
+            continue
+        if rng.random() < 0.2:
+            queries.append(make_signature(rng))
+        else:
+            queries.append((perturb(json.loads(row[0]), rng), perturb(json.loads(row[1]), rng)))
+    return queries
+
+
+def key(result):
+    return (result["filing_id"], result["table_idx"], result["ticker"])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--size", type=int, default=100000)
+    parser.add_argument("--queries", type=int, default=40)
+    parser.add_argument("--recalls", default="0.5,0.8,0.9,0.95,0.99")
+    parser.add_argument("--dir", default=None)
+    args = parser.parse_args()
+    args.dir = args.dir or tempfile.mkdtemp(prefix="wamsec-bench-")
+    os.makedirs(args.dir, exist_ok=True)
+
+    path = os.path.join(args.dir, f"tables_{args.size}.db")
+    if os.path.exists(path):
+        conn = sqlite3.connect(path)
+    else:
+        conn = build_db(path, args.size)
+    secs, _ = timed(index_tables, conn)
+    print(f"{args.size} tables, index refresh {secs:.1f} s ({path})")
+    conn.row_factory = sqlite3.Row
+
+    queries = make_queries(conn, args.queries, random.Random(1))
+    exact = []
+    exact_times = []
+    for headers, rows in queries:
+        secs, results = timed(find_similar_tables, conn, headers, rows)
+        exact.append(results)
+        exact_times.append(secs)
+    total = sum(len(r) for r in exact)
+    print(f"exact          p50 {pct(exact_times, .5) * 1e3:8.1f} ms  p95 {pct(exact_times, .95) * 1e3:8.1f} ms"
+          f"  ({total} matches over {len(queries)} queries)")
+
+    for recall in (float(x) for x in args.recalls.split(",")):
+        times = []
+        found = found_top = total_top = 0
+        for (headers, rows), want in zip(queries, exact):
+            secs, got = timed(find_similar_tables, conn, headers, rows, approx_recall=recall)
+            times.append(secs)
+            got_keys = {key(r) for r in got}
+            found += sum(key(r) in got_keys for r in want)
+            found_top += sum(key(r) in got_keys for r in want[:10])
+            total_top += len(want[:10])
+            if any(r["score"] < 0.25 for r in got):
+                sys.exit("approximate path returned a result below the threshold")
+        print(f"recall={recall:<5} (cutoff {lsh_score_cutoff(recall):.3f})"
+              f"  p50 {pct(times, .5) * 1e3:8.1f} ms  p95 {pct(times, .95) * 1e3:8.1f} ms"
+              f"  recall {found / max(total, 1):6.3f}  top-10 recall {found_top / max(total_top, 1):6.3f}")
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
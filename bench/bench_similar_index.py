@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+Benchmark: similar-tables lookup, full scan vs. token index.
+
+Builds synthetic tables.db files (10k, 100k and 1M tables by default) whose
+labels follow a Zipf-like distribution with a few very common tokens
+("total", years), indexes them with index_tables(), and times
+find_similar_tables() both ways. Every indexed result list must equal the
+scan's.
+
+Usage:
+  python bench/bench_similar_index.py [--sizes 10000,100000,1000000]
+                                      [--queries N] [--scan-queries N] [--dir D]
+
+Databases are written to --dir (a temp directory by default) and reused if
+they already exist there. The 1M-table database is several hundred MB and
+takes a few minutes to build.
+"""
+
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+import json
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "cgi-bin"))
+
+from api import TABLES_SCHEMA, find_similar_tables, index_tables  # noqa: E402
+
+COMMON_HEADERS = ["2025", "2024", "2023", "(in millions)", "three months ended", "year ended december 31,"]
+COMMON_ROWS = ["total", "net income", "revenue", "other", "total assets", "income taxes"]
+TICKERS = [f"T{i:04d}" for i in range(2000)]
+
+
+def zipf_pick(rng, vocab, prefix):
+    """Label drawn from a heavy-tailed (Pareto) distribution over `vocab` labels."""
+    return f"{prefix} {min(int((rng.paretovariate(1.2) - 1) * 50), vocab - 1)}"
+
+
+def make_signature(rng):
+    headers = rng.sample(COMMON_HEADERS, rng.choice([0, 1, 1, 2]))
+    headers += [zipf_pick(rng, 20000, "header") for _ in range(rng.randint(2, 5))]
+    rows = rng.sample(COMMON_ROWS, rng.choice([0, 0, 1, 2]))
+    rows += [zipf_pick(rng, 200000, "line item") for _ in range(rng.randint(3, 25))]
+    return headers, rows
+
+
+def build_db(path, n, seed=0):
+    rng = random.Random(seed)
+    conn = sqlite3.connect(path)
+    conn.executescript(TABLES_SCHEMA)
+    batch = []
+    for i in range(n):
+        headers, rows = make_signature(rng)
+        batch.append((
+            f"0000000000-25-{i // 40:06d}", rng.choice(TICKERS), rng.choice(["10-K", "10-Q"]),
+            "2025-01-01", i % 40, json.dumps(headers), json.dumps(rows), len(rows),
+        ))
+        if len(batch) == 10000:
+            conn.executemany(
+                "INSERT INTO tables (filing_id, ticker, form_type, filed_date, table_idx,"
+                " headers, row_labels, row_count) VALUES (?, ?, ?, ?, ?, ?, ?, ?)", batch)
+            conn.commit()
+            batch = []
+    if batch:
+        conn.executemany(
+            "INSERT INTO tables (filing_id, ticker, form_type, filed_date, table_idx,"
+            " headers, row_labels, row_count) VALUES (?, ?, ?, ?, ?, ?, ?, ?)", batch)
+        conn.commit()
+    return conn
+
+
+def timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return time.perf_counter() - start, result
+
+
+def pct(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def bench_size(n, args):
+    path = os.path.join(args.dir, f"tables_{n}.db")
+    fresh = not os.path.exists(path)
+    if fresh:
+        secs, conn = timed(build_db, path, n)
+        print(f"  built {n} tables in {secs:.1f} s")
+        secs, _ = timed(index_tables, conn)
+        print(f"  indexed in {secs:.1f} s ({os.path.getsize(path) / 1e6:.0f} MB on disk)")
+    else:
+        conn = sqlite3.connect(path)
+        index_tables(conn)
+    conn.row_factory = sqlite3.Row
+
+    rng = random.Random(n)
+    queries = []
+    for _ in range(args.queries):
+        headers, rows = make_signature(rng)
+        queries.append((headers, rows, rng.choice(TICKERS) if rng.random() < 0.5 else None))
+
+    for label, subset in (("cross-company", [q for q in queries if q[2] is None]),
+                          ("ticker filter", [q for q in queries if q[2]])):
+        idx_times, scan_times = [], []
+        for i, (headers, rows, ticker) in enumerate(subset):
+            t_idx, got = timed(find_similar_tables, conn, headers, rows, ticker)
+            idx_times.append(t_idx)
+            if i < args.scan_queries:
+                t_scan, want = timed(find_similar_tables, conn, headers, rows, ticker, use_index=False)
+                scan_times.append(t_scan)
+                if got != want:
+                    sys.exit(f"index results differ from scan for {headers!r} / {rows!r}")
+        if not subset:
+            continue
+        line = f"  {label:<14} index p50 {pct(idx_times, .5) * 1e3:8.1f} ms  p95 {pct(idx_times, .95) * 1e3:8.1f} ms"
+        if scan_times:
+            line += f"   scan p50 {pct(scan_times, .5) * 1e3:9.1f} ms"
+        print(line)
+    conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", default="10000,100000,1000000")
+    parser.add_argument("--queries", type=int, default=40)
+    parser.add_argument("--scan-queries", type=int, default=3,
+                        help="queries per group also run as a full scan and checked for equality")
+    parser.add_argument("--dir", default=None)
+    args = parser.parse_args()
+    args.dir = args.dir or tempfile.mkdtemp(prefix="wamsec-bench-")
+    os.makedirs(args.dir, exist_ok=True)
+
+    for n in (int(x) for x in args.sizes.split(",")):
+        print(f"{n} tables ({args.dir})")
+        bench_size(n, args)
+
+
+if __name__ == "__main__":
+    main()
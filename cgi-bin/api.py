@@ -18,31 +18,119 @@ Endpoints (PATH_INFO based routing):
   GET  /companies/search?q=<query>      — fuzzy company search via SEC company_tickers.json
   GET  /companies/profile?ticker=<T>   — company profile via fiscal.ai
   GET  /companies/filings?ticker=<T>   — filing list via fiscal.ai
+  GET  /companies/dashboard?ticker=<T>[&sections=profile,filings,...&timeout=S]
+                                        — company sections fetched concurrently, partial on failure
   GET  /edgar/filings?ticker=<T>       — filing list via EDGAR submissions API
+                       [&format=columns&forms=10-K,10-Q&from=D&to=D&limit=N&cursor=C]
+                                        — one filtered page as parallel arrays
   GET  /financials?ticker=<T>          — financials via fiscal.ai
   GET  /ratios?ticker=<T>              — ratios via fiscal.ai
+  GET  /facts?tickers=<T1,T2>&concepts=<c1,c2>[&period=annual&from=D&to=D&unit=U]
+                                        — XBRL fact time series for many companies from facts.db
   GET  /stock?ticker=<T>               — stock prices via fiscal.ai
   GET  /shares?ticker=<T>              — shares outstanding via fiscal.ai
   GET  /segments?ticker=<T>            — segments/KPIs via fiscal.ai
   GET  /search?q=<q>&forms=<f>&page=N  — EDGAR full-text search via EFTS
+                       [&source=auto|local|efts] — page 0 from the local FTS5 index when it
+                                        fills the page (partial, paged with source=local)
+  GET  /search/batch?q=<q>&forms=<f1,f2>&page=N — one search per form, run concurrently and merged
   GET  /filing/doc?filingId=<id>       — filing document from EDGAR
   GET  /filing/index?filingId=<id>&cik=<cik> — filing index from EDGAR
   GET  /filing/pdf?filingId=<id>&ticker=<T>  — PDF redirect to fiscal.ai
   GET  /edgar/proxy?url=<encoded_url>  — EDGAR CORS bypass proxy
   GET  /edgar/document?cik=<cik>&accession=<acc>&filename=<fn> — full filing HTML (gzip+b64)
-  GET  /tables/similar?headers=<j>&row_labels=<j>&ticker=<T>   — similar tables lookup (GET)
+                       [&format=raw]   — HTML with Content-Encoding gzip/br/zstd + Range
+  GET  /edgar/compare?cik=<cik>&a=<acc>&a_file=<fn>&b=<acc>&b_file=<fn>
+                                        — section/block diff of two filings (cached)
+  GET  /upstream/stats                  — upstream client counters (pool reuse, retries, limiter waits)
+  GET  /metrics[?hours=N&route=<R>]     — per-route p50/p95/p99 latency and span breakdown
+  GET  /shards/<file>                   — manifest.json and content-hashed table/token/company shards
+  GET  /tables/similar?headers=<j>&row_labels=<j>&ticker=<T>[&mode=approx&recall=R]
+                       [&limit=N&cursor=C&labels=0&format=ndjson]
+                                        — similar tables lookup (GET)
   POST /tables/find-similar             — similar tables lookup (POST, JSON body)
+  POST /tables/similar/batch            — top-k similar tables for many query tables in one pass
+  GET  /tables/lineage?filing_id=<id>&table_idx=N — the table's best match in each earlier filing
+
+Run modes:
+  CGI (default)      — one process per request; the web server sets REQUEST_METHOD,
+                       PATH_INFO, QUERY_STRING and CONTENT_LENGTH in the environment.
+  python api.py serve [--host H] [--port P] [--profile-rate R]
+                     — long-running threaded HTTP server. Requests under
+                       /cgi-bin/api.py/ go through the same main() routing table;
+                       everything else is served as static files from the site root.
+                       Company tickers, the company search index and SQLite connections
+                       stay warm across requests. --profile-rate R runs that share of
+                       requests under cProfile and dumps them to profiles/.
+
+Maintenance commands:
+  python api.py index-tables [--rebuild]
+                     — build/refresh/migrate the token index behind /tables/similar
+  python api.py link-tables [--rebuild] [--tickers AAPL,MSFT]
+                     — precompute /tables/lineage: each table's best match in every
+                       earlier filing of its ticker (incremental)
+  python api.py ingest-tables (--tickers AAPL,MSFT | --from D [--to D]) [--forms 10-K,10-Q]
+                             [--workers N] [--batch N]
+                     — fetch filings, extract table signatures in a process pool and
+                       write them to tables.db (resumable)
+  python api.py ingest-facts (--tickers AAPL,MSFT | --fixtures DIR) [--refresh]
+                     — load SEC companyfacts (live or from a directory of CIK*.json)
+                       into facts.db for /facts
+  python api.py warm-filings [--forms 10-K,10-Q] [--delay S]
+                     — preload /edgar/document's filing store and the /search full-text
+                       index from embedded_data.js
+  python api.py build-shards [--out DIR] [--db tables.db]
+                     — split tables_index.js and company_tickers.js into the lazily
+                       loaded shards behind /shards/ (tables.db tickers listed only)
 """
 
 import os
 import sys
+import io
 import json
 import gzip
+import hashlib
+import heapq
+import math
+import random
+import zlib
 import base64
-import urllib.request
+import cProfile
+import codecs
+import datetime
+import sqlite3
+import struct
+import threading
+import time
+import http.client
 import urllib.parse
 import urllib.error
 import re
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import namedtuple
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from functools import lru_cache, partial, wraps
+from itertools import chain, combinations, groupby
+from math import comb
+from html.parser import HTMLParser
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+try:
+    import fcntl
+except ImportError:  # not on Windows; rate limits are then per process
+    fcntl = None
+
+# Optional: extra Content-Encodings for /edgar/document's raw mode.
+try:
+    import brotli
+except ImportError:
+    brotli = None
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
 
 # ─────────────────────────────────────────────
 # Configuration
@@ -51,20 +139,861 @@ FISCAL_API_KEY = "1b665ff8-a5e1-4332-9604-1cd00bb65355"
 FISCAL_BASE = "https://api.fiscal.ai/v2"
 COMPANY_TICKERS_URL = "https://www.sec.gov/files/company_tickers.json"
 COMPANY_TICKERS_CACHE = "company_tickers.json"
+COMPANY_TICKERS_META = "company_tickers.meta.json"
+# Seconds before the tickers cache is revalidated against sec.gov.
+COMPANY_TICKERS_REFRESH = 6 * 3600
 TABLES_DB = "tables.db"
+FACTS_DB = "facts.db"
+CACHE_DB = "cache.db"
+CACHE_MAX_BYTES = 256 * 1024 * 1024
+# Seconds a fiscal.ai response stays fresh, per endpoint. After that it is
+# still served for FISCAL_STALE_SECONDS while a refresh runs after the response.
+FISCAL_CACHE_TTL = {
+    "/company/profile": 24 * 3600,
+    "/company/filings": 6 * 3600,
+    "/company/financials": 24 * 3600,
+    "/company/ratios": 24 * 3600,
+    "/company/stock": 3600,
+    "/company/shares": 24 * 3600,
+    "/company/segments": 24 * 3600,
+}
+FISCAL_DEFAULT_TTL = 3600
+# EDGAR full-text search results, cached under the normalized query.
+EFTS_CACHE_TTL = 300
+EFTS_PAGE_SIZE = 20
+EFTS_BATCH_MAX_FORMS = 8
+# FTS5 index of the filings /edgar/document has processed; /search tries it first.
+FULLTEXT_DB = "fulltext.db"
+# /facts: per-request limits, and how long clients may reuse a response
+# (facts.db only changes when ingest-facts runs).
+FACTS_MAX_TICKERS = 100
+FACTS_MAX_CONCEPTS = 25
+FACTS_CACHE_TTL = 3600
+# /edgar/compare results; both inputs are immutable processed filings.
+COMPARE_CACHE_TTL = 30 * 24 * 3600
+FISCAL_STALE_SECONDS = 7 * 24 * 3600
+# /companies/dashboard sections and the seconds each may take before the
+# response goes out without it.
+DASHBOARD_TIMEOUTS = {
+    "profile": 8,
+    "filings": 10,
+    "financials": 10,
+    "ratios": 8,
+    "stock": 8,
+    "shares": 8,
+    "segments": 8,
+}
+FILING_STORE_DIR = "filings"
+FILING_STORE_MAX_BYTES = 2 * 1024 * 1024 * 1024
+EMBEDDED_DATA_JS = "../embedded_data.js"
+TABLES_INDEX_JS = "../tables_index.js"
+COMPANY_TICKERS_JS = "../company_tickers.js"
+# Output of `api.py build-shards`, served under /shards/.
+SHARDS_DIR = "../shards"
+# Upstream requests per second and burst size, per host group (a host matches
+# its group or any subdomain). SEC fair access allows 10/s across all sec.gov
+# hosts; 9/s with a burst of 1 keeps any one-second window at 10 or fewer.
+UPSTREAM_RATE_LIMITS = {"sec.gov": (9.0, 1)}
+RATE_LIMIT_DIR = "ratelimit"
+UPSTREAM_POOL_SIZE = 4
+UPSTREAM_IDLE_SECONDS = 30
+UPSTREAM_RETRIES = 3
+UPSTREAM_BACKOFF = 0.5
+UPSTREAM_MAX_BACKOFF = 10
+UPSTREAM_MAX_REDIRECTS = 5
+SINGLEFLIGHT_DIR = "inflight"
+SIMILARITY_THRESHOLD = 0.25
+DEFAULT_APPROX_RECALL = 0.9
+# POST /tables/similar/batch: queries per request, and results per query by default.
+SIMILAR_BATCH_MAX_QUERIES = 500
+SIMILAR_BATCH_DEFAULT_LIMIT = 10
+# Per-route latency histograms behind /metrics: hourly rows, bucket bounds
+# growing by METRICS_BUCKET_GROWTH (about 10% resolution), kept for a week.
+METRICS_DB = "metrics.db"
+METRICS_BUCKET_GROWTH = 1.1
+METRICS_RETENTION_HOURS = 7 * 24
+# Share of requests run under cProfile, dumped to PROFILE_DIR (0 = off;
+# `serve --profile-rate` sets it for the server).
+PROFILE_SAMPLE_RATE = 0.0
+PROFILE_DIR = "profiles"
+PROFILE_MAX_FILES = 200
+API_PREFIX = "/cgi-bin/api.py"
+
+# True when running under serve(); prebuilt in-memory indexes only pay off
+# in a process that answers more than one request.
+_persistent_process = False
+SERVER_HOST = "127.0.0.1"
+SERVER_PORT = 8000
+# Static files serve() exposes from the site root: these files, any top-level
+# *.js bundle, and files under these directories. Everything else (cgi-bin/,
+# its databases, dot-paths) is a 404.
+STATIC_FILES = frozenset(("index.html", "style.css"))
+STATIC_DIRS = ("tables_data/", "shards/")
+
+
+# ─────────────────────────────────────────────
+# Request context
+# ─────────────────────────────────────────────
+# Handlers never write to stdout directly. main() binds the current request's
+# environ, body stream and response writer to this thread, so the same handlers
+# serve a one-shot CGI process and a long-running threaded server.
+_request = threading.local()
+
+
+class CGIResponse:
+    """Writes a CGI response (header lines, blank line, body) to a byte stream."""
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.started = False
+
+    def start(self, status=200, headers=()):
+        headers = timing_headers(status, headers)
+        lines = []
+        if status != 200:
+            lines.append(f"Status: {status}")
+        lines.extend(f"{name}: {value}" for name, value in headers)
+        self.stream.write(("\n".join(lines) + "\n\n").encode("utf-8"))
+        self.started = True
+
+    def write(self, data):
+        self.stream.write(data)
+
+    def flush(self):
+        self.stream.flush()
+
+    def finish(self):
+        self.stream.flush()
+
+    def close(self):
+        """Flush and close stdout so the web server can complete the response."""
+        self.stream.flush()
+        try:
+            os.close(self.stream.fileno())
+        except (AttributeError, OSError, ValueError):
+            pass
+
+
+def request_environ():
+    """CGI-style environ of the request being handled on this thread."""
+    return getattr(_request, "environ", None) or os.environ
+
+
+def current_response():
+    response = getattr(_request, "response", None)
+    if response is None:
+        response = CGIResponse(sys.stdout.buffer)
+        _request.response = response
+    return response
+
+
+class AfterResponseQueue:
+    """
+    One request's after_response() tasks. Worker threads can outlive the
+    response (a dashboard section past its deadline), so once run() has
+    drained the queue, later tasks run inline on the thread that adds them.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.tasks = []
+        self.drained = False
+
+    def add(self, task):
+        """Queue task; False if the queue is already drained."""
+        with self.lock:
+            if self.drained:
+                return False
+            self.tasks.append(task)
+            return True
+
+    def clear(self):
+        with self.lock:
+            self.tasks.clear()
+
+    def run(self):
+        """Run queued tasks, including ones queued meanwhile, then mark the queue drained."""
+        while True:
+            with self.lock:
+                tasks, self.tasks = self.tasks, []
+                if not tasks:
+                    self.drained = True
+                    return
+            _run_tasks(tasks)
+
+
+def after_response(task):
+    """Run task() once the current response has been sent.
+
+    The server runs it on a background thread; a CGI process closes stdout
+    first and runs it before exiting. Tasks queued after that run right away.
+    """
+    tasks = getattr(_request, "after", None)
+    if tasks is None or not tasks.add(task):
+        task()
+
+
+def in_request_context(fn):
+    """Wrap fn to run on a worker thread with this request's after_response() queue and timer."""
+    tasks = getattr(_request, "after", None)
+    timer = getattr(_request, "timer", None)
+
+    def run(*args, **kwargs):
+        _request.after, _request.timer = tasks, timer
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _request.after = _request.timer = None
+    return run
+
+
+def _run_tasks(tasks):
+    for task in tasks:
+        try:
+            task()
+        except Exception as e:
+            print(f"after-response task failed: {e}", file=sys.stderr)
+
+
+# ─────────────────────────────────────────────
+# Request timing
+# ─────────────────────────────────────────────
+# span("edgar") etc. time named stages of the current request: upstream
+# calls, ticker loading, SQLite scans, JSON encoding. Their totals go out in
+# the Server-Timing header when the response starts, and main() adds every
+# request's latency and spans to hourly histograms in METRICS_DB (/metrics).
+# Spans on concurrent worker threads overlap, so they can sum past "total".
+METRICS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS request_latency (
+    hour INTEGER NOT NULL,
+    route TEXT NOT NULL,
+    bucket INTEGER NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (hour, route, bucket)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS request_totals (
+    hour INTEGER NOT NULL,
+    route TEXT NOT NULL,
+    requests INTEGER NOT NULL,
+    errors INTEGER NOT NULL,
+    total_ms REAL NOT NULL,
+    max_ms REAL NOT NULL,
+    PRIMARY KEY (hour, route)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS request_spans (
+    hour INTEGER NOT NULL,
+    route TEXT NOT NULL,
+    span TEXT NOT NULL,
+    requests INTEGER NOT NULL,
+    calls INTEGER NOT NULL,
+    total_ms REAL NOT NULL,
+    PRIMARY KEY (hour, route, span)
+) WITHOUT ROWID;
+"""
+
+
+class RequestTimer:
+    """Start time, status and per-span (seconds, calls) totals of one request."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.status = None
+        self.spans = {}
+        self.lock = threading.Lock()
+
+    def add(self, name, seconds):
+        with self.lock:
+            total = self.spans.get(name)
+            self.spans[name] = (seconds, 1) if total is None else (total[0] + seconds, total[1] + 1)
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    def header(self):
+        """Server-Timing value: each span's total, then the time to the response headers."""
+        with self.lock:
+            spans = sorted(self.spans.items())
+        parts = [f'{name};dur={secs * 1000:.1f}' + (f';desc="{calls} calls"' if calls > 1 else "")
+                 for name, (secs, calls) in spans]
+        parts.append(f"total;dur={self.elapsed() * 1000:.1f}")
+        return ", ".join(parts)
+
+
+@contextmanager
+def span(name):
+    """Add the time spent in the block to the current request's `name` span."""
+    timer = getattr(_request, "timer", None)
+    if timer is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timer.add(name, time.perf_counter() - started)
+
+
+def timed(name):
+    """Decorator: run the function inside span(name)."""
+    def wrap(fn):
+        @wraps(fn)
+        def run(*args, **kwargs):
+            with span(name):
+                return fn(*args, **kwargs)
+        return run
+    return wrap
+
+
+class StageClock:
+    """
+    Splits a loop's time into non-overlapping spans without a context manager
+    per step: lap(name) charges the time since the previous lap to `name`.
+    Generators call resume() after each yield so the consumer's time isn't
+    charged; flush() adds the totals to the request's timer.
+    """
+
+    def __init__(self):
+        self.timer = getattr(_request, "timer", None)
+        self.totals = {}
+        self.last = time.perf_counter()
+
+    def lap(self, name):
+        now = time.perf_counter()
+        self.totals[name] = self.totals.get(name, 0.0) + now - self.last
+        self.last = now
+
+    def resume(self):
+        self.last = time.perf_counter()
+
+    def flush(self):
+        if self.timer is not None:
+            for name, seconds in self.totals.items():
+                self.timer.add(name, seconds)
+        self.totals = {}
+
+
+def timing_headers(status, headers):
+    """headers plus Server-Timing for the current request; remembers status for the metrics."""
+    timer = getattr(_request, "timer", None)
+    if timer is None:
+        return headers
+    timer.status = status
+    return [*headers, ("Server-Timing", timer.header()), ("Timing-Allow-Origin", "*")]
+
+
+def metrics_route(method, path, matched=True):
+    """Histogram key for a request; unrouted paths share one key so they can't grow the table."""
+    if not matched:
+        return "(not found)"
+    if path.startswith("/shards/"):
+        path = "/shards/*"
+    return f"{method} {path}"
+
+
+def latency_bucket(ms):
+    """Histogram bucket for a latency: bucket i holds (GROWTH**(i-1), GROWTH**i] ms, bucket 0 up to 1 ms."""
+    return max(0, math.ceil(math.log(ms, METRICS_BUCKET_GROWTH))) if ms > 1 else 0
+
+
+def bucket_percentiles(counts, quantiles):
+    """Upper bounds (ms) of the buckets holding each quantile of a {bucket: count} histogram."""
+    total = sum(counts.values())
+    ordered = sorted(counts.items())
+    out = []
+    for q in quantiles:
+        rank, seen = q * total, 0
+        for bucket, count in ordered:
+            seen += count
+            if seen >= rank:
+                out.append(round(METRICS_BUCKET_GROWTH ** bucket, 1))
+                break
+    return out
+
+
+class MetricsStore:
+    """Hourly per-route latency histograms and span totals, shared across threads and CGI processes."""
+
+    def __init__(self, path):
+        self.path = path
+        self.local = threading.local()
+
+    def conn(self):
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(METRICS_SCHEMA)
+            self.local.conn = conn
+        return conn
+
+    def record(self, route, status, seconds, spans):
+        ms = seconds * 1000
+        hour = int(time.time() // 3600)
+        conn = self.conn()
+        with conn:
+            conn.execute(
+                "INSERT INTO request_latency (hour, route, bucket, count) VALUES (?, ?, ?, 1)"
+                " ON CONFLICT DO UPDATE SET count = count + 1", (hour, route, latency_bucket(ms)))
+            conn.execute(
+                "INSERT INTO request_totals (hour, route, requests, errors, total_ms, max_ms)"
+                " VALUES (?, ?, 1, ?, ?, ?) ON CONFLICT DO UPDATE SET requests = requests + 1,"
+                " errors = errors + excluded.errors, total_ms = total_ms + excluded.total_ms,"
+                " max_ms = max(max_ms, excluded.max_ms)", (hour, route, int(status >= 500), ms, ms))
+            conn.executemany(
+                "INSERT INTO request_spans (hour, route, span, requests, calls, total_ms) VALUES (?, ?, ?, 1, ?, ?)"
+                " ON CONFLICT DO UPDATE SET requests = requests + 1, calls = calls + excluded.calls,"
+                " total_ms = total_ms + excluded.total_ms",
+                [(hour, route, name, calls, secs * 1000) for name, (secs, calls) in spans.items()])
+            if random.random() < 0.01:
+                cutoff = hour - METRICS_RETENTION_HOURS
+                for table in ("request_latency", "request_totals", "request_spans"):
+                    conn.execute(f"DELETE FROM {table} WHERE hour < ?", (cutoff,))
+
+    def summary(self, hours, route=None):
+        """{route: {requests, errors, mean_ms, max_ms, p50_ms, p95_ms, p99_ms, spans}} over the last `hours`."""
+        since = int(time.time() // 3600) - hours + 1
+        where, args = "hour >= ?", [since]
+        if route:
+            where += " AND route = ?"
+            args.append(route)
+        conn = self.conn()
+        routes = {}
+        for name, requests, errors, total_ms, max_ms in conn.execute(
+                f"SELECT route, SUM(requests), SUM(errors), SUM(total_ms), MAX(max_ms) FROM request_totals"
+                f" WHERE {where} GROUP BY route ORDER BY route", args):
+            routes[name] = {"requests": requests, "errors": errors, "mean_ms": round(total_ms / requests, 1),
+                            "max_ms": round(max_ms, 1), "p50_ms": None, "p95_ms": None, "p99_ms": None,
+                            "spans": {}}
+        histograms = {}
+        for name, bucket, count in conn.execute(
+                f"SELECT route, bucket, SUM(count) FROM request_latency WHERE {where} GROUP BY route, bucket", args):
+            histograms.setdefault(name, {})[bucket] = count
+        for name, counts in histograms.items():
+            if name in routes:
+                routes[name]["p50_ms"], routes[name]["p95_ms"], routes[name]["p99_ms"] = (
+                    bucket_percentiles(counts, (0.5, 0.95, 0.99)))
+        for name, span_name, requests, calls, total_ms in conn.execute(
+                f"SELECT route, span, SUM(requests), SUM(calls), SUM(total_ms) FROM request_spans"
+                f" WHERE {where} GROUP BY route, span ORDER BY route, span", args):
+            if name in routes:
+                routes[name]["spans"][span_name] = {
+                    "requests": requests, "calls": calls,
+                    "mean_ms": round(total_ms / requests, 1),
+                    "share": round(total_ms / (routes[name]["mean_ms"] * routes[name]["requests"] or 1), 3),
+                }
+        return routes
+
+
+_metrics = MetricsStore(METRICS_DB)
+
+
+def record_request(route, timer):
+    """After-response task: add the finished request to the metrics store."""
+    try:
+        _metrics.record(route, timer.status or 200, timer.elapsed(), dict(timer.spans))
+    except sqlite3.Error as e:
+        print(f"metrics write failed: {e}", file=sys.stderr)
+
+
+def start_profile():
+    """A running cProfile.Profile for a PROFILE_SAMPLE_RATE share of requests, else None."""
+    if PROFILE_SAMPLE_RATE <= 0 or random.random() >= PROFILE_SAMPLE_RATE:
+        return None
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        # Python 3.12+ allows one active profiler per process.
+        return None
+    return profiler
+
+
+def dump_profile(profiler, route):
+    """Write a finished profile to PROFILE_DIR (pstats format), keeping the newest PROFILE_MAX_FILES."""
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    slug = re.sub(r"[^A-Za-z0-9]+", "_", route).strip("_") or "root"
+    stamp = datetime.datetime.now().strftime("%Y%m%d-%H%M%S-%f")
+    profiler.dump_stats(os.path.join(PROFILE_DIR, f"{stamp}-{slug}-{os.getpid()}.prof"))
+    files = sorted(os.path.join(PROFILE_DIR, f) for f in os.listdir(PROFILE_DIR) if f.endswith(".prof"))
+    for path in files[:-PROFILE_MAX_FILES]:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+# ─────────────────────────────────────────────
+# Upstream HTTP client
+# ─────────────────────────────────────────────
+# Every EDGAR and fiscal.ai call goes through _upstream: keep-alive
+# connections pooled per host, a token bucket per rate-limited host group
+# (state kept in a flock'd file so CGI processes and server threads share one
+# budget), and jittered retries on 429/503. Non-2xx responses still raise
+# urllib.error.HTTPError, so handlers don't change.
+UpstreamStats = namedtuple(
+    "UpstreamStats",
+    "requests connections_opened connections_reused retries limiter_waits limiter_wait_seconds",
+)
+
+
+class RateLimiter:
+    """Token bucket of `rate` tokens/s (capacity `burst`) shared through a lock file."""
+
+    def __init__(self, path, rate, burst=1):
+        self.path = path
+        self.rate = rate
+        self.burst = burst
+        self.lock = threading.Lock()
+        self.state = None  # in-process fallback when the file can't be used
+
+    def _take(self, state, now):
+        tokens, stamp = state or (self.burst, now)
+        tokens = min(self.burst, tokens + max(0.0, now - stamp) * self.rate) - 1
+        return (tokens, now), (-tokens / self.rate if tokens < 0 else 0.0)
+
+    def reserve(self):
+        """Take a token (possibly borrowed from the future); returns seconds to wait."""
+        now = time.time()
+        with self.lock:
+            if fcntl is not None:
+                try:
+                    return self._reserve_file(now)
+                except OSError as e:
+                    print(f"rate limiter file {self.path} unavailable: {e}", file=sys.stderr)
+            self.state, wait = self._take(self.state, now)
+            return wait
+
+    def _reserve_file(self, now):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            raw = os.pread(fd, 16, 0)
+            state, wait = self._take(struct.unpack("dd", raw) if len(raw) == 16 else None, now)
+            os.pwrite(fd, struct.pack("dd", *state), 0)
+            return wait
+        finally:
+            os.close(fd)  # releases the flock
+
+    def acquire(self):
+        """Block until a request may be sent; returns the seconds waited."""
+        wait = self.reserve()
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+
+class PooledResponse:
+    """A 2xx upstream response; hands its connection back to the pool on close()
+    once the body has been read to the end."""
+
+    def __init__(self, client, key, conn, resp):
+        self.client = client
+        self.key = key
+        self.conn = conn
+        self.resp = resp
+        self.status = resp.status
+        self.headers = resp.headers
+
+    def read(self, amt=None):
+        return self.resp.read(amt)
+
+    def close(self):
+        if self.conn is not None:
+            self.client._release(self.key, self.conn, self.resp)
+            self.conn = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class UpstreamClient:
+    """Pooled, rate-limited, retrying GET client for EDGAR and fiscal.ai."""
+
+    RETRY_STATUSES = (429, 503)
+    REDIRECT_STATUSES = (301, 302, 303, 307, 308)
+
+    def __init__(self, limits=UPSTREAM_RATE_LIMITS, state_dir=RATE_LIMIT_DIR):
+        self.lock = threading.Lock()
+        self.idle = {}  # (scheme, netloc) -> [(connection, released_at)]
+        self.limiters = {
+            group: RateLimiter(os.path.join(state_dir, f"{group}.bucket"), rate, burst)
+            for group, (rate, burst) in limits.items()
+        }
+        self.counts = dict.fromkeys(UpstreamStats._fields, 0)
+
+    def stats(self):
+        with self.lock:
+            return UpstreamStats(**self.counts)
+
+    def _count(self, name, amount=1):
+        with self.lock:
+            self.counts[name] += amount
+
+    def limiter(self, host):
+        for group, limiter in self.limiters.items():
+            if host == group or host.endswith("." + group):
+                return limiter
+        return None
+
+    def _connection(self, key, timeout):
+        """An idle pooled connection for key, or a new one; returns (conn, reused)."""
+        now = time.monotonic()
+        with self.lock:
+            idle = self.idle.get(key, [])
+            while idle:
+                conn, released_at = idle.pop()
+                if now - released_at < UPSTREAM_IDLE_SECONDS:
+                    self.counts["connections_reused"] += 1
+                    conn.timeout = timeout
+                    if conn.sock is not None:
+                        conn.sock.settimeout(timeout)
+                    return conn, True
+                conn.close()
+            self.counts["connections_opened"] += 1
+        scheme, netloc = key
+        cls = http.client.HTTPSConnection if scheme == "https" else http.client.HTTPConnection
+        return cls(netloc, timeout=timeout), False
+
+    def _release(self, key, conn, resp):
+        if not resp.isclosed() or resp.will_close:
+            conn.close()
+            return
+        with self.lock:
+            idle = self.idle.setdefault(key, [])
+            if len(idle) < UPSTREAM_POOL_SIZE:
+                idle.append((conn, time.monotonic()))
+                return
+        conn.close()
+
+    def _send(self, parts, headers, timeout):
+        """One request/response exchange; a reused connection the server has
+        since closed is retried once on a fresh one."""
+        key = (parts.scheme, parts.netloc)
+        target = urllib.parse.urlunsplit(("", "", parts.path or "/", parts.query, ""))
+        while True:
+            conn, reused = self._connection(key, timeout)
+            try:
+                conn.request("GET", target, headers={"Host": parts.netloc, **headers})
+                return conn, conn.getresponse()
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError) as e:
+                conn.close()
+                if not reused:
+                    raise urllib.error.URLError(e) from e
+            except (OSError, http.client.HTTPException) as e:
+                conn.close()
+                raise urllib.error.URLError(e) from e
+
+    @staticmethod
+    def _retry_delay(resp, attempt):
+        """Retry-After when the upstream gives one, else full-jitter exponential backoff."""
+        retry_after = resp.headers.get("Retry-After", "")
+        if retry_after.isdigit():
+            return min(int(retry_after), UPSTREAM_MAX_BACKOFF)
+        return random.uniform(0, min(UPSTREAM_MAX_BACKOFF, UPSTREAM_BACKOFF * 2 ** attempt))
+
+    def get(self, url, headers=None, timeout=20):
+        """
+        GET url and return a PooledResponse for a 2xx answer (redirects followed).
+        Raises urllib.error.HTTPError for any other status, URLError on network errors.
+        """
+        headers = headers or {}
+        for _ in range(UPSTREAM_MAX_REDIRECTS + 1):
+            parts = urllib.parse.urlsplit(url)
+            key = (parts.scheme, parts.netloc)
+            limiter = self.limiter(parts.hostname or "")
+            for attempt in range(UPSTREAM_RETRIES + 1):
+                if limiter is not None:
+                    waited = limiter.acquire()
+                    if waited:
+                        self._count("limiter_waits")
+                        self._count("limiter_wait_seconds", waited)
+                self._count("requests")
+                conn, resp = self._send(parts, headers, timeout)
+                if resp.status not in self.RETRY_STATUSES or attempt == UPSTREAM_RETRIES:
+                    break
+                delay = self._retry_delay(resp, attempt)
+                resp.read()
+                self._release(key, conn, resp)
+                self._count("retries")
+                time.sleep(delay)
+            location = resp.headers.get("Location")
+            if resp.status in self.REDIRECT_STATUSES and location:
+                resp.read()
+                self._release(key, conn, resp)
+                url = urllib.parse.urljoin(url, location)
+                continue
+            if 200 <= resp.status < 300:
+                return PooledResponse(self, key, conn, resp)
+            body = resp.read()
+            self._release(key, conn, resp)
+            raise urllib.error.HTTPError(url, resp.status, resp.reason, resp.headers, io.BytesIO(body))
+        raise urllib.error.HTTPError(url, resp.status, "too many redirects", resp.headers, io.BytesIO(b""))
+
+
+_upstream = UpstreamClient()
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Runs one fn() per key at a time for every concurrent caller.
+
+    Threads of this process wait on the first caller's result. Across
+    processes, a byte-range lock on one shared file (at an offset derived from
+    the key) serializes leaders: a process that finds the key locked waits,
+    then either picks up the result the leader published (share=True, bytes
+    only) or runs fn() itself, which should by then hit whatever store the
+    leader filled.
+    """
+
+    RESULT_TTL = 60
+
+    def __init__(self, directory=SINGLEFLIGHT_DIR):
+        self.directory = directory
+        self.lock = threading.Lock()
+        self.calls = {}
+        self.fd = None
+        self.counts = {"leaders": 0, "coalesced": 0, "coalesced_across_processes": 0}
+
+    def stats(self):
+        with self.lock:
+            return dict(self.counts)
+
+    def do(self, key, fn, share=False):
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = self.calls[key] = _Call()
+                self.counts["leaders"] += 1
+            else:
+                self.counts["coalesced"] += 1
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+        try:
+            call.result = self._across_processes(key, fn, share)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self.lock:
+                del self.calls[key]
+            call.done.set()
+
+    def _lock_file(self):
+        # One descriptor for the life of the process: POSIX record locks are
+        # per process, and closing any descriptor of the file would drop them all.
+        if self.fd is None:
+            os.makedirs(self.directory, exist_ok=True)
+            self.fd = os.open(os.path.join(self.directory, "inflight.lock"), os.O_RDWR | os.O_CREAT, 0o644)
+        return self.fd
+
+    def _across_processes(self, key, fn, share):
+        if fcntl is None:
+            return fn()
+        digest = hashlib.sha1(key.encode("utf-8")).hexdigest()
+        offset = int(digest[:8], 16)
+        try:
+            with self.lock:
+                fd = self._lock_file()
+        except OSError as e:
+            print(f"single-flight lock file unavailable: {e}", file=sys.stderr)
+            return fn()
+        started = time.time() - 1  # file mtimes come from a coarser clock
+        try:
+            fcntl.lockf(fd, fcntl.LOCK_EX | fcntl.LOCK_NB, 1, offset)
+        except OSError:
+            fcntl.lockf(fd, fcntl.LOCK_EX, 1, offset)
+            with self.lock:
+                self.counts["coalesced_across_processes"] += 1
+            if share:
+                result = self._read_result(digest, started)
+                if result is not None:
+                    fcntl.lockf(fd, fcntl.LOCK_UN, 1, offset)
+                    return result
+        try:
+            result = fn()
+            if share:
+                self._write_result(digest, result)
+            return result
+        finally:
+            fcntl.lockf(fd, fcntl.LOCK_UN, 1, offset)
+
+    def _result_path(self, digest):
+        return os.path.join(self.directory, digest + ".result")
+
+    def _read_result(self, digest, since):
+        """The result published for digest after `since`, or None."""
+        try:
+            with open(self._result_path(digest), "rb") as f:
+                if os.fstat(f.fileno()).st_mtime < since:
+                    return None
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def _write_result(self, digest, data):
+        """Publish a result for waiting processes and sweep expired ones."""
+        path = self._result_path(digest)
+        try:
+            tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+            cutoff = time.time() - self.RESULT_TTL
+            for entry in os.scandir(self.directory):
+                if entry.name.endswith(".result") and entry.stat().st_mtime < cutoff:
+                    os.remove(entry.path)
+        except OSError as e:
+            print(f"single-flight result write failed: {e}", file=sys.stderr)
+
+
+_single_flight = SingleFlight()
 
 
 # ─────────────────────────────────────────────
 # Helpers
 # ─────────────────────────────────────────────
+def send_body(body, status=200, headers=()):
+    """Write response headers + a complete byte body for the current request."""
+    response = current_response()
+    response.start(status, [
+        *headers,
+        ("Access-Control-Allow-Origin", "*"),
+        ("Content-Length", str(len(body))),
+    ])
+    response.write(body)
+
+
+def send_stream(chunks, content_type, status=200):
+    """Write response headers, then each byte chunk as soon as it is produced."""
+    response = current_response()
+    response.start(status, [("Content-Type", content_type), ("Access-Control-Allow-Origin", "*")])
+    for chunk in chunks:
+        response.write(chunk)
+        response.flush()
+
+
 def send_json(data, status=200):
-    """Write CGI response headers + JSON body to stdout."""
-    if status != 200:
-        print(f"Status: {status}")
-    print("Content-Type: application/json")
-    print("Access-Control-Allow-Origin: *")
-    print()
-    print(json.dumps(data))
+    """Write response headers + JSON body for the current request."""
+    with span("json"):
+        body = (json.dumps(data) + "\n").encode("utf-8")
+    send_body(body, status, [("Content-Type", "application/json")])
 
 
 def send_error(message, status=500):
@@ -72,43 +1001,249 @@ def send_error(message, status=500):
 
 
 def fiscal_get(path, params=None):
-    """GET request to fiscal.ai v2 API."""
+    """GET request to fiscal.ai v2 API, through the response cache."""
+    return json.loads(fiscal_cached(path, params).body)
+
+
+@timed("fiscal")
+def fiscal_fetch(path, params=None, etag=None):
+    """Live GET to fiscal.ai; returns (raw body, ETag), or (None, etag) on a 304."""
     qs = urllib.parse.urlencode(params) if params else ""
     url = f"{FISCAL_BASE}{path}?apiKey={FISCAL_API_KEY}"
     if qs:
         url += f"&{qs}"
-    req = urllib.request.Request(url, headers={"User-Agent": "WamSEC/1.0"})
-    with urllib.request.urlopen(req, timeout=15) as resp:
-        return json.loads(resp.read().decode("utf-8"))
+    headers = {"User-Agent": "WamSEC/1.0"}
+    if etag:
+        headers["If-None-Match"] = etag
+    try:
+        with _upstream.get(url, headers, timeout=15) as resp:
+            return resp.read(), resp.headers.get("ETag")
+    except urllib.error.HTTPError as e:
+        if e.code == 304 and etag:
+            return None, etag
+        raise
+
 
+def send_fiscal(path, params=None):
+    """Proxy a fiscal.ai endpoint from the cache, honouring If-None-Match."""
+    send_cached(fiscal_cached(path, params))
 
+
+@timed("edgar")
 def edgar_get(url):
     """GET request to SEC EDGAR (data.sec.gov or www.sec.gov)."""
-    req = urllib.request.Request(
+    with edgar_open(url) as resp:
+        return resp.read()
+
+
+def edgar_open(url, headers=None):
+    """Open a streaming GET to SEC EDGAR; the caller reads and closes the response."""
+    return _upstream.get(
         url,
-        headers={
+        {
             "User-Agent": "WamSEC/1.0 (support@wamsec.com)",
             "Accept": "application/json, text/html, */*",
+            **(headers or {}),
         },
+        timeout=20,
     )
-    with urllib.request.urlopen(req, timeout=20) as resp:
-        return resp.read()
 
 
-def load_company_tickers():
-    """Load company tickers JSON, using local cache if available."""
-    # Try local cache first
-    if os.path.exists(COMPANY_TICKERS_CACHE):
-        with open(COMPANY_TICKERS_CACHE, "r") as f:
+class TickerMap:
+    """O(1) ticker -> zero-padded CIK and CIK -> company name / primary ticker,
+    built once per tickers dict on the first lookup (routes that only need
+    the raw dict never pay for it)."""
+
+    def __init__(self, tickers_data):
+        self.data = tickers_data
+        self.lock = threading.Lock()
+        self.maps = None  # (ciks, names, tickers)
+
+    def _build(self):
+        with self.lock:
+            if self.maps is None:
+                ciks, names, tickers = {}, {}, {}
+                for entry in self.data.values():
+                    cik = str(entry.get("cik_str", entry.get("cik", ""))).zfill(10)
+                    ticker = str(entry.get("ticker", "")).upper()
+                    # First entry wins, as with the old linear scan.
+                    ciks.setdefault(ticker, cik)
+                    names.setdefault(cik, entry.get("title", ""))
+                    tickers.setdefault(cik, ticker)
+                self.maps = (ciks, names, tickers)
+        return self.maps
+
+    @property
+    def ciks(self):
+        return (self.maps or self._build())[0]
+
+    @property
+    def names(self):
+        return (self.maps or self._build())[1]
+
+    @property
+    def tickers(self):
+        return (self.maps or self._build())[2]
+
+    def cik(self, ticker):
+        return self.ciks.get(ticker.upper())
+
+    def name(self, cik):
+        return self.names.get(str(cik).zfill(10))
+
+    def ticker(self, cik):
+        return self.tickers.get(str(cik).zfill(10))
+
+
+# (tickers dict, TickerMap, (st_ino, st_mtime_ns) of the cache file it came from)
+_company_tickers = None
+_company_tickers_lock = threading.Lock()
+_company_tickers_next_check = 0.0
+
+
+def _read_tickers_meta():
+    try:
+        with open(COMPANY_TICKERS_META, "r") as f:
             return json.load(f)
-    # Fetch from SEC and cache
-    data_bytes = edgar_get(COMPANY_TICKERS_URL)
-    data = json.loads(data_bytes.decode("utf-8"))
-    with open(COMPANY_TICKERS_CACHE, "w") as f:
-        json.dump(data, f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_atomic(path, text):
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp, "w") as f:
+        f.write(text)
+    os.replace(tmp, path)
+
+
+def _file_key(path):
+    st = os.stat(path)
+    return st.st_ino, st.st_mtime_ns
+
+
+def load_company_tickers():
+    """Load company tickers JSON, using local cache if available.
+
+    The parsed dict (and its TickerMap) is kept in memory and swapped as a
+    whole when the cache file is replaced, so readers never see a partial
+    update. Once the copy is COMPANY_TICKERS_REFRESH seconds old, a
+    conditional GET refreshes it after the response. The cache file's mtime
+    is the last check (a 304 touches it), so the meta file is only read
+    when a refresh looks due.
+    """
+    global _company_tickers, _company_tickers_next_check
+    cached = _company_tickers
+    try:
+        key = _file_key(COMPANY_TICKERS_CACHE)
+    except FileNotFoundError:
+        key = None
+    if cached is None or (key is not None and cached[2] != key):
+        with _company_tickers_lock:
+            cached = _company_tickers
+            if cached is None or (key is not None and cached[2] != key):
+                with span("tickers"):
+                    if key is not None:
+                        with open(COMPANY_TICKERS_CACHE, "r") as f:
+                            data = json.load(f)
+                    else:
+                        # Fetch from SEC and cache
+                        data = _fetch_company_tickers()
+                        key = _file_key(COMPANY_TICKERS_CACHE)
+                    cached = _company_tickers = (data, TickerMap(data), key)
+    if time.time() >= _company_tickers_next_check:
+        checked_at = cached[2][1] / 1e9
+        if time.time() >= checked_at + COMPANY_TICKERS_REFRESH:
+            checked_at = max(checked_at, _read_tickers_meta().get("checked_at", 0))
+        _company_tickers_next_check = checked_at + COMPANY_TICKERS_REFRESH
+        if time.time() >= _company_tickers_next_check:
+            _company_tickers_next_check = time.time() + 60  # don't queue a refresh per request
+            after_response(refresh_company_tickers)
+    return cached[0]
+
+
+def company_ticker_map():
+    """TickerMap for the currently loaded company tickers."""
+    load_company_tickers()
+    return _company_tickers[1]
+
+
+def _fetch_company_tickers(meta=None):
+    """GET company_tickers.json (conditionally, given the last meta) and replace
+    the cache file atomically. Returns the parsed dict, or None if unchanged."""
+    meta = meta or {}
+    headers = {}
+    if meta.get("last_modified"):
+        headers["If-Modified-Since"] = meta["last_modified"]
+    if meta.get("etag"):
+        headers["If-None-Match"] = meta["etag"]
+    try:
+        with edgar_open(COMPANY_TICKERS_URL, headers) as resp:
+            raw = resp.read()
+            last_modified = resp.headers.get("Last-Modified")
+            etag = resp.headers.get("ETag")
+    except urllib.error.HTTPError as e:
+        if e.code != 304 or not headers:
+            raise
+        # load_company_tickers() takes the cache file's mtime as the last check.
+        try:
+            os.utime(COMPANY_TICKERS_CACHE)
+        except OSError:
+            pass
+        _write_atomic(COMPANY_TICKERS_META, json.dumps({**meta, "checked_at": time.time()}))
+        return None
+    data = json.loads(raw.decode("utf-8"))
+    if not isinstance(data, dict) or not data:
+        raise ValueError("company_tickers.json: unexpected payload")
+    _write_atomic(COMPANY_TICKERS_CACHE, json.dumps(data))
+    _write_atomic(COMPANY_TICKERS_META, json.dumps(
+        {"last_modified": last_modified, "etag": etag, "checked_at": time.time()}
+    ))
     return data
 
 
+def refresh_company_tickers():
+    """Refresh the tickers cache if it is due; one process at a time does the fetch."""
+    def refresh():
+        meta = _read_tickers_meta()
+        # Another process may have refreshed while this one waited.
+        if time.time() < meta.get("checked_at", 0) + COMPANY_TICKERS_REFRESH:
+            return
+        _fetch_company_tickers(meta)
+
+    _single_flight.do("company-tickers-refresh", refresh)
+    # The next load_company_tickers() sees the new file and swaps it in.
+
+
+_db_local = threading.local()
+
+
+def _thread_db(path, slot):
+    """Per-thread connection to path, reused across requests.
+
+    Reopened if the file is replaced on disk (e.g. by a rebuild).
+    """
+    st = os.stat(path)
+    cached = getattr(_db_local, slot, None)
+    if cached is not None and cached[0] == (st.st_dev, st.st_ino):
+        return cached[1]
+    if cached is not None:
+        cached[1].close()
+    conn = sqlite3.connect(path)
+    conn.row_factory = sqlite3.Row
+    setattr(_db_local, slot, ((st.st_dev, st.st_ino), conn))
+    return conn
+
+
+def tables_db():
+    """Per-thread connection to TABLES_DB."""
+    return _thread_db(TABLES_DB, "tables")
+
+
+def facts_db():
+    """Per-thread connection to FACTS_DB."""
+    return _thread_db(FACTS_DB, "facts")
+
+
 def levenshtein(a, b):
     """Simple Levenshtein distance for fuzzy matching."""
     m, n = len(a), len(b)
@@ -130,45 +1265,2994 @@ def levenshtein(a, b):
     return dp[m][n]
 
 
-def parse_qs(qs):
-    """Parse QUERY_STRING into a dict (first value for each key)."""
-    parsed = urllib.parse.parse_qs(qs or "")
-    return {k: v[0] for k, v in parsed.items()}
+def levenshtein_within(a, b, limit):
+    """
+    Levenshtein distance if it is <= limit, otherwise limit + 1.
 
+    Keeps two rolling rows and only fills the diagonal band |i - j| <= limit
+    (Ukkonen), returning early on a length gap wider than limit or once a
+    whole band row exceeds it.
+    """
+    m, n = len(a), len(b)
+    over = limit + 1
+    if abs(m - n) > limit:
+        return over
+    if m > n:
+        a, b, m, n = b, a, n, m
+    if m == 0:
+        return n
+    prev = [j if j <= limit else over for j in range(n + 1)]
+    cur = [over] * (n + 1)
+    for i in range(1, m + 1):
+        lo = max(1, i - limit)
+        hi = min(n, i + limit)
+        cur[lo - 1] = i if lo == 1 else over
+        row_min = cur[lo - 1]
+        ai = a[i - 1]
+        for j in range(lo, hi + 1):
+            v = prev[j - 1]
+            if ai != b[j - 1]:
+                if prev[j] < v:
+                    v = prev[j]
+                if cur[j - 1] < v:
+                    v = cur[j - 1]
+                v += 1
+                if v > over:
+                    v = over
+            cur[j] = v
+            if v < row_min:
+                row_min = v
+        if hi < n:
+            cur[hi + 1] = over
+        if row_min > limit:
+            return over
+        prev, cur = cur, prev
+    return prev[n]
 
-def read_body():
-    """Read POST body from stdin using CONTENT_LENGTH."""
+
+# ─────────────────────────────────────────────
+# Response cache
+# ─────────────────────────────────────────────
+# cache.db holds upstream responses for every process that serves this
+# directory, so a fresh CGI process still gets hits. Entries are stored as the
+# exact bytes we send, with a strong ETag over them; accessed_at drives LRU
+# eviction once the file passes CACHE_MAX_BYTES. Triggers keep the running
+# total of `size` in cache_size, so put() never has to SUM the table.
+CACHE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    body BLOB NOT NULL,
+    etag TEXT NOT NULL,
+    upstream_etag TEXT,
+    expires_at REAL NOT NULL,
+    accessed_at REAL NOT NULL,
+    refresh_at REAL NOT NULL DEFAULT 0,
+    size INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS responses_accessed ON responses(accessed_at);
+CREATE TABLE IF NOT EXISTS cache_size (id INTEGER PRIMARY KEY CHECK (id = 1), total INTEGER NOT NULL);
+CREATE TRIGGER IF NOT EXISTS responses_size_insert AFTER INSERT ON responses BEGIN
+    UPDATE cache_size SET total = total + new.size;
+END;
+CREATE TRIGGER IF NOT EXISTS responses_size_delete AFTER DELETE ON responses BEGIN
+    UPDATE cache_size SET total = total - old.size;
+END;
+CREATE TRIGGER IF NOT EXISTS responses_size_update AFTER UPDATE OF size ON responses BEGIN
+    UPDATE cache_size SET total = total + new.size - old.size;
+END;
+INSERT INTO cache_size (id, total)
+    SELECT 1, COALESCE(SUM(size), 0) FROM responses WHERE NOT EXISTS (SELECT 1 FROM cache_size);
+"""
+
+CacheEntry = namedtuple("CacheEntry", "key body etag upstream_etag expires_at")
+
+
+def cache_entry(key, body, expires_at, upstream_etag=None):
+    return CacheEntry(key, body, f'"{hashlib.sha1(body).hexdigest()[:20]}"', upstream_etag, expires_at)
+
+
+class ResponseCache:
+    """SQLite response store shared across threads and CGI processes."""
+
+    # Like FilingStore: a hit only rewrites accessed_at once it is this stale.
+    TOUCH_INTERVAL = 600
+
+    def __init__(self, path, max_bytes=CACHE_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.local = threading.local()
+
+    def conn(self):
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(CACHE_SCHEMA)
+            self.local.conn = conn
+        return conn
+
+    @timed("cache")
+    def get(self, key):
+        conn = self.conn()
+        row = conn.execute(
+            "SELECT key, body, etag, upstream_etag, expires_at, accessed_at FROM responses WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        now = time.time()
+        if now - row[-1] > self.TOUCH_INTERVAL:
+            conn.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+        return CacheEntry(*row[:-1])
+
+    def put(self, key, body, ttl, upstream_etag=None):
+        now = time.time()
+        entry = cache_entry(key, body, now + ttl, upstream_etag)
+        conn = self.conn()
+        # An upsert rather than INSERT OR REPLACE: REPLACE's implicit delete
+        # doesn't fire the delete trigger, which would inflate cache_size.
+        conn.execute(
+            "INSERT INTO responses"
+            " (key, body, etag, upstream_etag, expires_at, accessed_at, refresh_at, size)"
+            " VALUES (?, ?, ?, ?, ?, ?, 0, ?)"
+            " ON CONFLICT(key) DO UPDATE SET body = excluded.body, etag = excluded.etag,"
+            " upstream_etag = excluded.upstream_etag, expires_at = excluded.expires_at,"
+            " accessed_at = excluded.accessed_at, refresh_at = 0, size = excluded.size",
+            (key, body, entry.etag, upstream_etag, entry.expires_at, now, len(body)),
+        )
+        self.evict()
+        return entry
+
+    def extend(self, entry, ttl):
+        """Mark an entry fresh again after the upstream confirmed it unchanged."""
+        expires_at = time.time() + ttl
+        self.conn().execute(
+            "UPDATE responses SET expires_at = ?, refresh_at = 0 WHERE key = ?", (expires_at, entry.key)
+        )
+        return entry._replace(expires_at=expires_at)
+
+    def claim_refresh(self, key, lease=60):
+        """True for exactly one caller per `lease` seconds, across processes."""
+        now = time.time()
+        cur = self.conn().execute(
+            "UPDATE responses SET refresh_at = ? WHERE key = ? AND refresh_at < ?", (now + lease, key, now)
+        )
+        return cur.rowcount == 1
+
+    def evict(self):
+        """Drop least recently used entries until the cache is under 90% of max_bytes."""
+        conn = self.conn()
+        total = conn.execute("SELECT total FROM cache_size").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        target = self.max_bytes * 0.9
+        for key, size in conn.execute("SELECT key, size FROM responses ORDER BY accessed_at").fetchall():
+            if total <= target:
+                break
+            conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            total -= size
+
+
+_response_cache = ResponseCache(CACHE_DB)
+
+
+def fiscal_cached(path, params=None):
+    """
+    fiscal.ai response as a CacheEntry.
+
+    Fresh entries are returned as is. Stale ones (up to FISCAL_STALE_SECONDS
+    past their TTL) are returned immediately and refreshed after the response;
+    the same window covers upstream failures. Anything older is fetched live.
+    A cache.db that cannot be opened just means every call goes upstream.
+    """
+    key = path + "?" + urllib.parse.urlencode(sorted((params or {}).items()))
+    ttl = FISCAL_CACHE_TTL.get(path, FISCAL_DEFAULT_TTL)
     try:
-        content_length = int(os.environ.get("CONTENT_LENGTH", 0))
-    except (ValueError, TypeError):
-        content_length = 0
-    if content_length > 0:
-        return sys.stdin.read(content_length)
-    return ""
+        entry = _response_cache.get(key)
+    except sqlite3.Error:
+        raw, _ = fiscal_fetch(path, params)
+        return cache_entry(key, _json_body(raw), time.time())
+    now = time.time()
+    if entry is not None and now < entry.expires_at:
+        return entry
+    if entry is not None and now < entry.expires_at + FISCAL_STALE_SECONDS:
+        if _response_cache.claim_refresh(key):
+            after_response(partial(_refresh_fiscal, path, params, key, ttl, entry))
+        return entry
+    try:
+        return _refresh_fiscal(path, params, key, ttl, entry)
+    except Exception:
+        if entry is not None:
+            return entry
+        raise
+
+
+def _refresh_fiscal(path, params, key, ttl, entry=None):
+    raw, upstream_etag = fiscal_fetch(path, params, entry and entry.upstream_etag)
+    try:
+        if raw is None:
+            return _response_cache.extend(entry, ttl)
+        return _response_cache.put(key, _json_body(raw), ttl, upstream_etag)
+    except sqlite3.Error:
+        # A locked or read-only cache.db must not fail a fetch that worked.
+        if raw is None:
+            return entry._replace(expires_at=time.time() + ttl)
+        return cache_entry(key, _json_body(raw), time.time() + ttl, upstream_etag)
+
+
+def _json_body(raw):
+    """Re-serialize an upstream JSON body the way send_json() would."""
+    return (json.dumps(json.loads(raw.decode("utf-8"))) + "\n").encode("utf-8")
+
+
+def efts_query(q, forms, start):
+    """Normalized (q, forms, start): whitespace collapsed, forms upper-cased, de-duplicated and sorted."""
+    q = " ".join(str(q).split())
+    forms = ",".join(sorted({f.strip().upper() for f in str(forms).split(",") if f.strip()}))
+    return q, forms, int(start)
+
+
+def efts_search(q, forms="", start=0):
+    """
+    EDGAR full-text search results as a CacheEntry, cached for EFTS_CACHE_TTL
+    under the normalized query so repeat and back/forward paging skip EFTS.
+    """
+    q, forms, start = efts_query(q, forms, start)
+    params = urllib.parse.urlencode({k: v for k, v in {"q": q, "forms": forms, "start": str(start)}.items() if v})
+    key = "efts:" + params
+    try:
+        entry = _response_cache.get(key)
+    except sqlite3.Error:
+        entry = None
+    if entry is not None and time.time() < entry.expires_at:
+        return entry
+    raw = edgar_get_coalesced(f"https://efts.sec.gov/LATEST/search-index?{params}")
+    try:
+        return _response_cache.put(key, _json_body(raw), EFTS_CACHE_TTL)
+    except sqlite3.Error:
+        return cache_entry(key, _json_body(raw), time.time() + EFTS_CACHE_TTL)
+
+
+def prefetch_efts_page(q, forms, start):
+    """Warm the cache with a page of results (run after the response)."""
+    efts_search(q, forms, start)
+
+
+def efts_total(entry):
+    """hits.total.value of a cached EFTS response."""
+    return ((json.loads(entry.body).get("hits") or {}).get("total") or {}).get("value", 0)
+
+
+def etag_matches(etag):
+    """True if the request's If-None-Match covers etag."""
+    match = request_environ().get("HTTP_IF_NONE_MATCH", "")
+    return etag in (t.strip().removeprefix("W/") for t in match.split(",")) or match.strip() == "*"
+
+
+def send_cached(entry, stale=FISCAL_STALE_SECONDS):
+    """Send a cached JSON body with ETag/Cache-Control, or 304 if the client has it."""
+    remaining = max(0, int(entry.expires_at - time.time()))
+    cache_control = f"public, max-age={remaining}"
+    if stale:
+        cache_control += f", stale-while-revalidate={stale}"
+    headers = [("ETag", entry.etag), ("Cache-Control", cache_control)]
+    if etag_matches(entry.etag):
+        current_response().start(304, [*headers, ("Access-Control-Allow-Origin", "*")])
+        return
+    send_body(entry.body, 200, [("Content-Type", "application/json"), *headers])
+
+
+# ─────────────────────────────────────────────
+# Filing store
+# ─────────────────────────────────────────────
+# Documents under an accession number never change, so /edgar/document keeps
+# its final gzip bytes forever in FILING_STORE_DIR/<2 hex>/<sha256>.gz. The
+# digest covers FILING_TRANSFORM_VERSION, so changing the strip/rewrite
+# output retires old entries. mtime doubles as the LRU clock. Brotli/zstd
+# re-encodings for the raw response mode sit next to the .gz file.
+FILING_TRANSFORM_VERSION = 1
+FILING_STORE_SUFFIXES = (".gz", ".br", ".zst")
+
+
+class FilingStore:
+    """Content-addressed store of processed filings, size-capped with LRU eviction."""
+
+    # Don't rewrite mtime on every hit; an hour is plenty of LRU resolution.
+    TOUCH_INTERVAL = 3600
+    # put() keeps a running byte total in SIZE_FILE so evict() only walks the
+    # tree when the store is over its cap, or to resync the total once a day.
+    SIZE_FILE = "size"
+    RESYNC_INTERVAL = 86400
+
+    def __init__(self, root, max_bytes=FILING_STORE_MAX_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def key(cik, accession, filename):
+        ident = f"v{FILING_TRANSFORM_VERSION}/{str(cik).lstrip('0')}/{accession.replace('-', '')}/{filename}"
+        return hashlib.sha256(ident.encode("utf-8")).hexdigest()
+
+    def path(self, key, suffix=".gz"):
+        return os.path.join(self.root, key[:2], key + suffix)
+
+    def get(self, key, suffix=".gz"):
+        """Stored bytes for key, or None."""
+        path = self.path(key, suffix)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+                mtime = os.fstat(f.fileno()).st_mtime
+        except FileNotFoundError:
+            return None
+        if time.time() - mtime > self.TOUCH_INTERVAL:
+            try:
+                os.utime(path)
+            except OSError:
+                pass
+        return data
+
+    def put(self, key, data, suffix=".gz"):
+        path = self.path(key, suffix)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        try:
+            replaced = os.path.getsize(path)
+        except OSError:
+            replaced = 0
+        os.replace(tmp, path)
+        try:
+            with self._size_state() as state:
+                if state[0] is not None:
+                    state[0] += len(data) - replaced
+        except OSError as e:
+            print(f"filing store size file unavailable: {e}", file=sys.stderr)
+
+    @contextmanager
+    def _size_state(self):
+        """
+        Yield [total bytes or None, time of the last full walk] from SIZE_FILE,
+        held under an exclusive lock, and write it back on exit.
+        """
+        os.makedirs(self.root, exist_ok=True)
+        with self.lock:
+            fd = os.open(os.path.join(self.root, self.SIZE_FILE), os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                if fcntl is not None:
+                    fcntl.flock(fd, fcntl.LOCK_EX)
+                raw = os.pread(fd, 16, 0)
+                state = list(struct.unpack("qd", raw)) if len(raw) == 16 else [None, 0.0]
+                yield state
+                if state[0] is not None:
+                    os.pwrite(fd, struct.pack("qd", max(0, state[0]), state[1]), 0)
+            finally:
+                os.close(fd)  # releases the flock
+
+    def evict(self):
+        """Delete least recently used files until the store is under 90% of max_bytes."""
+        try:
+            with self._size_state() as state:
+                total, walked_at = state
+                if total is not None and total <= self.max_bytes and time.time() - walked_at < self.RESYNC_INTERVAL:
+                    return 0
+                removed, state[0] = self._evict_walk()
+                state[1] = time.time()
+                return removed
+        except OSError as e:
+            print(f"filing store size file unavailable: {e}", file=sys.stderr)
+            return self._evict_walk()[0]
+
+    def _evict_walk(self):
+        """Sum the store by walking it and evict if over the cap; returns (removed, total)."""
+        files = []
+        total = 0
+        for dirpath, _, names in os.walk(self.root):
+            for name in names:
+                if not name.endswith(FILING_STORE_SUFFIXES):
+                    continue
+                path = os.path.join(dirpath, name)
+                try:
+                    st = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                files.append((st.st_mtime, st.st_size, path))
+                total += st.st_size
+        if total <= self.max_bytes:
+            return 0, total
+        removed = 0
+        for _, size, path in sorted(files):
+            if total <= self.max_bytes * 0.9:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            removed += 1
+        return removed, total
+
+
+_filing_store = FilingStore(FILING_STORE_DIR)
+
+
+# One tokenizer for /edgar/document: inline XBRL open and close tags (dropped,
+# content kept) and relative href/src values (made absolute). This replaces
+# four full-document passes: open tags, close tags, <ix:header> blocks (which
+# could never match once every ix tag was gone) and the URL rewrite.
+_IX_OPEN_TAG = re.compile(r"<ix:[^>]+>", re.IGNORECASE)
+_IX_CLOSE_TAG = re.compile(r"</ix:[^>]+>", re.IGNORECASE)
+# Written around a leading [<hs] class (instead of an alternation) so the
+# regex engine can skip ahead quickly; [iIİı] is what re.IGNORECASE matches for "i".
+_FILING_TOKEN = re.compile(
+    r'[<hs](?:(?<=<)/?[iIİı][xX]:[^>]+>'
+    r'|(?<=h)ref="(?!https?://|//|#|mailto:)([^"]*)"'
+    r'|(?<=s)rc="(?!https?://|//|#|mailto:)([^"]*)")'
+)
+_ABSOLUTE_URL = re.compile(r"https?://|//|#|mailto:")
+FILING_CHUNK_SIZE = 64 * 1024
+# Longest unfinished token transform_filing() carries between chunks; a "<"
+# or an attribute value still open after this many characters is plain text.
+FILING_CARRY_MAX = 64 * 1024
+
+
+def transform_filing(chunks, cik, accession):
+    """
+    Strip inline XBRL tags and make relative links absolute, streaming.
+
+    Takes raw byte chunks and yields text. Each chunk is scanned once; only
+    the tail that could still be part of an unfinished token (at most
+    FILING_CARRY_MAX characters) is carried into the next one, so memory and
+    time stay linear however large the filing is.
+    """
+    base_path = f"https://www.sec.gov/Archives/edgar/data/{cik}/{accession}/"
+
+    def rewrite(attr, value):
+        # The old passes stripped ix tags before rewriting, so a value may
+        # only turn out to be absolute once its ix tags are gone.
+        if "<" in value:
+            value = _IX_CLOSE_TAG.sub("", _IX_OPEN_TAG.sub("", value))
+            if _ABSOLUTE_URL.match(value):
+                return f'{attr}="{value}"'
+        return f'{attr}="{base_path}{value}"'
+
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    carry = ""
+    for chunk in chain(chunks, [None]):
+        final = chunk is None
+        text = carry + (decoder.decode(b"", final=True) if final else decoder.decode(chunk))
+        if final:
+            limit = len(text)
+        else:
+            # Tokens starting before `limit` are complete: an ix tag needs a
+            # later ">", an href/src value a closing quote, `href="` 6 chars.
+            last_gt = text.rfind(">")
+            open_lt = text.find("<", last_gt + 1)
+            limit = min(
+                len(text) if open_lt == -1 else open_lt,
+                len(text) if '"' not in text else text.rfind('"') - 5,
+                len(text) - 5,
+            )
+            # Without the cap a "<" that never closes would be rescanned and
+            # re-concatenated with every later chunk.
+            limit = max(limit, len(text) - FILING_CARRY_MAX, 0)
+        out = []
+        pos = 0
+        for m in _FILING_TOKEN.finditer(text):
+            start = m.start()
+            if start >= limit:
+                break
+            out.append(text[pos:start])
+            href, src = m.groups()
+            if href is not None:
+                out.append(rewrite("href", href))
+            elif src is not None:
+                out.append(rewrite("src", src))
+            pos = m.end()
+        cut = max(pos, limit)
+        out.append(text[pos:cut])
+        carry = text[cut:]
+        yield "".join(out)
+
+
+@timed("filing")
+def build_filing_document(cik, accession, filename):
+    """Fetch a filing from EDGAR and return the transformed document as gzip bytes."""
+    url = f"https://www.sec.gov/Archives/edgar/data/{cik}/{accession}/{filename}"
+    compressor = zlib.compressobj(9, zlib.DEFLATED, 31)
+    parts = []
+    with edgar_open(url) as resp:
+        chunks = iter(partial(resp.read, FILING_CHUNK_SIZE), b"")
+        for text in transform_filing(chunks, cik, accession):
+            parts.append(compressor.compress(text.encode("utf-8")))
+    parts.append(compressor.flush())
+    return b"".join(parts)
+
+
+def filing_document_gz(cik, accession, filename):
+    """Processed filing as gzip bytes, from the filing store or built from EDGAR.
+
+    Concurrent requests for a filing that isn't stored yet share one build.
+    """
+    key = FilingStore.key(cik, accession, filename)
+    data = _filing_store.get(key)
+    if data is not None:
+        return data
+    return _single_flight.do(f"filing:{key}", partial(_build_and_store_filing, cik, accession, filename, key))
+
+
+def _build_and_store_filing(cik, accession, filename, key):
+    # Another process may have stored it while this one waited for the lock.
+    data = _filing_store.get(key)
+    if data is not None:
+        return data
+    data = build_filing_document(cik, accession, filename)
+    try:
+        _filing_store.put(key, data)
+    except OSError as e:
+        print(f"filing store write failed: {e}", file=sys.stderr)
+    else:
+        after_response(_filing_store.evict)
+    return data
+
+
+# Content-Encoding -> store suffix for the re-encodings this process can make.
+FILING_VARIANTS = {
+    **({"zstd": ".zst"} if zstandard else {}),
+    **({"br": ".br"} if brotli else {}),
+}
+
+
+def gunzip_chunks(data, size=FILING_CHUNK_SIZE):
+    """Decompress gzip bytes piecewise, yielding at most `size` bytes at a time."""
+    decompressor = zlib.decompressobj(31)
+    for i in range(0, len(data), size):
+        out = decompressor.decompress(data[i:i + size], size)
+        while out:
+            yield out
+            out = decompressor.decompress(decompressor.unconsumed_tail, size)
+    out = decompressor.flush()
+    if out:
+        yield out
+
+
+def store_filing_variant(key, encoding, gz):
+    """Re-encode a stored filing as `encoding` (br or zstd) and store it beside the gzip."""
+    if encoding == "br":
+        compressor = brotli.Compressor(quality=11)
+        parts = [compressor.process(chunk) for chunk in gunzip_chunks(gz)]
+        parts.append(compressor.finish())
+    else:
+        compressor = zstandard.ZstdCompressor(level=19).compressobj()
+        parts = [compressor.compress(chunk) for chunk in gunzip_chunks(gz)]
+        parts.append(compressor.flush())
+    _filing_store.put(key, b"".join(parts), FILING_VARIANTS[encoding])
+
+
+def load_embedded_data(path=EMBEDDED_DATA_JS):
+    """Parse the `window.__EMBEDDED_DATA = {...};` payload of embedded_data.js."""
+    return load_js_object(path)
+
+
+def warm_filings(data_path=EMBEDDED_DATA_JS, forms=None, delay=0.1):
+    """
+    Preload the filing store and the local full-text index with every filing
+    listed in embedded_data.js (optionally only `forms`). Filings already
+    stored are indexed from the store. Returns (already stored, fetched, failed).
+    """
+    companies = load_embedded_data(data_path).get("companies", {})
+    stored = fetched = failed = 0
+    for ticker, company in companies.items():
+        profile = company.get("profile") or {}
+        cik = str(profile.get("cik", "")).lstrip("0")
+        if not cik:
+            continue
+        for filing in company.get("filings", []):
+            accession = str(filing.get("filingId", "")).replace("-", "")
+            filename = filing.get("primaryDocument", "")
+            if not accession or not filename or (forms and filing.get("formType") not in forms):
+                continue
+            meta = {"form_type": filing.get("formType", ""), "filed_date": filing.get("filingDate", ""),
+                    "name": profile.get("name", ""), "ticker": ticker}
+            if os.path.exists(_filing_store.path(FilingStore.key(cik, accession, filename))):
+                stored += 1
+                try:
+                    index_filing_text(cik, accession, filename, filing_document_gz(cik, accession, filename), meta)
+                except Exception as e:
+                    print(f"{ticker} {accession}/{filename}: {e}", file=sys.stderr)
+                continue
+            try:
+                index_filing_text(cik, accession, filename, filing_document_gz(cik, accession, filename), meta)
+                fetched += 1
+            except Exception as e:
+                failed += 1
+                print(f"{ticker} {accession}/{filename}: {e}", file=sys.stderr)
+            time.sleep(delay)
+    _filing_store.evict()
+    return stored, fetched, failed
+
+
+# ─────────────────────────────────────────────
+# Filing lists
+# ─────────────────────────────────────────────
+# EDGAR submissions JSON is columnar: filings.recent holds parallel arrays for
+# the latest ~1000 filings, and filings.files lists overflow pages (same
+# arrays, each with a filingFrom/filingTo range) for older ones.
+# (output column, EDGAR column)
+FILING_COLUMNS = (
+    ("filingId", "accessionNumber"),
+    ("formType", "form"),
+    ("filingDate", "filingDate"),
+    ("reportDate", "reportDate"),
+    ("primaryDocument", "primaryDocument"),
+    ("description", "primaryDocDescription"),
+    ("items", "items"),
+)
+FILINGS_PAGE_SIZE = 100
+FILINGS_MAX_PAGE_SIZE = 1000
+
+
+def edgar_get_coalesced(url):
+    """edgar_get(), with concurrent identical fetches sharing one request."""
+    return _single_flight.do(f"edgar:{url}", partial(edgar_get, url), share=True)
+
+
+def filing_columns(block):
+    """
+    Output columns for one EDGAR filings block, every column padded to the
+    length of `form` (missing descriptions fall back to the form type).
+    """
+    forms = block.get("form") or []
+    n = len(forms)
+    columns = {}
+    for name, source in FILING_COLUMNS:
+        values = block.get(source) or []
+        if len(values) < n:
+            pad = forms[len(values):] if name == "description" else [""] * (n - len(values))
+            values = values + pad
+        columns[name] = values[:n] if len(values) > n else values
+    return columns
+
+
+def encode_filings_cursor(block, row):
+    return base64.urlsafe_b64encode(json.dumps([block, row]).encode("utf-8")).decode("ascii")
+
+
+def decode_filings_cursor(cursor):
+    """(block index, row index) of the next filing to consider; ValueError if malformed."""
+    try:
+        block, row = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        block, row = int(block), int(row)
+    except (ValueError, TypeError, UnicodeError):
+        raise ValueError("invalid cursor")
+    if block < 0 or row < 0:
+        raise ValueError("invalid cursor")
+    return block, row
+
+
+def select_filings(submissions, forms=None, date_from=None, date_to=None, limit=FILINGS_PAGE_SIZE,
+                   start=(0, 0), fetch=edgar_get_coalesced):
+    """
+    One page of filings matching forms (a set of form types) and the
+    inclusive filingDate range, as columns.
+
+    Blocks are filings.recent followed by each filings.files page. Overflow
+    pages are fetched only when the page isn't full yet and their
+    filingFrom..filingTo range overlaps the requested dates. Returns
+    (columns, next_cursor).
+    """
+    filings = submissions.get("filings") or {}
+    sources = [None, *(filings.get("files") or [])]
+    out = {name: [] for name, _ in FILING_COLUMNS}
+    count = 0
+    first_block, first_row = start
+    for b in range(first_block, len(sources)):
+        meta = sources[b]
+        if meta is None:
+            block = filings.get("recent") or {}
+        else:
+            if (date_from and meta.get("filingTo", "9999") < date_from) or \
+                    (date_to and meta.get("filingFrom", "") > date_to):
+                continue
+            block = json.loads(fetch(f"https://data.sec.gov/submissions/{meta['name']}").decode("utf-8"))
+        columns = filing_columns(block)
+        form_col, date_col = columns["formType"], columns["filingDate"]
+        for i in range(first_row if b == first_block else 0, len(form_col)):
+            if forms and form_col[i] not in forms:
+                continue
+            if (date_from and date_col[i] < date_from) or (date_to and date_col[i] > date_to):
+                continue
+            if count == limit:
+                return out, encode_filings_cursor(b, i)
+            for name, values in columns.items():
+                out[name].append(values[i])
+            count += 1
+    return out, None
+
+
+def edgar_submissions(cik):
+    """EDGAR submissions JSON for a zero-padded CIK (coalesced across callers)."""
+    return json.loads(edgar_get_coalesced(f"https://data.sec.gov/submissions/CIK{cik}.json").decode("utf-8"))
+
+
+def edgar_filings_page(cik, options, data=None):
+    """One /edgar/filings?format=columns response body; options from _filings_options()."""
+    if data is None:
+        data = edgar_submissions(cik)
+    columns, next_cursor = select_filings(data, **options)
+    return {
+        "cik": cik,
+        "name": data.get("name", ""),
+        "filings": columns,
+        "count": len(columns["filingId"]),
+        "next_cursor": next_cursor,
+    }
+
+
+def _filings_options(params):
+    """Filters and paging for /edgar/filings?format=columns; ValueError on bad input."""
+    forms = {f.strip().upper() for f in params.get("forms", "").split(",") if f.strip()}
+    dates = []
+    for name in ("from", "to"):
+        value = params.get(name) or None
+        if value is not None:
+            try:
+                value = datetime.date.fromisoformat(value).isoformat()
+            except ValueError:
+                raise ValueError(f"{name} must be a YYYY-MM-DD date")
+        dates.append(value)
+    try:
+        limit = int(params.get("limit") or FILINGS_PAGE_SIZE)
+    except ValueError:
+        limit = 0
+    if not 1 <= limit <= FILINGS_MAX_PAGE_SIZE:
+        raise ValueError(f"limit must be between 1 and {FILINGS_MAX_PAGE_SIZE}")
+    cursor = params.get("cursor")
+    return {
+        "forms": forms or None,
+        "date_from": dates[0],
+        "date_to": dates[1],
+        "limit": limit,
+        "start": decode_filings_cursor(cursor) if cursor else (0, 0),
+    }
+
+
+# ─────────────────────────────────────────────
+# Filing diff
+# ─────────────────────────────────────────────
+# /edgar/compare works on the processed documents from the filing store.
+# Each one is reduced to text blocks (paragraphs, headings, list items, table
+# rows), split into sections at "Item N." headings, and every block hashed.
+# Sections whose hash sequences match are reported unchanged without further
+# work; the rest are diffed block by block with Heckel's linear-time
+# algorithm. Results are cached in cache.db under both filings' store keys.
+COMPARE_VERSION = 1
+_BLOCK_TAGS = frozenset((
+    "p", "div", "br", "li", "tr", "table", "h1", "h2", "h3", "h4", "h5", "h6",
+    "blockquote", "pre", "section", "article", "center", "hr", "dt", "dd",
+))
+_SKIP_TAGS = frozenset(("script", "style", "head", "title"))
+_ITEM_HEADING = re.compile(r"(?i)^item\s*(\d{1,2}[a-d]?)\s*[.:\-–—\s|]")
+_SECTION_TITLE_MAX = 300
+
+
+class BlockParser(HTMLParser):
+    """Collects normalized text blocks from filing HTML, fed incrementally."""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.blocks = []
+        self.parts = []
+        self.skip = 0
+
+    def _flush(self):
+        text = " ".join("".join(self.parts).split())
+        self.parts = []
+        text = text.strip(" |")
+        if text:
+            self.blocks.append(text)
+
+    def handle_starttag(self, tag, attrs):
+        if tag in _SKIP_TAGS:
+            self.skip += 1
+        elif tag in _BLOCK_TAGS:
+            self._flush()
+
+    def handle_endtag(self, tag):
+        if tag in _SKIP_TAGS:
+            self.skip = max(0, self.skip - 1)
+        elif tag in ("td", "th"):
+            self.parts.append(" | ")
+        elif tag in _BLOCK_TAGS:
+            self._flush()
+
+    def handle_data(self, data):
+        if not self.skip:
+            self.parts.append(data)
+
+    def close(self):
+        super().close()
+        self._flush()
+
+
+def filing_blocks(gz):
+    """Text blocks of a processed filing (gzip bytes from the filing store)."""
+    parser = BlockParser()
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    for chunk in gunzip_chunks(gz):
+        parser.feed(decoder.decode(chunk))
+    parser.feed(decoder.decode(b"", final=True))
+    parser.close()
+    return parser.blocks
+
+
+def block_hash(text):
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest()
+
+
+def split_sections(blocks):
+    """
+    [(section id, title, blocks)] split at "Item N." headings; blocks before
+    the first heading form the "cover" section. A table of contents repeats
+    every heading, so when an item occurs more than once the occurrence with
+    the most blocks is kept (the rest fold into the section before it).
+    """
+    heads = [(0, "cover", "Cover")]
+    for i, text in enumerate(blocks):
+        m = _ITEM_HEADING.match(text)
+        if m and len(text) <= _SECTION_TITLE_MAX:
+            heads.append((i, f"item {m.group(1).lower()}", text))
+    spans = [(sid, title, start, heads[n + 1][0] if n + 1 < len(heads) else len(blocks))
+             for n, (start, sid, title) in enumerate(heads)]
+    best = {}
+    for n, (sid, _, start, end) in enumerate(spans):
+        if sid not in best or end - start > spans[best[sid]][3] - spans[best[sid]][2]:
+            best[sid] = n
+    sections = []
+    for n, (sid, title, start, end) in enumerate(spans):
+        if best[sid] == n:
+            sections.append([sid, title, start, end])
+        elif sections:
+            sections[-1][3] = end
+    return [(sid, title, blocks[start:end]) for sid, title, start, end in sections if end > start]
+
+
+def heckel_diff(old, new):
+    """
+    Block-level diff of two hash sequences (Heckel, 1978), in linear time.
+
+    Blocks that occur exactly once on both sides anchor the match, which is
+    then grown forwards and backwards through identical neighbours (from the
+    document boundaries too). Matches outside the longest in-order subset are
+    moves. Returns ops in new-document order: ("equal", i, j), ("moved", i, j),
+    ("delete", i, None) and ("insert", None, j); i and j index old and new.
+    """
+    counts = {}
+    for h in old:
+        counts.setdefault(h, [0, 0, 0])[0] += 1
+    for i, h in enumerate(old):
+        counts[h][2] = i
+    for h in new:
+        counts.setdefault(h, [0, 0, 0])[1] += 1
+    new_link = [None] * len(new)
+    old_link = [None] * len(old)
+    for j, h in enumerate(new):
+        old_count, new_count, i = counts[h]
+        if old_count == 1 and new_count == 1:
+            new_link[j], old_link[i] = i, j
+    # The start and end of both documents act as extra anchors.
+    for j in range(-1, len(new) - 1):
+        i = -1 if j < 0 else new_link[j]
+        if i is not None and i + 1 < len(old) and new_link[j + 1] is None and old_link[i + 1] is None \
+                and new[j + 1] == old[i + 1]:
+            new_link[j + 1], old_link[i + 1] = i + 1, j + 1
+    for j in range(len(new), 0, -1):
+        i = len(old) if j == len(new) else new_link[j]
+        if i is not None and i > 0 and new_link[j - 1] is None and old_link[i - 1] is None \
+                and new[j - 1] == old[i - 1]:
+            new_link[j - 1], old_link[i - 1] = i - 1, j - 1
+
+    in_order = _increasing_links(new_link)
+    ops = []
+    next_old = 0
+    for j, i in enumerate(new_link):
+        if i is None:
+            ops.append(("insert", None, j))
+        elif j in in_order:
+            ops.extend(("delete", k, None) for k in range(next_old, i) if old_link[k] is None)
+            next_old = i + 1
+            ops.append(("equal", i, j))
+        else:
+            ops.append(("moved", i, j))
+    ops.extend(("delete", i, None) for i in range(next_old, len(old)) if old_link[i] is None)
+    return ops
+
+
+def _increasing_links(new_link):
+    """New-side indices of the longest run of matches that keeps old order (patience sorting)."""
+    tails, tail_js, prev = [], [], {}
+    for j, i in enumerate(new_link):
+        if i is None:
+            continue
+        k = bisect_left(tails, i)
+        prev[j] = tail_js[k - 1] if k else None
+        if k == len(tails):
+            tails.append(i)
+            tail_js.append(j)
+        else:
+            tails[k], tail_js[k] = i, j
+    keep = set()
+    j = tail_js[-1] if tail_js else None
+    while j is not None:
+        keep.add(j)
+        j = prev[j]
+    return keep
+
+
+def _diff_ops(ops, old_blocks, new_blocks):
+    """Heckel ops as API entries; runs of unchanged blocks collapse into counts."""
+    out = []
+    for op, i, j in ops:
+        if op == "equal":
+            if out and out[-1]["op"] == "equal":
+                out[-1]["count"] += 1
+            else:
+                out.append({"op": "equal", "count": 1})
+        elif op == "insert":
+            out.append({"op": "insert", "text": new_blocks[j]})
+        elif op == "delete":
+            out.append({"op": "delete", "text": old_blocks[i]})
+        else:
+            out.append({"op": "moved", "text": new_blocks[j], "from": i, "to": j})
+    return out
+
+
+_SUMMARY_COUNTS = {"insert": "blocks_inserted", "delete": "blocks_deleted", "moved": "blocks_moved"}
+
+
+def compare_filings(gz_a, gz_b):
+    """Section-level comparison of two processed filings (A earlier, B later)."""
+    sections_a = split_sections(filing_blocks(gz_a))
+    sections_b = split_sections(filing_blocks(gz_b))
+    by_id_a = {sid: (title, blocks) for sid, title, blocks in sections_a}
+    ids_b = {sid for sid, _, _ in sections_b}
+    summary = {"sections_changed": 0, "sections_added": 0, "sections_removed": 0,
+               "blocks_inserted": 0, "blocks_deleted": 0, "blocks_moved": 0}
+    out = []
+
+    def add(sid, title, status, old, new, ops):
+        for op in ops:
+            if op["op"] in _SUMMARY_COUNTS:
+                summary[_SUMMARY_COUNTS[op["op"]]] += 1
+        out.append({"id": sid, "title": title, "status": status,
+                    "blocks_a": len(old), "blocks_b": len(new), "ops": ops})
+
+    for sid, title, new in sections_b:
+        if sid not in by_id_a:
+            summary["sections_added"] += 1
+            add(sid, title, "added", [], new, [{"op": "insert", "text": t} for t in new])
+            continue
+        old = by_id_a[sid][1]
+        old_hashes = [block_hash(t) for t in old]
+        new_hashes = [block_hash(t) for t in new]
+        if old_hashes == new_hashes:
+            add(sid, title, "unchanged", old, new, [{"op": "equal", "count": len(new)}] if new else [])
+            continue
+        summary["sections_changed"] += 1
+        add(sid, title, "changed", old, new, _diff_ops(heckel_diff(old_hashes, new_hashes), old, new))
+    for sid, title, old in sections_a:
+        if sid not in ids_b:
+            summary["sections_removed"] += 1
+            add(sid, title, "removed", old, [], [{"op": "delete", "text": t} for t in old])
+    return {"sections": out, "summary": summary}
+
+
+def compare_filings_cached(cik, a, b):
+    """
+    /edgar/compare body for filings a and b ((accession, filename) pairs) as
+    a CacheEntry. Processed filings never change, so entries live for
+    COMPARE_CACHE_TTL under both filings' store keys and COMPARE_VERSION.
+    """
+    key_a, key_b = FilingStore.key(cik, *a), FilingStore.key(cik, *b)
+    key = f"compare:{COMPARE_VERSION}:{key_a}:{key_b}"
+    try:
+        entry = _response_cache.get(key)
+    except sqlite3.Error:
+        entry = None
+    if entry is not None and time.time() < entry.expires_at:
+        return entry
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        gz_a, gz_b = pool.map(in_request_context(lambda f: filing_document_gz(cik, *f)), (a, b))
+    result = compare_filings(gz_a, gz_b)
+    body = (json.dumps({
+        "cik": cik,
+        "a": {"accession": a[0], "filename": a[1]},
+        "b": {"accession": b[0], "filename": b[1]},
+        **result,
+    }) + "\n").encode("utf-8")
+    try:
+        return _response_cache.put(key, body, COMPARE_CACHE_TTL)
+    except sqlite3.Error:
+        return cache_entry(key, body, time.time() + COMPARE_CACHE_TTL)
+
+
+# ─────────────────────────────────────────────
+# Local full-text index
+# ─────────────────────────────────────────────
+# fulltext.db is an FTS5 index over the text of every filing /edgar/document
+# has processed (the same blocks /edgar/compare diffs), added after the
+# response. /search answers from it when it alone fills the requested page
+# and goes to EFTS otherwise; hits use the EFTS shape so the UI needs no
+# second renderer.
+FULLTEXT_SCHEMA = """
+CREATE TABLE IF NOT EXISTS filing_docs (
+    doc_id INTEGER PRIMARY KEY,
+    store_key TEXT NOT NULL UNIQUE,
+    cik TEXT NOT NULL,
+    accession TEXT NOT NULL,
+    filename TEXT NOT NULL,
+    form_type TEXT,
+    filed_date TEXT,
+    name TEXT,
+    ticker TEXT,
+    indexed_at REAL
+);
+CREATE INDEX IF NOT EXISTS filing_docs_form ON filing_docs(form_type);
+CREATE VIRTUAL TABLE IF NOT EXISTS filing_text USING fts5(body, tokenize = 'porter unicode61');
+"""
+_FTS_TERM = re.compile(r'"([^"]*)"|(\S+)')
+
+
+def fts_match_query(q):
+    """
+    FTS5 MATCH expression for an EFTS-style query: "quoted phrases" stay
+    phrases, other words are ANDed; punctuation is dropped so user input
+    can't form FTS5 syntax. Empty if q has no searchable words.
+    """
+    parts = []
+    for phrase, word in _FTS_TERM.findall(q):
+        tokens = re.findall(r"\w+", phrase or word)
+        if tokens:
+            parts.append('"' + " ".join(tokens) + '"')
+    return " ".join(parts)
+
+
+class FullTextIndex:
+    """FTS5 index of processed filing text, shared across threads and CGI processes."""
+
+    def __init__(self, path):
+        self.path = path
+        self.local = threading.local()
+
+    def conn(self):
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(FULLTEXT_SCHEMA)
+            self.local.conn = conn
+        return conn
+
+    def has(self, key):
+        return self.conn().execute("SELECT 1 FROM filing_docs WHERE store_key = ?", (key,)).fetchone() is not None
+
+    def add(self, key, cik, accession, filename, meta, text):
+        conn = self.conn()
+        with conn:
+            row = conn.execute("SELECT doc_id FROM filing_docs WHERE store_key = ?", (key,)).fetchone()
+            if row is not None:
+                conn.execute("DELETE FROM filing_text WHERE rowid = ?", row)
+                conn.execute("DELETE FROM filing_docs WHERE doc_id = ?", row)
+            doc_id = conn.execute(
+                "INSERT INTO filing_docs (store_key, cik, accession, filename, form_type, filed_date, name, ticker,"
+                " indexed_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, str(cik).zfill(10), accession, filename, meta.get("form_type", ""),
+                 meta.get("filed_date", ""), meta.get("name", ""), meta.get("ticker", ""), time.time()),
+            ).lastrowid
+            conn.execute("INSERT INTO filing_text (rowid, body) VALUES (?, ?)", (doc_id, text))
+
+    def search(self, match, forms=(), start=0, size=EFTS_PAGE_SIZE):
+        """(total matches, page of rows) for an FTS5 MATCH expression, best bm25 first."""
+        conn = self.conn()
+        where = "filing_text MATCH ?"
+        args = [match]
+        if forms:
+            where += " AND d.form_type IN (SELECT value FROM json_each(?))"
+            args.append(json.dumps(list(forms)))
+        joined = f"FROM filing_text JOIN filing_docs d ON d.doc_id = filing_text.rowid WHERE {where}"
+        total = conn.execute(f"SELECT COUNT(*) {joined}", args).fetchone()[0]
+        rows = conn.execute(
+            "SELECT d.cik, d.accession, d.filename, d.form_type, d.filed_date, d.name, d.ticker,"
+            " bm25(filing_text), snippet(filing_text, 0, '', '', ' … ', 32)"
+            f" {joined} ORDER BY bm25(filing_text) LIMIT ? OFFSET ?",
+            [*args, size, start],
+        ).fetchall()
+        return total, rows
+
+
+_fulltext = FullTextIndex(FULLTEXT_DB)
+
+
+def filing_metadata(cik, accession):
+    """Form type, filing date, company name and ticker for a filing; blanks where unknown."""
+    ticker_map = company_ticker_map()
+    meta = {"form_type": "", "filed_date": "", "name": ticker_map.name(cik) or "", "ticker": ticker_map.ticker(cik) or ""}
+    try:
+        data = edgar_submissions(str(cik).zfill(10))
+    except Exception:
+        return meta
+    meta["name"] = data.get("name") or meta["name"]
+    columns = filing_columns(data.get("filings", {}).get("recent", {}))
+    for filing_id, form, filed in zip(columns["filingId"], columns["formType"], columns["filingDate"]):
+        if filing_id.replace("-", "") == accession:
+            meta.update(form_type=form, filed_date=filed)
+            break
+    return meta
+
+
+def index_filing_text(cik, accession, filename, gz, meta=None):
+    """Add a processed filing to the local full-text index unless it is already there."""
+    key = FilingStore.key(cik, accession, filename)
+    try:
+        if _fulltext.has(key):
+            return False
+        text = "\n".join(filing_blocks(gz))
+        _fulltext.add(key, cik, accession, filename, meta or filing_metadata(cik, accession), text)
+    except sqlite3.Error as e:
+        print(f"full-text index write failed: {e}", file=sys.stderr)
+        return False
+    return True
+
+
+@timed("fts")
+def local_search(q, forms="", start=0):
+    """/search response body from the local index as a dict, or None if it can't answer."""
+    q, forms, start = efts_query(q, forms, start)
+    match = fts_match_query(q)
+    if not match or not os.path.exists(FULLTEXT_DB):
+        return None
+    forms = [f for f in forms.split(",") if f]
+    try:
+        total, rows = _fulltext.search(match, forms, start)
+    except sqlite3.Error:
+        return None
+    hits = []
+    for cik, accession, filename, form, filed, name, ticker, rank, snippet in rows:
+        adsh = f"{accession[:10]}-{accession[10:12]}-{accession[12:]}"
+        display = f"{name} ({ticker})  (CIK {cik})" if ticker else f"{name}  (CIK {cik})"
+        hits.append({
+            "_id": f"{adsh}:{filename}",
+            "_score": round(-rank, 4),
+            "_source": {
+                "ciks": [cik],
+                "display_names": [display],
+                "form": form,
+                "root_forms": [form] if form else [],
+                "file_type": form,
+                "file_date": filed,
+                "adsh": adsh,
+                "file_description": form,
+            },
+            "highlight": {"text": [snippet]},
+        })
+    return {"hits": {"total": {"value": total, "relation": "partial"}, "hits": hits},
+            "source": "local", "partial": True}
+
+
+# ─────────────────────────────────────────────
+# Company search index
+# ─────────────────────────────────────────────
+class CompanySearchIndex:
+    """
+    Prebuilt lookup structures for /companies/search.
+
+    Reproduces the score tiers of a full scan over company_tickers.json:
+      0  ticker == q                 — sorted tickers, bisect
+      1  ticker starts with q        — sorted tickers, bisect
+      2  name starts with q          — sorted names, bisect
+      3  q in ticker                 — every ticker substring -> entries
+      4  q in name                   — 1/2/3-gram postings, verified
+      5  a name word starts with q   — sorted name words, bisect
+      6+dist  levenshtein(q, ticker) <= max(2, len(q) // 2) — symmetric-delete
+                                   neighbourhoods (or length buckets), verified
+    Each entry is scored by its first matching tier, and ties keep file order,
+    exactly as the stable sort over the scan did. Tiers are filled in order and
+    the lookup stops once `limit` results are collected.
+    """
+
+    NGRAM = 3
+
+    def __init__(self, tickers_data):
+        entries = []
+        for entry in tickers_data.values():
+            ticker = str(entry.get("ticker", "")).upper()
+            name = str(entry.get("title", entry.get("name", "")))
+            cik = entry.get("cik_str", entry.get("cik", ""))
+            entries.append((ticker, name, str(cik), name.upper()))
+        self.entries = entries
+
+        by_ticker = sorted((e[0], i) for i, e in enumerate(entries))
+        self.ticker_keys = [k for k, _ in by_ticker]
+        self.ticker_ids = [i for _, i in by_ticker]
+        by_name = sorted((e[3], i) for i, e in enumerate(entries))
+        self.name_keys = [k for k, _ in by_name]
+        self.name_ids = [i for _, i in by_name]
+        by_word = sorted((w, i) for i, e in enumerate(entries) for w in set(e[3].split()))
+        self.word_keys = [k for k, _ in by_word]
+        self.word_ids = [i for _, i in by_word]
+
+        substrings = {}
+        grams = {}
+        for i, (ticker, _, _, name_upper) in enumerate(entries):
+            subs = {ticker[a:b] for a in range(len(ticker)) for b in range(a + 1, len(ticker) + 1)}
+            for sub in subs:
+                substrings.setdefault(sub, []).append(i)
+            name_grams = {
+                name_upper[a:a + n]
+                for n in range(1, self.NGRAM + 1)
+                for a in range(len(name_upper) - n + 1)
+            }
+            for g in name_grams:
+                grams.setdefault(g, []).append(i)
+        self.ticker_substrings = {k: array("I", v) for k, v in substrings.items()}
+        self.name_grams = {k: array("I", v) for k, v in grams.items()}
+
+        # Symmetric-delete neighbourhoods for the fuzzy tier: deletes[k] maps
+        # every string reachable by deleting k characters from a ticker to the
+        # entries with that ticker. levenshtein(q, t) <= d implies q and t share
+        # such a string with at most d deletions on each side.
+        deletes = []
+        by_length = {}
+        for i, (ticker, _, _, _) in enumerate(entries):
+            by_length.setdefault(len(ticker), []).append(i)
+            for k in range(len(ticker) + 1):
+                if k == len(deletes):
+                    deletes.append({})
+                for v in {"".join(c) for c in combinations(ticker, len(ticker) - k)}:
+                    deletes[k].setdefault(v, []).append(i)
+        self.deletes = [{v: array("I", ids) for v, ids in level.items()} for level in deletes]
+        self.by_length = {n: array("I", ids) for n, ids in by_length.items()}
+
+    def score(self, i, q):
+        """Tier 0-5 score of entry i for q, or None if it only matches fuzzily (or not at all)."""
+        ticker, _, _, name_upper = self.entries[i]
+        if ticker == q:
+            return 0
+        if ticker.startswith(q):
+            return 1
+        if name_upper.startswith(q):
+            return 2
+        if q in ticker:
+            return 3
+        if q in name_upper:
+            return 4
+        if any(w.startswith(q) for w in name_upper.split()):
+            return 5
+        return None
+
+    @staticmethod
+    def _prefix_ids(keys, ids, q):
+        lo = bisect_left(keys, q)
+        hi = bisect_left(keys, q + "\U0010ffff", lo)
+        return ids[lo:hi]
+
+    def _candidates(self, tier, q):
+        """Entry ids that may score `tier`, in file order."""
+        if tier == 0:
+            lo = bisect_left(self.ticker_keys, q)
+            return sorted(self.ticker_ids[lo:bisect_right(self.ticker_keys, q, lo)])
+        if tier == 1:
+            return sorted(self._prefix_ids(self.ticker_keys, self.ticker_ids, q))
+        if tier == 2:
+            return sorted(self._prefix_ids(self.name_keys, self.name_ids, q))
+        if tier == 3:
+            return self.ticker_substrings.get(q, ())
+        if tier == 4:
+            if len(q) <= self.NGRAM:
+                return self.name_grams.get(q, ())
+            postings = [self.name_grams.get(q[a:a + self.NGRAM], ()) for a in range(len(q) - self.NGRAM + 1)]
+            return min(postings, key=len)
+        return sorted(set(self._prefix_ids(self.word_keys, self.word_ids, q)))
+
+    def _fuzzy_candidates(self, q, d):
+        """Entry ids (file order, may repeat) that could be within distance d of q."""
+        n = len(q)
+        max_len = len(self.deletes) - 1
+        # Only delete variants no longer than the longest ticker can match.
+        js = range(max(0, n - max_len), min(d, n) + 1)
+        variants = sum(comb(n, j) for j in js)
+        lengths = [L for L in range(max(0, n - d), n + d + 1) if L in self.by_length]
+        # A distance check costs roughly ten variant lookups; scan the length
+        # buckets only when the neighbourhood is larger than that.
+        if variants > 10 * sum(len(self.by_length[L]) for L in lengths):
+            return heapq.merge(*(self.by_length[L] for L in lengths))
+        postings = []
+        for j in js:
+            for v in {"".join(c) for c in combinations(q, n - j)}:
+                for k in range(min(d, max_len - len(v)) + 1):
+                    ids = self.deletes[k].get(v)
+                    if ids:
+                        postings.append(ids)
+        return heapq.merge(*postings)
+
+    def _fuzzy(self, q, limit):
+        """Up to `limit` ids of tier-6+ entries, ordered by (distance, file order)."""
+        picked = []
+        dist = {}
+        radius = max(2, len(q) // 2)
+        for d in range(1, radius + 1):
+            last = None
+            for i in self._fuzzy_candidates(q, d):
+                if i == last:
+                    continue
+                last = i
+                ticker = self.entries[i][0]
+                if ticker not in dist:
+                    dist[ticker] = levenshtein_within(q, ticker, radius)
+                if dist[ticker] == d and self.score(i, q) is None:
+                    picked.append(i)
+                    if len(picked) == limit:
+                        return picked
+        return picked
+
+    def search(self, q, limit=10):
+        """Top `limit` matches for an upper-cased, stripped query."""
+        picked = []
+        for tier in range(6):
+            for i in self._candidates(tier, q):
+                if self.score(i, q) == tier:
+                    picked.append(i)
+                    if len(picked) == limit:
+                        return self._format(picked)
+        picked.extend(self._fuzzy(q, limit - len(picked)))
+        return self._format(picked)
+
+    def _format(self, ids):
+        return [
+            {"ticker": self.entries[i][0], "name": self.entries[i][1], "cik": self.entries[i][2]}
+            for i in ids
+        ]
+
+
+_search_index = (None, None)
+_search_index_lock = threading.Lock()
+
+
+def company_search_index(tickers_data):
+    """CompanySearchIndex for tickers_data, built once per loaded tickers dict."""
+    global _search_index
+    data, index = _search_index
+    if data is tickers_data:
+        return index
+    with _search_index_lock:
+        data, index = _search_index
+        if data is not tickers_data:
+            index = CompanySearchIndex(tickers_data)
+            _search_index = (tickers_data, index)
+        return index
+
+
+def parse_qs(qs):
+    """Parse QUERY_STRING into a dict (first value for each key)."""
+    parsed = urllib.parse.parse_qs(qs or "")
+    return {k: v[0] for k, v in parsed.items()}
+
+
+def read_body():
+    """Read POST body from the request stream using CONTENT_LENGTH."""
+    try:
+        content_length = int(request_environ().get("CONTENT_LENGTH", 0))
+    except (ValueError, TypeError):
+        content_length = 0
+    if content_length > 0:
+        stream = getattr(_request, "stdin", None) or sys.stdin.buffer
+        return stream.read(content_length).decode("utf-8", errors="replace")
+    return ""
+
+
+def normalize_labels(values):
+    """Token set sig_overlap compares: stripped, lower-cased, blanks dropped."""
+    return set(str(x).strip().lower() for x in values if str(x).strip())
+
+
+def sig_overlap(headers_a, rows_a, headers_b, rows_b):
+    """
+    Compute table signature overlap score.
+    60% weight on header match, 40% weight on row label match.
+    Returns float in [0.0, 1.0].
+    """
+    def jaccard(set_a, set_b):
+        if not set_a and not set_b:
+            return 1.0
+        if not set_a or not set_b:
+            return 0.0
+        a = normalize_labels(set_a)
+        b = normalize_labels(set_b)
+        if not a and not b:
+            return 1.0
+        intersection = len(a & b)
+        union = len(a | b)
+        return intersection / union if union > 0 else 0.0
+
+    h_score = jaccard(headers_a, headers_b)
+    r_score = jaccard(rows_a, rows_b)
+    return 0.6 * h_score + 0.4 * r_score
+
+
+# ─────────────────────────────────────────────
+# Similar-tables index
+# ─────────────────────────────────────────────
+# Columns _find_and_return_similar reads. tables.db is built outside this
+# script; this is the minimal schema benchmarks and tooling create.
+TABLES_SCHEMA = """
+CREATE TABLE IF NOT EXISTS tables (
+    id INTEGER PRIMARY KEY,
+    filing_id TEXT NOT NULL,
+    ticker TEXT,
+    form_type TEXT,
+    filed_date TEXT,
+    table_idx INTEGER,
+    headers TEXT,
+    row_labels TEXT,
+    row_count INTEGER DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS tables_ticker ON tables(ticker);
+"""
+
+# Side tables in tables.db: a (field, token) -> table posting list plus each
+# table's label "kind" and normalized token count per field. sig_overlap only
+# scores above zero when a field shares a token, or when both sides of a field
+# are empty lists (kind 0) or both hold only blank strings (kind 1). Counting
+# posting hits per table gives each Jaccard's intersection, so SQLite can drop
+# candidates below the threshold before any row is decoded.
+# Triggers queue inserted/updated rows in table_index_dirty; dirty rows are
+# always scored until index_tables() folds them in.
+#
+# table_sigs also keeps each field's normalized token set as a sorted, packed
+# array of interned token ids (table_vocab), so scoring a candidate is an
+# integer intersection instead of re-normalizing its JSON labels.
+#
+# For approximate lookups each field's token set also gets a MinHash
+# signature (table_minhash) split into LSH bands (table_lsh). Deleted rows stay
+# queued too, so the next run can drop their LSH postings using the stored
+# signatures.
+TABLE_INDEX_VERSION = 3
+TABLE_INDEX_SCHEMA = """
+CREATE TABLE IF NOT EXISTS table_index_meta (key TEXT PRIMARY KEY, value);
+CREATE TABLE IF NOT EXISTS table_tokens (
+    field INTEGER NOT NULL,
+    token TEXT NOT NULL,
+    table_id INTEGER NOT NULL,
+    PRIMARY KEY (field, token, table_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS table_tokens_table ON table_tokens(table_id);
+CREATE TABLE IF NOT EXISTS table_sigs (
+    table_id INTEGER PRIMARY KEY,
+    h_kind INTEGER NOT NULL,
+    r_kind INTEGER NOT NULL,
+    h_card INTEGER NOT NULL,
+    r_card INTEGER NOT NULL,
+    h_ids BLOB,
+    r_ids BLOB
+);
+CREATE TABLE IF NOT EXISTS table_vocab (token_id INTEGER PRIMARY KEY, token TEXT NOT NULL UNIQUE);
+CREATE INDEX IF NOT EXISTS table_sigs_h_kind ON table_sigs(h_kind) WHERE h_kind < 2;
+CREATE INDEX IF NOT EXISTS table_sigs_r_kind ON table_sigs(r_kind) WHERE r_kind < 2;
+CREATE TABLE IF NOT EXISTS table_minhash (
+    table_id INTEGER PRIMARY KEY,
+    h_sig BLOB,
+    r_sig BLOB
+);
+CREATE TABLE IF NOT EXISTS table_lsh (
+    field INTEGER NOT NULL,
+    band INTEGER NOT NULL,
+    bucket INTEGER NOT NULL,
+    table_id INTEGER NOT NULL,
+    PRIMARY KEY (field, band, bucket, table_id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS table_index_dirty (table_id INTEGER PRIMARY KEY);
+CREATE TRIGGER IF NOT EXISTS tables_index_insert AFTER INSERT ON tables BEGIN
+    INSERT OR IGNORE INTO table_index_dirty (table_id) VALUES (new.rowid);
+END;
+CREATE TRIGGER IF NOT EXISTS tables_index_update AFTER UPDATE OF headers, row_labels ON tables BEGIN
+    DELETE FROM table_sigs WHERE table_id = new.rowid;
+    INSERT OR IGNORE INTO table_index_dirty (table_id) VALUES (new.rowid);
+END;
+CREATE TRIGGER IF NOT EXISTS tables_index_delete AFTER DELETE ON tables BEGIN
+    DELETE FROM table_tokens WHERE table_id = old.rowid;
+    DELETE FROM table_sigs WHERE table_id = old.rowid;
+    INSERT OR IGNORE INTO table_index_dirty (table_id) VALUES (old.rowid);
+END;
+"""
+HEADER_FIELD = 0
+ROW_FIELD = 1
+
+MINHASH_PERMS = 128
+LSH_ROWS = 2
+LSH_BANDS = MINHASH_PERMS // LSH_ROWS
+_MERSENNE = (1 << 61) - 1
+_minhash_rng = random.Random(0x5EC)
+MINHASH_PARAMS = [
+    (_minhash_rng.randrange(1, _MERSENNE), _minhash_rng.randrange(_MERSENNE))
+    for _ in range(MINHASH_PERMS)
+]
+
+
+def label_kind(values):
+    """0 = empty list, 1 = only blank labels, 2 = has tokens (see TABLE_INDEX_SCHEMA)."""
+    if not values:
+        return 0
+    return 2 if normalize_labels(values) else 1
+
+
+def decode_labels(raw):
+    """Decode a headers/row_labels column the way the similarity scan does."""
+    return json.loads(raw) if raw else []
+
+
+class TokenVocab:
+    """Token -> id map backed by table_vocab; new tokens are interned on demand."""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.ids = dict(conn.execute("SELECT token, token_id FROM table_vocab"))
+        self.next_id = max(self.ids.values(), default=0) + 1
+        self.new = []
+
+    def pack(self, tokens):
+        """Sorted ids of `tokens` as a packed uint32 blob."""
+        out = []
+        for t in tokens:
+            token_id = self.ids.get(t)
+            if token_id is None:
+                token_id = self.ids[t] = self.next_id
+                self.next_id += 1
+                self.new.append((token_id, t))
+            out.append(token_id)
+        return array("I", sorted(out)).tobytes()
+
+    def flush(self):
+        self.conn.executemany("INSERT INTO table_vocab (token_id, token) VALUES (?, ?)", self.new)
+        self.new = []
+
+
+def query_token_ids(conn, tokens):
+    """Ids of the query tokens the vocabulary knows; unknown tokens match no table."""
+    return frozenset(r[0] for r in conn.execute(
+        "SELECT token_id FROM table_vocab WHERE token IN (SELECT value FROM json_each(?))",
+        (json.dumps(sorted(tokens)),),
+    ))
+
+
+def packed_jaccard(q_kind, q_card, q_ids, t_kind, t_card, t_ids):
+    """sig_overlap's jaccard() for one field, from kinds, cardinalities and packed ids."""
+    if q_kind == 0 or t_kind == 0:
+        return 1.0 if q_kind == t_kind else 0.0
+    if not q_card and not t_card:
+        return 1.0
+    ids = array("I")
+    ids.frombytes(t_ids)
+    intersection = len(q_ids.intersection(ids))
+    return intersection / (q_card + t_card - intersection)
+
+
+def minhash_signature(tokens):
+    """MinHash of a normalized token set under MINHASH_PERMS universal hashes, or None if empty."""
+    if not tokens:
+        return None
+    bases = [zlib.crc32(t.encode("utf-8")) for t in tokens]
+    return array("Q", [min((a * x + b) % _MERSENNE for x in bases) for a, b in MINHASH_PARAMS])
+
+
+def lsh_buckets(sig, bands=LSH_BANDS):
+    """(band, bucket) pairs for the first `bands` bands of a MinHash signature."""
+    out = []
+    for band in range(bands):
+        h = 0
+        for v in sig[band * LSH_ROWS:(band + 1) * LSH_ROWS]:
+            h = (h * 1000003 + v) & 0x7FFFFFFFFFFFFFFF
+        out.append((band, h))
+    return out
+
+
+def lsh_estimate(header_hits, row_hits):
+    """sig_overlap estimated from the number of LSH bands shared in each field."""
+    return 0.6 * math.sqrt(header_hits / LSH_BANDS) + 0.4 * math.sqrt(row_hits / LSH_BANDS)
+
+
+@lru_cache(maxsize=32)
+def lsh_score_cutoff(recall):
+    """
+    Lowest lsh_estimate() an approximate candidate needs, chosen so a table
+    scoring exactly the threshold survives with probability >= recall.
+
+    A field pair with Jaccard j shares each band with probability
+    j ** LSH_ROWS, so its band hits are Binomial(LSH_BANDS, j ** LSH_ROWS).
+    The cutoff is the worst (1 - recall) quantile of the estimate over points
+    on the 0.6 * h + 0.4 * r = threshold line.
+    """
+    recall = min(max(float(recall), 0.0), 1.0)
+    steps = 20
+    cutoff = 1.0
+    for i in range(steps + 1):
+        h = SIMILARITY_THRESHOLD / 0.6 * i / steps
+        r = (SIMILARITY_THRESHOLD - 0.6 * h) / 0.4
+        dist = []
+        for pairs in (_binomial(LSH_BANDS, h ** LSH_ROWS), _binomial(LSH_BANDS, r ** LSH_ROWS)):
+            dist.append([(k, p) for k, p in enumerate(pairs) if p > 1e-12])
+        outcomes = sorted(
+            ((lsh_estimate(hh, rr), ph * pr) for hh, ph in dist[0] for rr, pr in dist[1]),
+            reverse=True,
+        )
+        mass = 0.0
+        for estimate, p in outcomes:
+            mass += p
+            if mass >= recall:
+                break
+        cutoff = min(cutoff, estimate)
+    return cutoff - 1e-9
+
+
+def _binomial(n, p):
+    return [comb(n, k) * p ** k * (1 - p) ** (n - k) for k in range(n + 1)]
+
+
+def _stored_index_version(conn):
+    try:
+        row = conn.execute("SELECT value FROM table_index_meta WHERE key = 'version'").fetchone()
+    except sqlite3.OperationalError:
+        return None
+    return row and row[0]
+
+
+def table_index_ready(conn):
+    """True if tables.db carries a current similar-tables index."""
+    return _stored_index_version(conn) == TABLE_INDEX_VERSION
+
+
+def _index_rows(conn, rows, vocab):
+    tokens = []
+    sigs = []
+    minhashes = []
+    buckets = []
+    for table_id, raw_headers, raw_rows in rows:
+        try:
+            headers = decode_labels(raw_headers)
+            row_labels = decode_labels(raw_rows)
+            h_tokens = normalize_labels(headers)
+            r_tokens = normalize_labels(row_labels)
+        except (json.JSONDecodeError, TypeError):
+            # The scan skips (or cannot score) these rows; leave them out.
+            continue
+        tokens.extend((HEADER_FIELD, t, table_id) for t in h_tokens)
+        tokens.extend((ROW_FIELD, t, table_id) for t in r_tokens)
+        sigs.append((
+            table_id, label_kind(headers), label_kind(row_labels), len(h_tokens), len(r_tokens),
+            vocab.pack(h_tokens), vocab.pack(r_tokens),
+        ))
+        h_sig, r_sig = minhash_signature(h_tokens), minhash_signature(r_tokens)
+        minhashes.append((table_id, h_sig and h_sig.tobytes(), r_sig and r_sig.tobytes()))
+        for field, sig in ((HEADER_FIELD, h_sig), (ROW_FIELD, r_sig)):
+            if sig:
+                buckets.extend((field, band, bucket, table_id) for band, bucket in lsh_buckets(sig))
+    conn.executemany("INSERT OR IGNORE INTO table_tokens (field, token, table_id) VALUES (?, ?, ?)", tokens)
+    vocab.flush()
+    conn.executemany(
+        "INSERT OR REPLACE INTO table_sigs (table_id, h_kind, r_kind, h_card, r_card, h_ids, r_ids)"
+        " VALUES (?, ?, ?, ?, ?, ?, ?)",
+        sigs,
+    )
+    conn.executemany("INSERT OR REPLACE INTO table_minhash (table_id, h_sig, r_sig) VALUES (?, ?, ?)", minhashes)
+    conn.executemany("INSERT OR IGNORE INTO table_lsh (field, band, bucket, table_id) VALUES (?, ?, ?, ?)", buckets)
+    return len(rows)
+
+
+def _drop_lsh_postings(conn):
+    """Remove the LSH postings and signatures of every queued table."""
+    stale = conn.execute(
+        "SELECT table_id, h_sig, r_sig FROM table_minhash"
+        " WHERE table_id IN (SELECT table_id FROM table_index_dirty)"
+    ).fetchall()
+    for table_id, h_sig, r_sig in stale:
+        for field, blob in ((HEADER_FIELD, h_sig), (ROW_FIELD, r_sig)):
+            if blob:
+                conn.executemany(
+                    "DELETE FROM table_lsh WHERE field = ? AND band = ? AND bucket = ? AND table_id = ?",
+                    [(field, band, bucket, table_id) for band, bucket in lsh_buckets(array("Q", blob))],
+                )
+    conn.executemany("DELETE FROM table_minhash WHERE table_id = ?", [(r[0],) for r in stale])
+
+
+def _drop_table_index(conn):
+    for name in ("table_tokens", "table_sigs", "table_vocab", "table_minhash", "table_lsh", "table_index_dirty"):
+        conn.execute(f"DROP TABLE IF EXISTS {name}")
+    for name in ("tables_index_insert", "tables_index_update", "tables_index_delete"):
+        conn.execute(f"DROP TRIGGER IF EXISTS {name}")
+
+
+def _backfill_token_ids(conn, vocab, batch_size):
+    """Fill packed token ids for table_sigs rows indexed before version 3."""
+    filled = 0
+    last_id = 0
+    while True:
+        rows = conn.execute(
+            "SELECT s.table_id, t.headers, t.row_labels FROM table_sigs s JOIN tables t ON t.rowid = s.table_id"
+            " WHERE s.table_id > ? AND s.h_ids IS NULL ORDER BY s.table_id LIMIT ?",
+            (last_id, batch_size),
+        ).fetchall()
+        if not rows:
+            return filled
+        updates = []
+        for table_id, raw_headers, raw_rows in rows:
+            h_tokens = normalize_labels(decode_labels(raw_headers))
+            r_tokens = normalize_labels(decode_labels(raw_rows))
+            updates.append((vocab.pack(h_tokens), vocab.pack(r_tokens), table_id))
+        vocab.flush()
+        conn.executemany("UPDATE table_sigs SET h_ids = ?, r_ids = ? WHERE table_id = ?", updates)
+        filled += len(updates)
+        last_id = rows[-1][0]
+
+
+def index_tables(conn, rebuild=False, batch_size=5000):
+    """
+    Build, refresh or migrate the similar-tables index inside tables.db.
+
+    The first run (or rebuild=True) indexes every row; later runs only fold in
+    rows queued in table_index_dirty. A version 2 index is migrated in place by
+    backfilling packed token ids; older ones are rebuilt. Returns the number
+    of rows indexed or backfilled.
+    """
+    version = _stored_index_version(conn)
+    if version == 2:
+        columns = {r[1] for r in conn.execute("PRAGMA table_info(table_sigs)")}
+        for column in ("h_ids", "r_ids"):
+            if column not in columns:
+                conn.execute(f"ALTER TABLE table_sigs ADD COLUMN {column} BLOB")
+        conn.execute("DROP TRIGGER IF EXISTS tables_index_update")
+    elif version != TABLE_INDEX_VERSION:
+        _drop_table_index(conn)
+    conn.executescript(TABLE_INDEX_SCHEMA)
+    full = rebuild or version not in (2, TABLE_INDEX_VERSION)
+    indexed = 0
+    with conn:
+        if full:
+            conn.execute("DELETE FROM table_tokens")
+            conn.execute("DELETE FROM table_sigs")
+            conn.execute("DELETE FROM table_vocab")
+            conn.execute("DELETE FROM table_minhash")
+            conn.execute("DELETE FROM table_lsh")
+            conn.execute("DELETE FROM table_index_dirty")
+            vocab = TokenVocab(conn)
+            cur = conn.execute("SELECT rowid, headers, row_labels FROM tables ORDER BY rowid")
+        else:
+            dirty = [(r[0],) for r in conn.execute("SELECT table_id FROM table_index_dirty")]
+            conn.executemany("DELETE FROM table_tokens WHERE table_id = ?", dirty)
+            conn.executemany("DELETE FROM table_sigs WHERE table_id = ?", dirty)
+            _drop_lsh_postings(conn)
+            vocab = TokenVocab(conn)
+            indexed += _backfill_token_ids(conn, vocab, batch_size)
+            cur = conn.execute(
+                "SELECT rowid, headers, row_labels FROM tables"
+                " WHERE rowid IN (SELECT table_id FROM table_index_dirty) ORDER BY rowid"
+            )
+        while True:
+            rows = cur.fetchmany(batch_size)
+            if not rows:
+                break
+            indexed += _index_rows(conn, rows, vocab)
+        conn.execute("DELETE FROM table_index_dirty")
+        conn.execute(
+            "INSERT OR REPLACE INTO table_index_meta (key, value) VALUES ('version', ?)",
+            (TABLE_INDEX_VERSION,),
+        )
+    return indexed
+
+
+def _jaccard_sql(kind_col, card_col, hits_col, query_kind, query_card):
+    """SQL for one field's Jaccard score, mirroring sig_overlap's jaccard()."""
+    if query_kind < 2:
+        return f"({kind_col} = {query_kind})"
+    return f"(CAST({hits_col} AS REAL) / ({query_card} + {card_col} - {hits_col}))"
+
+
+def _indexed_candidate_ids(conn, headers, row_labels):
+    """
+    Ids of indexed tables whose score reaches SIMILARITY_THRESHOLD.
+
+    Intersections come from counting posting hits per table; the threshold is
+    applied with a small margin and the caller rescores survivors exactly.
+    """
+    h_kind, r_kind = label_kind(headers), label_kind(row_labels)
+    h_tokens, r_tokens = normalize_labels(headers), normalize_labels(row_labels)
+    sources = [
+        "SELECT table_id, SUM(field = 0) AS h_hits, SUM(field = 1) AS r_hits FROM table_tokens"
+        " WHERE (field = 0 AND token IN (SELECT value FROM json_each(?)))"
+        " OR (field = 1 AND token IN (SELECT value FROM json_each(?)))"
+        " GROUP BY table_id"
+    ]
+    args = [json.dumps(sorted(h_tokens)), json.dumps(sorted(r_tokens))]
+    if h_kind < 2:
+        sources.append("SELECT table_id, 0, 0 FROM table_sigs WHERE h_kind = ?")
+        args.append(h_kind)
+    if r_kind < 2:
+        sources.append("SELECT table_id, 0, 0 FROM table_sigs WHERE r_kind = ?")
+        args.append(r_kind)
+    h_sql = _jaccard_sql("s.h_kind", "s.h_card", "c.h_hits", h_kind, len(h_tokens))
+    r_sql = _jaccard_sql("s.r_kind", "s.r_card", "c.r_hits", r_kind, len(r_tokens))
+    sql = (
+        f"WITH hits AS ({' UNION ALL '.join(sources)}),"
+        " c AS (SELECT table_id, SUM(h_hits) AS h_hits, SUM(r_hits) AS r_hits FROM hits GROUP BY table_id)"
+        " SELECT c.table_id FROM c JOIN table_sigs s ON s.table_id = c.table_id"
+        f" WHERE 0.6 * {h_sql} + 0.4 * {r_sql} >= ?"
+    )
+    args.append(SIMILARITY_THRESHOLD - 1e-9)
+    return [r[0] for r in conn.execute(sql, args)]
+
+
+def _lsh_candidate_ids(conn, headers, row_labels, recall):
+    """
+    Ids of indexed tables whose shared LSH bands put their estimated score
+    above lsh_score_cutoff(recall); plus exact kind matches for empty or blank
+    fields, which MinHash cannot represent.
+    """
+    keys = []
+    kinds = []
+    for field, column, values in ((HEADER_FIELD, "h_kind", headers), (ROW_FIELD, "r_kind", row_labels)):
+        kind = label_kind(values)
+        if kind < 2:
+            kinds.append((column, kind))
+        else:
+            sig = minhash_signature(normalize_labels(values))
+            keys.extend((field, band, bucket) for band, bucket in lsh_buckets(sig))
+    ids = set()
+    if keys:
+        cutoff = lsh_score_cutoff(recall)
+        hits = conn.execute(
+            "SELECT l.table_id, SUM(l.field = 0), SUM(l.field = 1)"
+            " FROM (VALUES " + ", ".join(["(?, ?, ?)"] * len(keys)) + ") AS k"
+            " JOIN table_lsh l ON l.field = k.column1 AND l.band = k.column2 AND l.bucket = k.column3"
+            " GROUP BY l.table_id",
+            [v for key in keys for v in key],
+        )
+        ids.update(table_id for table_id, hh, rr in hits if lsh_estimate(hh, rr) >= cutoff)
+    for column, kind in kinds:
+        ids.update(r[0] for r in conn.execute(f"SELECT table_id FROM table_sigs WHERE {column} = ?", (kind,)))
+    return list(ids)
+
+
+# Table columns plus the packed signature, NULL for rows not (yet) indexed.
+_SIGNED_ROWS_SQL = (
+    "SELECT t.rowid AS table_rowid, t.*, s.h_kind AS sig_h_kind, s.r_kind AS sig_r_kind, s.h_card AS sig_h_card,"
+    " s.r_card AS sig_r_card, s.h_ids AS sig_h_ids, s.r_ids AS sig_r_ids"
+    " FROM tables t LEFT JOIN table_sigs s ON s.table_id = t.rowid"
+)
+
+
+def _candidate_rows(conn, headers, row_labels, approx_recall=None):
+    """Rows that can reach the threshold against the query, in rowid order."""
+    if approx_recall:
+        ids = _lsh_candidate_ids(conn, headers, row_labels, approx_recall)
+    else:
+        ids = _indexed_candidate_ids(conn, headers, row_labels)
+    ids += [r[0] for r in conn.execute("SELECT table_id FROM table_index_dirty")]
+    return conn.execute(
+        _SIGNED_ROWS_SQL + " WHERE t.rowid IN (SELECT value FROM json_each(?)) ORDER BY t.rowid",
+        (json.dumps(ids),),
+    ).fetchall()
+
+
+def iter_similar_tables(conn, headers, row_labels, ticker_filter=None, use_index=True, approx_recall=None):
+    """
+    Yield (score, rowid, row, labels) for each table reaching the threshold,
+    in rowid order. labels is the decoded (headers, row_labels) pair, or None
+    when the row was scored from its packed signature and not decoded.
+
+    Cross-company queries use the token index when tables.db has one; a ticker
+    filter already narrows the scan to that company's rows via tables_ticker.
+    Indexed rows are scored from their packed token ids, the rest from JSON.
+    Every path yields identical matches, except that approx_recall (0-1)
+    switches cross-company queries to MinHash/LSH candidates: scores stay
+    exact, but a match at the threshold is missed with probability at most
+    about 1 - approx_recall (higher-scoring matches are missed less often).
+    """
+    clock = StageClock()
+    try:
+        signed = use_index and table_index_ready(conn)
+        if signed and not ticker_filter:
+            rows = _candidate_rows(conn, headers, row_labels, approx_recall)
+        elif ticker_filter:
+            rows = conn.execute(
+                (_SIGNED_ROWS_SQL + " WHERE t.ticker = ?") if signed
+                else "SELECT rowid AS table_rowid, * FROM tables WHERE ticker = ?",
+                (ticker_filter,),
+            )
+        else:
+            rows = conn.execute("SELECT rowid AS table_rowid, * FROM tables")
+
+        if signed:
+            h_tokens, r_tokens = normalize_labels(headers), normalize_labels(row_labels)
+            query = (label_kind(headers), len(h_tokens), query_token_ids(conn, h_tokens),
+                     label_kind(row_labels), len(r_tokens), query_token_ids(conn, r_tokens))
+        clock.lap("db")
+
+        # Spans: "db" is the query and row fetches, "decode" the JSON label
+        # parsing, "score" the Jaccard / sig_overlap arithmetic.
+        for row in rows:
+            clock.lap("db")
+            if signed and row["sig_h_ids"] is not None:
+                h_kind, h_card, h_ids, r_kind, r_card, r_ids = query
+                score = (
+                    0.6 * packed_jaccard(h_kind, h_card, h_ids, row["sig_h_kind"], row["sig_h_card"], row["sig_h_ids"])
+                    + 0.4 * packed_jaccard(r_kind, r_card, r_ids, row["sig_r_kind"], row["sig_r_card"], row["sig_r_ids"]))
+                clock.lap("score")
+                if score >= SIMILARITY_THRESHOLD:
+                    yield score, row["table_rowid"], row, None
+                    clock.resume()
+                continue
+            try:
+                labels = decode_labels(row["headers"]), decode_labels(row["row_labels"])
+            except (json.JSONDecodeError, KeyError):
+                clock.lap("decode")
+                continue
+            clock.lap("decode")
+
+            score = sig_overlap(headers, row_labels, *labels)
+            clock.lap("score")
+            if score >= SIMILARITY_THRESHOLD:
+                yield score, row["table_rowid"], row, labels
+                clock.resume()
+    finally:
+        clock.flush()
+
+
+def similar_table_result(score, row, labels=None, include_labels=True):
+    """API result dict for one match from iter_similar_tables()."""
+    result = {
+        "filing_id": row["filing_id"],
+        "ticker": row["ticker"],
+        "form_type": row["form_type"],
+        "filed_date": row["filed_date"],
+        "table_idx": row["table_idx"],
+        "score": round(score, 4),
+    }
+    if include_labels:
+        if labels is None:
+            labels = decode_labels(row["headers"]), decode_labels(row["row_labels"])
+        result["headers"], result["row_labels"] = labels
+    result["row_count"] = row["row_count"] if "row_count" in row.keys() else 0
+    return result
+
+
+def _similar_order(match):
+    """Sort key for matches: score descending (as reported), then rowid."""
+    return -round(match[0], 4), match[1]
+
+
+def encode_similar_cursor(match):
+    return base64.urlsafe_b64encode(json.dumps(_similar_order(match)).encode("utf-8")).decode("ascii")
+
+
+def decode_similar_cursor(cursor):
+    """Sort key of the last match on the previous page; ValueError if malformed."""
+    try:
+        neg_score, rowid = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        return float(neg_score), int(rowid)
+    except (ValueError, TypeError, UnicodeError):
+        raise ValueError("invalid cursor")
+
+
+def top_similar_tables(matches, limit=None, after=None):
+    """
+    Matches in result order, starting after the cursor key `after`.
+
+    With a limit, a bounded heap keeps only limit + 1 matches; returns
+    (page, next_cursor) where next_cursor is None on the last page.
+    """
+    if after is not None:
+        matches = (m for m in matches if _similar_order(m) > after)
+    if limit is None:
+        return sorted(matches, key=_similar_order), None
+    page = heapq.nsmallest(limit + 1, matches, key=_similar_order)
+    if len(page) > limit:
+        return page[:limit], encode_similar_cursor(page[limit - 1])
+    return page, None
+
+
+def find_similar_tables(conn, headers, row_labels, ticker_filter=None, use_index=True, approx_recall=None):
+    """Score tables against a query signature; returns results sorted by score."""
+    page, _ = top_similar_tables(
+        iter_similar_tables(conn, headers, row_labels, ticker_filter, use_index, approx_recall)
+    )
+    return [similar_table_result(score, row, labels) for score, _, row, labels in page]
+
+
+def _set_jaccard(q_kind, q_tokens, t_kind, t_tokens):
+    """packed_jaccard() over normalized token sets, for rows without a packed signature."""
+    if q_kind == 0 or t_kind == 0:
+        return 1.0 if q_kind == t_kind else 0.0
+    if not q_tokens and not t_tokens:
+        return 1.0
+    intersection = len(q_tokens & t_tokens)
+    return intersection / (len(q_tokens) + len(t_tokens) - intersection)
+
+
+def iter_similar_batch(conn, queries, exclude_filing=None, use_index=True):
+    """
+    Yield (query index, score, rowid, row, labels) for every query/table pair
+    reaching the threshold, reading and decoding each table at most once.
+
+    queries is a list of (headers, row_labels, ticker or None); each query's
+    matches equal iter_similar_tables() in exact mode. With the token index
+    the rows read are the union of the cross-company queries' candidates, the
+    unindexed rows and the filtered tickers' rows; without it, one scan (of
+    the filtered tickers only, when every query has one) serves all queries.
+    """
+    clock = StageClock()
+    try:
+        prepared = [(label_kind(h), normalize_labels(h), label_kind(r), normalize_labels(r)) for h, r, _ in queries]
+        by_ticker = {}
+        cross = []
+        for i, (_, _, ticker) in enumerate(queries):
+            if ticker:
+                by_ticker.setdefault(ticker, []).append(i)
+            else:
+                cross.append(i)
+
+        signed = use_index and table_index_ready(conn)
+        if signed:
+            tokens = set().union(*(q[1] | q[3] for q in prepared))
+            vocab = dict(conn.execute(
+                "SELECT token, token_id FROM table_vocab WHERE token IN (SELECT value FROM json_each(?))",
+                (json.dumps(sorted(tokens)),),
+            ))
+            packed = [(h_kind, len(h), frozenset(vocab[t] for t in h if t in vocab),
+                       r_kind, len(r), frozenset(vocab[t] for t in r if t in vocab))
+                      for h_kind, h, r_kind, r in prepared]
+            candidates = {}
+            for i in cross:
+                for table_id in _indexed_candidate_ids(conn, queries[i][0], queries[i][1]):
+                    candidates.setdefault(table_id, []).append(i)
+            ids = [*candidates]
+            if cross:
+                ids += [r[0] for r in conn.execute("SELECT table_id FROM table_index_dirty")]
+            rows = conn.execute(
+                _SIGNED_ROWS_SQL + " WHERE t.rowid IN (SELECT value FROM json_each(?))"
+                " OR t.ticker IN (SELECT value FROM json_each(?)) ORDER BY t.rowid",
+                (json.dumps(ids), json.dumps(sorted(by_ticker))),
+            )
+        elif cross:
+            rows = conn.execute("SELECT rowid AS table_rowid, * FROM tables")
+        else:
+            rows = conn.execute(
+                "SELECT rowid AS table_rowid, * FROM tables WHERE ticker IN (SELECT value FROM json_each(?))",
+                (json.dumps(sorted(by_ticker)),),
+            )
+        clock.lap("db")
+
+        for row in rows:
+            clock.lap("db")
+            if exclude_filing and row["filing_id"] == exclude_filing:
+                continue
+            rowid = row["table_rowid"]
+            same_ticker = by_ticker.get(row["ticker"], [])
+            if signed and row["sig_h_ids"] is not None:
+                t_h = (row["sig_h_kind"], row["sig_h_card"], row["sig_h_ids"])
+                t_r = (row["sig_r_kind"], row["sig_r_card"], row["sig_r_ids"])
+                for i in chain(candidates.get(rowid, ()), same_ticker):
+                    h_kind, h_card, h_ids, r_kind, r_card, r_ids = packed[i]
+                    score = (0.6 * packed_jaccard(h_kind, h_card, h_ids, *t_h)
+                             + 0.4 * packed_jaccard(r_kind, r_card, r_ids, *t_r))
+                    if score >= SIMILARITY_THRESHOLD:
+                        clock.lap("score")
+                        yield i, score, rowid, row, None
+                        clock.resume()
+                clock.lap("score")
+                continue
+            try:
+                labels = decode_labels(row["headers"]), decode_labels(row["row_labels"])
+            except (json.JSONDecodeError, KeyError):
+                clock.lap("decode")
+                continue
+            t_h_kind, t_h = label_kind(labels[0]), normalize_labels(labels[0])
+            t_r_kind, t_r = label_kind(labels[1]), normalize_labels(labels[1])
+            clock.lap("decode")
+            for i in chain(cross, same_ticker):
+                h_kind, h, r_kind, r = prepared[i]
+                score = 0.6 * _set_jaccard(h_kind, h, t_h_kind, t_h) + 0.4 * _set_jaccard(r_kind, r, t_r_kind, t_r)
+                if score >= SIMILARITY_THRESHOLD:
+                    clock.lap("score")
+                    yield i, score, rowid, row, labels
+                    clock.resume()
+            clock.lap("score")
+    finally:
+        clock.flush()
+
+
+def find_similar_tables_batch(conn, queries, limit=SIMILAR_BATCH_DEFAULT_LIMIT, exclude_filing=None,
+                              include_labels=True, use_index=True):
+    """Top `limit` results per query (see iter_similar_batch), in query order."""
+    matches = [[] for _ in queries]
+    for i, score, rowid, row, labels in iter_similar_batch(conn, queries, exclude_filing, use_index):
+        matches[i].append((score, rowid, row, labels))
+    return [
+        [similar_table_result(score, row, labels, include_labels)
+         for score, _, row, labels in top_similar_tables(found, limit)[0]]
+        for found in matches
+    ]
+
+
+# Lineage: for every table, its best match (by sig_overlap, at or above the
+# threshold) in each earlier filing of the same ticker, so /tables/lineage is
+# one indexed lookup. lineage_filings records the filings already linked;
+# triggers drop a filing from it (and its links from table_lineage) when its
+# rows change, so update_table_lineage() only links new or re-ingested
+# filings against the rest of their ticker, in both directions.
+TABLE_LINEAGE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS table_lineage (
+    table_id INTEGER NOT NULL,
+    prior_filing_id TEXT NOT NULL,
+    prior_table_id INTEGER NOT NULL,
+    score REAL NOT NULL,
+    PRIMARY KEY (table_id, prior_filing_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS table_lineage_prior ON table_lineage(prior_table_id);
+CREATE TABLE IF NOT EXISTS lineage_filings (
+    filing_id TEXT PRIMARY KEY,
+    ticker TEXT,
+    linked_at REAL
+);
+CREATE TRIGGER IF NOT EXISTS tables_lineage_insert AFTER INSERT ON tables BEGIN
+    DELETE FROM lineage_filings WHERE filing_id = new.filing_id;
+END;
+CREATE TRIGGER IF NOT EXISTS tables_lineage_update AFTER UPDATE OF filing_id, ticker, filed_date, headers, row_labels
+ON tables BEGIN
+    DELETE FROM table_lineage WHERE table_id = old.rowid OR prior_table_id = old.rowid;
+    DELETE FROM lineage_filings WHERE filing_id IN (old.filing_id, new.filing_id);
+END;
+CREATE TRIGGER IF NOT EXISTS tables_lineage_delete AFTER DELETE ON tables BEGIN
+    DELETE FROM table_lineage WHERE table_id = old.rowid OR prior_table_id = old.rowid;
+    DELETE FROM lineage_filings WHERE filing_id = old.filing_id;
+END;
+"""
+
+
+def table_lineage_ready(conn):
+    """True if tables.db has the lineage tables (update_table_lineage() has run)."""
+    return conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'lineage_filings'"
+    ).fetchone() is not None
+
+
+def _best_prior_matches(tables, prior):
+    """
+    (table_id, prior_table_id, score) for each table with a match in `prior`
+    (one filing's tables), keeping the best; ties go to the lowest rowid.
+    Both are lists of (rowid, h_kind, h_tokens, r_kind, r_tokens).
+    """
+    out = []
+    for table_id, h_kind, h, r_kind, r in tables:
+        best = None
+        for prior_id, p_h_kind, p_h, p_r_kind, p_r in prior:
+            score = 0.6 * _set_jaccard(h_kind, h, p_h_kind, p_h) + 0.4 * _set_jaccard(r_kind, r, p_r_kind, p_r)
+            if score >= SIMILARITY_THRESHOLD and (best is None or score > best[1]):
+                best = prior_id, score
+        if best is not None:
+            out.append((table_id, best[0], best[1]))
+    return out
+
+
+def _link_ticker(conn, ticker, pending):
+    """Link each pending filing of ticker against the linked ones; returns links written."""
+    filings = {}
+    for rowid, filing_id, filed_date, raw_headers, raw_rows in conn.execute(
+            "SELECT rowid, filing_id, filed_date, headers, row_labels FROM tables WHERE ticker = ? ORDER BY rowid",
+            (ticker,)):
+        try:
+            headers, row_labels = decode_labels(raw_headers), decode_labels(raw_rows)
+        except json.JSONDecodeError:
+            continue
+        entry = filings.setdefault(filing_id, [filed_date or "", []])
+        entry[1].append((rowid, label_kind(headers), normalize_labels(headers),
+                         label_kind(row_labels), normalize_labels(row_labels)))
+    linked = {r[0] for r in conn.execute("SELECT filing_id FROM lineage_filings WHERE ticker = ?", (ticker,))}
+    written = 0
+    for filing_id in sorted(pending, key=lambda f: (filings.get(f, [""])[0], f)):
+        conn.execute(
+            "DELETE FROM table_lineage WHERE table_id IN (SELECT rowid FROM tables WHERE filing_id = ?)"
+            " OR prior_filing_id = ?", (filing_id, filing_id))
+        if filing_id in filings:
+            order, tables = (filings[filing_id][0], filing_id), filings[filing_id][1]
+            links = []
+            for other in linked:
+                other_date, other_tables = filings.get(other, ("", []))
+                if (other_date, other) < order:
+                    links += [(t, other, p, s) for t, p, s in _best_prior_matches(tables, other_tables)]
+                else:
+                    links += [(t, filing_id, p, s) for t, p, s in _best_prior_matches(other_tables, tables)]
+            conn.executemany(
+                "INSERT OR REPLACE INTO table_lineage (table_id, prior_filing_id, prior_table_id, score)"
+                " VALUES (?, ?, ?, ?)", links)
+            written += len(links)
+        conn.execute("INSERT OR REPLACE INTO lineage_filings (filing_id, ticker, linked_at) VALUES (?, ?, ?)",
+                     (filing_id, ticker, time.time()))
+        linked.add(filing_id)
+    return written
+
+
+def update_table_lineage(conn, rebuild=False, tickers=None):
+    """
+    Link filings not yet in lineage_filings (all of them on the first run or
+    with rebuild=True), one transaction per ticker. Returns
+    (filings linked, links written).
+    """
+    conn.executescript(TABLE_LINEAGE_SCHEMA)
+    if rebuild:
+        with conn:
+            conn.execute("DELETE FROM table_lineage")
+            conn.execute("DELETE FROM lineage_filings")
+    pending = {}
+    for filing_id, ticker in conn.execute(
+            "SELECT DISTINCT filing_id, ticker FROM tables"
+            " WHERE filing_id NOT IN (SELECT filing_id FROM lineage_filings)"):
+        if ticker and (not tickers or ticker in tickers):
+            pending.setdefault(ticker, set()).add(filing_id)
+    filings = links = 0
+    for ticker, filing_ids in sorted(pending.items()):
+        with conn:
+            links += _link_ticker(conn, ticker, filing_ids)
+        filings += len(filing_ids)
+    return filings, links
+
+
+@timed("db")
+def table_lineage(conn, filing_id, table_idx):
+    """(table row, [(score, prior row), ...] newest first), or None if no such table."""
+    table = conn.execute(
+        "SELECT rowid AS table_rowid, * FROM tables WHERE filing_id = ? AND table_idx = ?",
+        (filing_id, table_idx)).fetchone()
+    if table is None:
+        return None
+    if not table_lineage_ready(conn):
+        return table, []
+    chain_rows = conn.execute(
+        "SELECT l.score AS lineage_score, t.rowid AS table_rowid, t.* FROM table_lineage l"
+        " JOIN tables t ON t.rowid = l.prior_table_id WHERE l.table_id = ?"
+        " ORDER BY t.filed_date DESC, t.filing_id DESC",
+        (table["table_rowid"],)).fetchall()
+    return table, [(row["lineage_score"], row) for row in chain_rows]
+
+
+# ─────────────────────────────────────────────
+# Table ingestion
+# ─────────────────────────────────────────────
+# `api.py ingest-tables` fills tables.db: filings are listed from EDGAR,
+# fetched through the /edgar/document path (filing store, rate limiter) and
+# parsed in a process pool; the parent writes batches of results in WAL mode
+# and records each filing in ingest_checkpoint, so a rerun skips finished work.
+TABLE_INGEST_SCHEMA = """
+CREATE INDEX IF NOT EXISTS tables_filing ON tables(filing_id);
+CREATE TABLE IF NOT EXISTS ingest_checkpoint (
+    filing_id TEXT PRIMARY KEY,
+    ticker TEXT,
+    status TEXT NOT NULL,
+    tables INTEGER DEFAULT 0,
+    error TEXT,
+    updated_at REAL
+);
+"""
+
+IngestJob = namedtuple("IngestJob", "filing_id ticker cik form_type filed_date filename")
+INGEST_DEFAULT_FORMS = ("10-K", "10-Q")
+
+# JS String.prototype.trim() / \s, which app.js uses on cell text.
+_JS_SPACE = re.compile(r"[\s\ufeff]+")
+
+
+def _cell_text(parts):
+    """Cell textContent the way buildTableSignature() normalizes it."""
+    return _JS_SPACE.sub(" ", "".join(parts)).strip(" ").lower()
+
+
+class _Table:
+    __slots__ = ("rows", "in_thead")
+
+    def __init__(self):
+        self.rows = []
+        self.in_thead = False
+
+
+class _Row:
+    __slots__ = ("table", "cells", "in_thead")
+
+    def __init__(self, table):
+        self.table = table
+        self.cells = []
+        self.in_thead = table.in_thead
+
+
+class _Cell:
+    __slots__ = ("row", "parts")
+
+    def __init__(self, row):
+        self.row = row
+        self.parts = []
+
+
+class TableParser(HTMLParser):
+    """
+    Collects every <table> in document order with the rows and cells that
+    querySelectorAll() would return for it (nested tables' rows included),
+    closing cells and rows implicitly the way browsers do.
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.tables = []
+        self.open_tables = []
+        self.open_rows = []
+        self.open_cells = []
+
+    def _close_cells(self, row):
+        while self.open_cells and self.open_cells[-1].row is row:
+            self.open_cells.pop()
+
+    def _close_rows(self, table):
+        while self.open_rows and self.open_rows[-1].table is table:
+            self._close_cells(self.open_rows.pop())
+
+    def _start_row(self, table):
+        self._close_rows(table)
+        row = _Row(table)
+        for t in self.open_tables:
+            t.rows.append(row)
+        self.open_rows.append(row)
+        return row
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "table":
+            table = _Table()
+            self.tables.append(table)
+            self.open_tables.append(table)
+        elif not self.open_tables:
+            return
+        elif tag in ("thead", "tbody", "tfoot"):
+            table = self.open_tables[-1]
+            self._close_rows(table)
+            table.in_thead = tag == "thead"
+        elif tag == "tr":
+            self._start_row(self.open_tables[-1])
+        elif tag in ("td", "th"):
+            table = self.open_tables[-1]
+            if self.open_rows and self.open_rows[-1].table is table:
+                row = self.open_rows[-1]
+                self._close_cells(row)
+            else:
+                row = self._start_row(table)
+            cell = _Cell(row)
+            for r in self.open_rows:
+                r.cells.append(cell)
+            self.open_cells.append(cell)
+
+    def handle_endtag(self, tag):
+        if not self.open_tables:
+            return
+        table = self.open_tables[-1]
+        if tag == "table":
+            self._close_rows(table)
+            self.open_tables.pop()
+        elif tag in ("thead", "tbody", "tfoot"):
+            self._close_rows(table)
+            table.in_thead = False
+        elif tag == "tr":
+            self._close_rows(table)
+        elif tag in ("td", "th"):
+            if self.open_rows and self.open_rows[-1].table is table:
+                self._close_cells(self.open_rows[-1])
+
+    def handle_data(self, data):
+        for cell in self.open_cells:
+            cell.parts.append(data)
+
+
+def table_signature(table):
+    """(headers, row_labels, row_count) for a parsed table, as app.js buildTableSignature() builds them."""
+    thead_rows = [row for row in table.rows if row.in_thead]
+    header_row = thead_rows[0] if thead_rows else (table.rows[0] if table.rows else None)
+    headers = []
+    if header_row is not None:
+        headers = [text for text in (_cell_text(c.parts) for c in header_row.cells) if text]
+    row_labels = []
+    for i, row in enumerate(table.rows):
+        if i == 0 and not thead_rows:
+            continue
+        if row.cells:
+            text = _cell_text(row.cells[0].parts)
+            if len(text) > 1:
+                row_labels.append(text)
+    return headers, row_labels, len(table.rows)
+
+
+def filing_table_signatures(gz):
+    """Signatures of every table in a processed filing (gzip bytes), parsed incrementally."""
+    parser = TableParser()
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    for chunk in gunzip_chunks(gz):
+        parser.feed(decoder.decode(chunk))
+    parser.feed(decoder.decode(b"", final=True))
+    parser.close()
+    return [table_signature(t) for t in parser.tables]
+
+
+def _ingest_worker_init():
+    # Forked workers must not share the parent's pooled sockets or in-flight
+    # state; filing store eviction is left to the parent.
+    global _upstream, _single_flight
+    _upstream = UpstreamClient()
+    _single_flight = SingleFlight()
+    _request.after = AfterResponseQueue()
+
+
+def ingest_filing(job):
+    """Worker: fetch one filing through the document path and return its table signatures."""
+    try:
+        gz = filing_document_gz(job.cik, job.filing_id.replace("-", ""), job.filename)
+        return filing_table_signatures(gz)
+    finally:
+        if getattr(_request, "after", None) is not None:
+            _request.after.clear()
+
+
+def _iter_lines(resp):
+    """Decoded lines of a streaming upstream response."""
+    tail = b""
+    for chunk in iter(partial(resp.read, FILING_CHUNK_SIZE), b""):
+        lines = (tail + chunk).split(b"\n")
+        tail = lines.pop()
+        for line in lines:
+            yield line.decode("latin-1")
+    if tail:
+        yield tail.decode("latin-1")
+
+
+def _full_index_ciks(date_from, date_to, forms):
+    """CIKs with a filing of one of `forms` in [date_from, date_to], from EDGAR's quarterly form.idx."""
+    start = datetime.date.fromisoformat(date_from)
+    end = datetime.date.fromisoformat(date_to) if date_to else datetime.date.today()
+    ciks = set()
+    year, quarter = start.year, (start.month - 1) // 3 + 1
+    while (year, quarter) <= (end.year, (end.month - 1) // 3 + 1):
+        url = f"https://www.sec.gov/Archives/edgar/full-index/{year}/QTR{quarter}/form.idx"
+        with edgar_open(url) as resp:
+            started = False
+            for line in _iter_lines(resp):
+                if not started:
+                    started = line.startswith("---")
+                    continue
+                parts = line.split()
+                if len(parts) < 4 or line[:12].strip() not in forms:
+                    continue
+                filed = parts[-2]
+                if len(filed) == 8 and filed.isdigit():
+                    filed = f"{filed[:4]}-{filed[4:6]}-{filed[6:]}"
+                if start.isoformat() <= filed <= end.isoformat():
+                    ciks.add(parts[-3].zfill(10))
+        year, quarter = (year + 1, 1) if quarter == 4 else (year, quarter + 1)
+    return ciks
+
+
+def ingest_jobs(tickers=None, date_from=None, date_to=None, forms=INGEST_DEFAULT_FORMS):
+    """
+    IngestJobs for the given tickers, or, without tickers, for every company
+    with a ticker that filed one of `forms` between date_from and date_to.
+    """
+    forms = set(forms)
+    ticker_map = company_ticker_map()
+    if tickers:
+        companies = []
+        for ticker in tickers:
+            cik = ticker_map.cik(ticker)
+            if cik is None:
+                print(f"{ticker}: CIK not found, skipped", file=sys.stderr)
+            else:
+                companies.append((ticker.upper(), cik))
+    else:
+        companies = sorted(
+            (ticker_map.ticker(cik), cik) for cik in _full_index_ciks(date_from, date_to, forms)
+            if ticker_map.ticker(cik)
+        )
+    for ticker, cik in companies:
+        try:
+            submissions = edgar_submissions(cik)
+            cursor = (0, 0)
+            while cursor is not None:
+                columns, next_cursor = select_filings(
+                    submissions, forms, date_from, date_to, FILINGS_MAX_PAGE_SIZE, cursor)
+                for filing_id, form, filed, filename in zip(
+                        columns["filingId"], columns["formType"], columns["filingDate"], columns["primaryDocument"]):
+                    if filename:
+                        yield IngestJob(filing_id, ticker, cik.lstrip("0"), form, filed, filename)
+                cursor = next_cursor and decode_filings_cursor(next_cursor)
+        except Exception as e:
+            print(f"{ticker}: filing list failed: {e}", file=sys.stderr)
+
+
+def _write_ingested(conn, results):
+    """One transaction for a batch of (job, signatures or None, error) results."""
+    now = time.time()
+    with conn:
+        for job, signatures, error in results:
+            if error is not None:
+                conn.execute(
+                    "INSERT OR REPLACE INTO ingest_checkpoint (filing_id, ticker, status, tables, error, updated_at)"
+                    " VALUES (?, ?, 'failed', 0, ?, ?)", (job.filing_id, job.ticker, error, now))
+                continue
+            conn.execute("DELETE FROM tables WHERE filing_id = ?", (job.filing_id,))
+            conn.executemany(
+                "INSERT INTO tables (filing_id, ticker, form_type, filed_date, table_idx,"
+                " headers, row_labels, row_count) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                [(job.filing_id, job.ticker, job.form_type, job.filed_date, idx,
+                  json.dumps(headers), json.dumps(row_labels), row_count)
+                 for idx, (headers, row_labels, row_count) in enumerate(signatures)])
+            conn.execute(
+                "INSERT OR REPLACE INTO ingest_checkpoint (filing_id, ticker, status, tables, error, updated_at)"
+                " VALUES (?, ?, 'done', ?, NULL, ?)", (job.filing_id, job.ticker, len(signatures), now))
+
+
+def ingest_tables(conn, jobs, workers=None, batch_size=25, report_every=5.0):
+    """
+    Parse `jobs` in a process pool and write their tables to conn.
+
+    Filings already marked done in ingest_checkpoint are skipped; failed ones
+    are retried. Progress (filings, tables, tables/s) goes to stderr every
+    report_every seconds. Returns (filings done, tables written, failed, seconds).
+    """
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.executescript(TABLES_SCHEMA)
+    conn.executescript(TABLE_INGEST_SCHEMA)
+    finished = {r[0] for r in conn.execute("SELECT filing_id FROM ingest_checkpoint WHERE status = 'done'")}
+    pending = [job for job in dict.fromkeys(jobs) if job.filing_id not in finished]
+    print(f"{len(pending)} filings to ingest ({len(finished)} already done)", file=sys.stderr)
+
+    started = last_report = time.monotonic()
+    done = tables = failed = 0
+    batch = []
+    window = (workers or os.cpu_count() or 1) * 4
+    with ProcessPoolExecutor(max_workers=workers, initializer=_ingest_worker_init) as pool:
+        queue = iter(pending)
+        running = {}
+        while True:
+            for job in queue:
+                running[pool.submit(ingest_filing, job)] = job
+                if len(running) >= window:
+                    break
+            if not running:
+                break
+            completed, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in completed:
+                job = running.pop(future)
+                try:
+                    signatures = future.result()
+                except Exception as e:
+                    batch.append((job, None, str(e) or type(e).__name__))
+                    failed += 1
+                    print(f"{job.ticker} {job.filing_id}: {e}", file=sys.stderr)
+                else:
+                    batch.append((job, signatures, None))
+                    done += 1
+                    tables += len(signatures)
+            if len(batch) >= batch_size:
+                _write_ingested(conn, batch)
+                batch = []
+            now = time.monotonic()
+            if now - last_report >= report_every:
+                last_report = now
+                print(f"{done + failed}/{len(pending)} filings, {tables} tables,"
+                      f" {tables / (now - started):.1f} tables/s, {failed} failed", file=sys.stderr)
+    if batch:
+        _write_ingested(conn, batch)
+    if _stored_index_version(conn):
+        index_tables(conn)
+    if table_lineage_ready(conn):
+        update_table_lineage(conn)
+    _filing_store.evict()
+    return done, tables, failed, time.monotonic() - started
+
+
+# ─────────────────────────────────────────────
+# XBRL facts
+# ─────────────────────────────────────────────
+# ingest-facts loads SEC companyfacts JSON (every XBRL fact a company has
+# filed, by taxonomy, concept and unit) into facts.db, so /facts can answer
+# many tickers x concepts with one indexed query instead of a fiscal.ai or
+# EDGAR call per company. Each (cik, concept, period, unit) keeps the value
+# from its most recent filing, so restatements win over originals. Concept
+# names are interned in fact_concepts.
+FACTS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS fact_concepts (
+    concept_id INTEGER PRIMARY KEY,
+    concept TEXT NOT NULL UNIQUE,
+    name TEXT NOT NULL,
+    label TEXT
+);
+CREATE INDEX IF NOT EXISTS fact_concepts_name ON fact_concepts(name);
+CREATE TABLE IF NOT EXISTS facts (
+    cik INTEGER NOT NULL,
+    concept_id INTEGER NOT NULL,
+    period_end TEXT NOT NULL,
+    period_start TEXT NOT NULL,
+    unit TEXT NOT NULL,
+    days INTEGER NOT NULL,
+    value NUMERIC NOT NULL,
+    fy INTEGER,
+    fp TEXT,
+    form TEXT,
+    filed TEXT,
+    accession TEXT,
+    frame TEXT,
+    PRIMARY KEY (cik, concept_id, period_end, period_start, unit)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS fact_companies (
+    cik INTEGER PRIMARY KEY,
+    ticker TEXT,
+    name TEXT,
+    source TEXT,
+    facts INTEGER,
+    ingested_at REAL
+);
+"""
+COMPANYFACTS_URL = "https://data.sec.gov/api/xbrl/companyfacts/CIK{cik}.json"
+# Period lengths in days (end - start) for /facts?period=; instants have no start.
+FACT_PERIODS = {
+    "annual": "f.days BETWEEN 340 AND 390",
+    "quarterly": "f.days BETWEEN 80 AND 100",
+    "instant": "f.days = 0",
+    "all": "1",
+}
+FACT_COLUMNS = ("start", "end", "value", "fy", "fp", "form", "filed", "accession", "frame")
+
+FactsJob = namedtuple("FactsJob", "cik ticker path")
+
+
+def companyfacts_rows(data):
+    """
+    (concept, label, unit, start, end, days, value, fy, fp, form, filed,
+    accession, frame) for every fact in a companyfacts document, keeping the
+    latest filing's value per period. SEC sets `frame` on just one of the
+    duplicates, so it is carried over to whichever copy is kept.
+    """
+    best = {}
+    for taxonomy, concepts in (data.get("facts") or {}).items():
+        for name, concept in concepts.items():
+            key_concept = f"{taxonomy}:{name}"
+            label = concept.get("label") or name
+            for unit, facts in (concept.get("units") or {}).items():
+                for fact in facts:
+                    end, value = fact.get("end"), fact.get("val")
+                    if not end or not isinstance(value, (int, float)) or isinstance(value, bool):
+                        continue
+                    start = fact.get("start") or ""
+                    key = (key_concept, unit, start, end)
+                    rank = (fact.get("filed") or "", fact.get("accn") or "")
+                    old = best.get(key)
+                    frame = fact.get("frame") or (old[2] if old else None)
+                    if old is None or rank >= old[0]:
+                        best[key] = (rank, fact, frame, label)
+                    elif frame and not old[2]:
+                        best[key] = (old[0], old[1], frame, old[3])
+    rows = []
+    for (concept, unit, start, end), (_, fact, frame, label) in best.items():
+        try:
+            days = (datetime.date.fromisoformat(end) - datetime.date.fromisoformat(start)).days if start else 0
+        except ValueError:
+            continue
+        rows.append((concept, label, unit, start, end, days, fact["val"], fact.get("fy"), fact.get("fp"),
+                     fact.get("form"), fact.get("filed"), fact.get("accn"), frame))
+    return rows
+
+
+def load_companyfacts(job):
+    """Worker: one company's companyfacts document, from job.path or data.sec.gov."""
+    if job.path:
+        with open(job.path, encoding="utf-8") as f:
+            return json.load(f)
+    return json.loads(edgar_get(COMPANYFACTS_URL.format(cik=str(job.cik).zfill(10))))
+
+
+def _fixture_source(path):
+    st = os.stat(path)
+    return f"file:{os.path.abspath(path)}:{st.st_size}:{st.st_mtime_ns}"
+
+
+def facts_jobs(tickers=None, fixtures=None):
+    """
+    FactsJobs for the given tickers, or, without tickers, for every CIK*.json
+    in the fixtures directory (the layout of SEC's bulk companyfacts.zip).
+    """
+    ticker_map = company_ticker_map()
+    if tickers:
+        for ticker in tickers:
+            cik = ticker_map.cik(ticker)
+            if cik is None:
+                print(f"{ticker}: CIK not found, skipped", file=sys.stderr)
+                continue
+            path = os.path.join(fixtures, f"CIK{cik.zfill(10)}.json") if fixtures else None
+            if path and not os.path.exists(path):
+                print(f"{ticker}: {path} not found, skipped", file=sys.stderr)
+                continue
+            yield FactsJob(int(cik), ticker.upper(), path)
+        return
+    for name in sorted(os.listdir(fixtures)):
+        m = re.fullmatch(r"CIK(\d{10})\.json", name)
+        if m:
+            yield FactsJob(int(m.group(1)), ticker_map.ticker(m.group(1)) or "", os.path.join(fixtures, name))
+
+
+def _add_concepts(conn, rows, ids):
+    """Add the concepts in rows missing from ids (concept -> concept_id) to fact_concepts and ids."""
+    for concept, label, *_ in rows:
+        if concept not in ids:
+            ids[concept] = conn.execute(
+                "INSERT INTO fact_concepts (concept, name, label) VALUES (?, ?, ?)",
+                (concept, concept.partition(":")[2], label)).lastrowid
+
+
+def _write_company_facts(conn, job, data, source, ids):
+    """Replace one company's facts in a single transaction; returns the fact count."""
+    rows = companyfacts_rows(data)
+    with conn:
+        _add_concepts(conn, rows, ids)
+        conn.execute("DELETE FROM facts WHERE cik = ?", (job.cik,))
+        conn.executemany(
+            "INSERT INTO facts (cik, concept_id, unit, period_start, period_end, days, value, fy, fp, form,"
+            " filed, accession, frame) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            [(job.cik, ids[concept], *rest) for concept, _, *rest in rows])
+        conn.execute(
+            "INSERT OR REPLACE INTO fact_companies (cik, ticker, name, source, facts, ingested_at)"
+            " VALUES (?, ?, ?, ?, ?, ?)",
+            (job.cik, job.ticker, data.get("entityName", ""), source, len(rows), time.time()))
+    return len(rows)
+
+
+def ingest_facts(conn, jobs, workers=4, max_age=24 * 3600, refresh=False):
+    """
+    Load companyfacts for `jobs` into conn. Downloads run in a thread pool
+    (the upstream client rate-limits data.sec.gov); each company is written
+    in its own transaction. Companies ingested from the same fixture file,
+    or downloaded less than max_age seconds ago, are skipped unless refresh.
+    Returns (companies written, facts written, skipped, failed, seconds).
+    """
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.executescript(FACTS_SCHEMA)
+    known = {cik: (source, at) for cik, source, at in
+             conn.execute("SELECT cik, source, ingested_at FROM fact_companies")}
+    pending = []
+    skipped = 0
+    for job in dict.fromkeys(jobs):
+        source = _fixture_source(job.path) if job.path else "sec"
+        seen = known.get(job.cik)
+        if not refresh and seen and seen[0] == source and (job.path or time.time() - seen[1] < max_age):
+            skipped += 1
+        else:
+            pending.append((job, source))
+    print(f"{len(pending)} companies to ingest ({skipped} up to date)", file=sys.stderr)
+
+    ids = dict(conn.execute("SELECT concept, concept_id FROM fact_concepts"))
+    started = time.monotonic()
+    companies = facts = failed = 0
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        # A bounded window keeps at most a few parsed documents in memory.
+        queue = iter(pending)
+        running = {}
+        while True:
+            for job, source in queue:
+                running[pool.submit(load_companyfacts, job)] = (job, source)
+                if len(running) >= workers * 2:
+                    break
+            if not running:
+                break
+            completed, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in completed:
+                job, source = running.pop(future)
+                try:
+                    facts += _write_company_facts(conn, job, future.result(), source, ids)
+                    companies += 1
+                except Exception as e:
+                    failed += 1
+                    print(f"{job.ticker or job.cik}: {e}", file=sys.stderr)
+                    # A rolled-back write may have added concepts that are gone again.
+                    ids = dict(conn.execute("SELECT concept, concept_id FROM fact_concepts"))
+    return companies, facts, skipped, failed, time.monotonic() - started
+
+
+@timed("db")
+def query_facts(conn, ciks, concepts, period="all", date_from=None, date_to=None, unit=None):
+    """
+    Time series for every (cik, concept, unit) among `ciks` x `concepts`, in
+    one query. Concepts are "taxonomy:Name" or a bare Name matched in any
+    taxonomy. Returns [(cik, concept, label, unit, {column: [...]})], each
+    series ordered by period end, then start.
+    """
+    sql = (
+        "SELECT f.cik, c.concept, c.label, f.unit, f.period_start, f.period_end, f.value, f.fy, f.fp,"
+        " f.form, f.filed, f.accession, f.frame"
+        " FROM facts f JOIN fact_concepts c ON c.concept_id = f.concept_id"
+        " WHERE f.cik IN (SELECT value FROM json_each(?))"
+        " AND f.concept_id IN (SELECT concept_id FROM fact_concepts"
+        "  WHERE concept IN (SELECT value FROM json_each(?)) OR name IN (SELECT value FROM json_each(?)))"
+        f" AND {FACT_PERIODS[period]}"
+    )
+    args = [json.dumps(list(ciks)), json.dumps(list(concepts)), json.dumps(list(concepts))]
+    for clause, value in (("f.period_end >= ?", date_from), ("f.period_end <= ?", date_to), ("f.unit = ?", unit)):
+        if value:
+            sql += " AND " + clause
+            args.append(value)
+    sql += " ORDER BY f.cik, c.concept, f.unit, f.period_end, f.period_start"
+    series = []
+    for (cik, concept, label, unit_name), rows in groupby(conn.execute(sql, args), key=lambda r: tuple(r[:4])):
+        columns = {name: [] for name in FACT_COLUMNS}
+        for row in rows:
+            for name, value in zip(FACT_COLUMNS, row[4:]):
+                columns[name].append(value)
+        series.append((cik, concept, label, unit_name, columns))
+    return series
+
+
+# ─────────────────────────────────────────────
+# Static shards
+# ─────────────────────────────────────────────
+# build-shards splits tables_index.js and company_tickers.js into small JSON
+# files under SHARDS_DIR, each named after a hash of its content so it can be
+# cached forever. manifest.json is the only file the client revalidates; it maps
+# tickers, token buckets and company initials to the current file names.
+SHARD_TOKEN_BUCKETS = 64
+_SHARD_PATH = re.compile(r"manifest\.json|(?:tables|tokens|companies)/[A-Za-z0-9_.-]+\.json")
+
+
+def load_js_object(path):
+    """Parse the object literal a generated `window.__X__ = {...};` script assigns."""
+    with open(path, "r", encoding="utf-8") as f:
+        text = f.read()
+    data, _ = json.JSONDecoder().raw_decode(text, text.index("{"))
+    return data
+
+
+def shard_token_bucket(token, buckets=SHARD_TOKEN_BUCKETS):
+    """FNV-1a (32-bit) of the token's UTF-8 bytes, mod buckets. app.js must agree."""
+    h = 0x811C9DC5
+    for b in token.encode("utf-8"):
+        h = ((h ^ b) * 0x01000193) & 0xFFFFFFFF
+    return h % buckets
+
+
+def company_shard_key(ticker):
+    """Companies are sharded by the ticker's first letter; anything else goes to "_"."""
+    first = ticker[:1].upper()
+    return first if "A" <= first <= "Z" else "_"
+
+
+def _shard_name(ticker):
+    return re.sub(r"[^A-Z0-9.-]", "_", ticker.upper()) or "_"
+
+
+def _db_tickers(db_path):
+    """Tickers with rows in tables.db (empty if there is no database)."""
+    if not db_path or not os.path.exists(db_path):
+        return set()
+    conn = sqlite3.connect(db_path)
+    try:
+        return {(r[0] or "").upper() for r in conn.execute("SELECT DISTINCT ticker FROM tables")} - {""}
+    except sqlite3.OperationalError:
+        return set()
+    finally:
+        conn.close()
+
+
+def _write_shard(out_dir, subdir, name, payload):
+    """Write payload as <subdir>/<name>.<hash>.json (plus a .gz twin); return its path."""
+    body = json.dumps(payload, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+    rel = f"{subdir}/{name}.{hashlib.sha256(body).hexdigest()[:12]}.json"
+    path = os.path.join(out_dir, rel)
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(f"{path}.tmp", "wb") as f:
+            f.write(body)
+        with open(f"{path}.gz.tmp", "wb") as f:
+            f.write(gzip.compress(body, 9, mtime=0))
+        os.replace(f"{path}.gz.tmp", f"{path}.gz")
+        os.replace(f"{path}.tmp", path)
+    return rel
+
+
+def build_shards(out_dir=SHARDS_DIR, db_path=TABLES_DB, tables_js=TABLES_INDEX_JS, tickers_js=COMPANY_TICKERS_JS):
+    """
+    Write table, token and company shards plus manifest.json into out_dir.
+
+    Tables come from tables_js. Tickers only tables.db covers are listed
+    under tables.db_tickers, without shards. Token shards hold
+    {field: {label: {ticker: [table ids]}}} for the normalized header ("h")
+    and row ("r") labels, bucketed by shard_token_bucket(). The manifest is
+    replaced last, so a client never sees it point at a missing shard; files
+    neither it nor the previous manifest reference are removed. Returns the
+    manifest.
+    """
+    static = load_js_object(tables_js) if tables_js and os.path.exists(tables_js) else {"meta": {}, "tables": []}
+    companies = {}
+    if tickers_js and os.path.exists(tickers_js):
+        companies = load_js_object(tickers_js)
+    elif os.path.exists(COMPANY_TICKERS_CACHE):
+        with open(COMPANY_TICKERS_CACHE) as f:
+            companies = {e["ticker"].upper(): {"cik": e["cik_str"], "name": e["title"]}
+                         for e in json.load(f).values() if e.get("ticker")}
+
+    by_ticker = {}
+    for t in static.get("tables", []):
+        by_ticker.setdefault(t["tk"].upper(), []).append(t)
+    # tables.db ids don't address the static HTML chunks, so its tickers get
+    # no shards; the client sends them to the live/API path instead.
+    db_tickers = sorted(_db_tickers(db_path) - set(by_ticker))
+
+    names = dict(static.get("meta", {}).get("companies", {}))
+    ticker_files = {}
+    postings = [{"h": {}, "r": {}} for _ in range(SHARD_TOKEN_BUCKETS)]
+    filings = set()
+    for ticker, rows in sorted(by_ticker.items()):
+        names.setdefault(ticker, companies.get(ticker, {}).get("name", ticker))
+        for t in rows:
+            filings.add(t["fid"])
+            for field in ("h", "r"):
+                for token in sorted(normalize_labels(t[field])):
+                    bucket = postings[shard_token_bucket(token)][field]
+                    bucket.setdefault(token, {}).setdefault(ticker, []).append(t["id"])
+        ticker_files[ticker] = _write_shard(out_dir, "tables", _shard_name(ticker), {"ticker": ticker, "tables": rows})
 
+    token_files = [_write_shard(out_dir, "tokens", f"{i:02d}", postings[i]) for i in range(SHARD_TOKEN_BUCKETS)]
 
-def sig_overlap(headers_a, rows_a, headers_b, rows_b):
-    """
-    Compute table signature overlap score.
-    60% weight on header match, 40% weight on row label match.
-    Returns float in [0.0, 1.0].
-    """
-    def jaccard(set_a, set_b):
-        if not set_a and not set_b:
-            return 1.0
-        if not set_a or not set_b:
-            return 0.0
-        a = set(str(x).strip().lower() for x in set_a if str(x).strip())
-        b = set(str(x).strip().lower() for x in set_b if str(x).strip())
-        if not a and not b:
-            return 1.0
-        intersection = len(a & b)
-        union = len(a | b)
-        return intersection / union if union > 0 else 0.0
+    letters = {}
+    for ticker, entry in companies.items():
+        letters.setdefault(company_shard_key(ticker), {})[ticker.upper()] = entry
+    company_files = {k: _write_shard(out_dir, "companies", k, v) for k, v in sorted(letters.items())}
 
-    h_score = jaccard(headers_a, headers_b)
-    r_score = jaccard(rows_a, rows_b)
-    return 0.6 * h_score + 0.4 * r_score
+    manifest = {
+        "version": 1,
+        "built_at": int(time.time()),
+        "tables": {
+            "meta": {
+                "companies": {tk: names[tk] for tk in sorted(by_ticker)},
+                "filings_count": len(filings),
+                "tables_count": sum(len(rows) for rows in by_ticker.values()),
+            },
+            "tickers": ticker_files,
+            "db_tickers": db_tickers,
+        },
+        "tokens": {"buckets": SHARD_TOKEN_BUCKETS, "hash": "fnv1a32", "files": token_files},
+        "companies": {"count": len(companies), "files": company_files},
+    }
+
+    manifest_path = os.path.join(out_dir, "manifest.json")
+    keep = _manifest_files(manifest)
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            keep |= _manifest_files(json.load(f))
+    os.makedirs(out_dir, exist_ok=True)
+    _write_atomic(manifest_path, json.dumps(manifest, separators=(",", ":"), ensure_ascii=False))
+    for subdir in ("tables", "tokens", "companies"):
+        folder = os.path.join(out_dir, subdir)
+        if not os.path.isdir(folder):
+            continue
+        for name in os.listdir(folder):
+            if f"{subdir}/{name.removesuffix('.gz')}" not in keep:
+                os.remove(os.path.join(folder, name))
+    return manifest
+
+
+def _manifest_files(manifest):
+    return {*manifest["tables"]["tickers"].values(), *manifest["tokens"]["files"],
+            *manifest["companies"]["files"].values()}
 
 
 # ─────────────────────────────────────────────
@@ -186,6 +4270,14 @@ def handle_companies_search(params):
     except Exception as e:
         return send_error(f"Failed to load company tickers: {e}")
 
+    if _persistent_process:
+        send_json(company_search_index(tickers_data).search(q))
+    else:
+        send_json(scan_companies(tickers_data, q))
+
+
+def scan_companies(tickers_data, q, limit=10):
+    """Score every company linearly; cheaper than building the index for a one-shot CGI process."""
     results = []
     for entry in tickers_data.values():
         ticker = str(entry.get("ticker", "")).upper()
@@ -208,8 +4300,8 @@ def handle_companies_search(params):
         elif any(w.startswith(q) for w in name_upper.split()):
             score = 5
         else:
-            dist = levenshtein(q, ticker)
             threshold = max(2, len(q) // 2)
+            dist = levenshtein_within(q, ticker, threshold)
             if dist <= threshold:
                 score = 6 + dist
 
@@ -222,11 +4314,10 @@ def handle_companies_search(params):
             })
 
     results.sort(key=lambda x: x["_score"])
-    results = results[:10]
+    results = results[:limit]
     for r in results:
         del r["_score"]
-
-    send_json(results)
+    return results
 
 
 def handle_companies_profile(params):
@@ -235,8 +4326,7 @@ def handle_companies_profile(params):
     if not ticker:
         return send_error("ticker is required", 400)
     try:
-        data = fiscal_get(f"/company/profile", {"ticker": ticker})
-        send_json(data)
+        send_fiscal("/company/profile", {"ticker": ticker})
     except urllib.error.HTTPError as e:
         send_error(f"fiscal.ai error: {e.code} {e.reason}", e.code)
     except Exception as e:
@@ -249,28 +4339,127 @@ def handle_companies_filings(params):
     if not ticker:
         return send_error("ticker is required", 400)
     try:
-        data = fiscal_get(f"/company/filings", {"ticker": ticker})
-        send_json(data)
+        send_fiscal("/company/filings", {"ticker": ticker})
     except urllib.error.HTTPError as e:
         send_error(f"fiscal.ai error: {e.code} {e.reason}", e.code)
     except Exception as e:
         send_error(str(e))
 
 
+def _dashboard_fiscal(path, ticker):
+    return json.loads(fiscal_cached(path, {"ticker": ticker}).body)
+
+
+def _dashboard_filings(ticker):
+    cik = company_ticker_map().cik(ticker)
+    if not cik:
+        raise LookupError(f"CIK not found for ticker: {ticker}")
+    return edgar_filings_page(cik, _filings_options({}))
+
+
+_DASHBOARD_LOADERS = {
+    "profile": partial(_dashboard_fiscal, "/company/profile"),
+    "filings": _dashboard_filings,
+    "financials": partial(_dashboard_fiscal, "/company/financials"),
+    "ratios": partial(_dashboard_fiscal, "/company/ratios"),
+    "stock": partial(_dashboard_fiscal, "/company/stock"),
+    "shares": partial(_dashboard_fiscal, "/company/shares"),
+    "segments": partial(_dashboard_fiscal, "/company/segments"),
+}
+
+
+def handle_companies_dashboard(params):
+    """
+    Load several company sections concurrently in one request.
+    Query params: ticker, sections (comma-separated, default all of
+                  DASHBOARD_TIMEOUTS), timeout (optional cap in seconds for every section)
+    Each section runs on its own thread through the same cache as its
+    endpoint (filings is the first /edgar/filings?format=columns page) and
+    has its own deadline. Returns {"ticker", "sections": {name: data},
+    "errors": {name: message}, "timings": {name: ms}}; a section that fails
+    or misses its deadline only lands in errors. 502 if every section fails.
+    """
+    ticker = params.get("ticker", "").upper()
+    if not ticker:
+        return send_error("ticker is required", 400)
+    names = [n.strip().lower() for n in params.get("sections", "").split(",") if n.strip()] or list(DASHBOARD_TIMEOUTS)
+    unknown = [n for n in names if n not in DASHBOARD_TIMEOUTS]
+    if unknown:
+        return send_error(f"unknown sections: {', '.join(unknown)}", 400)
+    names = list(dict.fromkeys(names))
+    try:
+        cap = float(params["timeout"]) if params.get("timeout") else None
+    except ValueError:
+        return send_error("timeout must be a number of seconds", 400)
+    if cap is not None and cap <= 0:
+        return send_error("timeout must be a number of seconds", 400)
+
+    sections, errors, timings = {}, {}, {}
+    started = time.monotonic()
+    pool = ThreadPoolExecutor(max_workers=len(names))
+    futures = {pool.submit(in_request_context(_DASHBOARD_LOADERS[name]), ticker): name for name in names}
+    deadlines = {f: started + min(DASHBOARD_TIMEOUTS[name], cap or DASHBOARD_TIMEOUTS[name])
+                 for f, name in futures.items()}
+    pending = set(futures)
+    while pending:
+        done, _ = wait(pending, timeout=max(0, min(deadlines[f] for f in pending) - time.monotonic()),
+                       return_when=FIRST_COMPLETED)
+        now = time.monotonic()
+        for future in done:
+            name = futures[future]
+            timings[name] = round((now - started) * 1000)
+            try:
+                sections[name] = future.result()
+            except urllib.error.HTTPError as e:
+                source = "EDGAR" if name == "filings" else "fiscal.ai"
+                errors[name] = f"{source} error: {e.code} {e.reason}"
+            except Exception as e:
+                errors[name] = str(e) or type(e).__name__
+        pending -= done
+        for future in [f for f in pending if deadlines[f] <= now]:
+            name = futures[future]
+            errors[name] = f"timed out after {deadlines[future] - started:g} s"
+            timings[name] = round((now - started) * 1000)
+            pending.discard(future)
+    # Late sections keep running and still fill the cache for the next load;
+    # their after_response() refreshes run on the worker once main() has
+    # drained the queue, and a CGI process waits for the workers at exit.
+    pool.shutdown(wait=False, cancel_futures=True)
+
+    if errors and not sections:
+        return send_error("; ".join(f"{n}: {m}" for n, m in errors.items()), 502)
+    send_json({
+        "ticker": ticker,
+        "sections": {name: sections[name] for name in names if name in sections},
+        "errors": errors,
+        "timings": timings,
+    })
+
+
 def handle_edgar_filings(params):
-    """Get company filing list via EDGAR submissions API."""
+    """
+    Get company filing list via EDGAR submissions API.
+
+    format=columns returns one page of filings as parallel arrays
+    ({"cik", "name", "filings": {column: [...]}, "count", "next_cursor"}),
+    filtered by forms=10-K,10-Q and from/to (filing date, YYYY-MM-DD), with
+    limit (default 100) and cursor. Older filings beyond the ~1000 in
+    filings.recent are read from EDGAR's overflow pages only when needed.
+    """
     ticker = params.get("ticker", "").upper()
     if not ticker:
         return send_error("ticker is required", 400)
+    columnar = params.get("format") == "columns"
+    if columnar:
+        try:
+            options = _filings_options(params)
+        except ValueError as e:
+            return send_error(str(e), 400)
 
     # Look up CIK from company_tickers.json
     cik = None
     try:
-        tickers_data = load_company_tickers()
-        for entry in tickers_data.values():
-            if str(entry.get("ticker", "")).upper() == ticker:
-                cik = str(entry.get("cik_str", entry.get("cik", ""))).zfill(10)
-                break
+        cik = company_ticker_map().cik(ticker)
     except Exception:
         pass
 
@@ -278,23 +4467,24 @@ def handle_edgar_filings(params):
         return send_error(f"CIK not found for ticker: {ticker}", 404)
 
     try:
-        url = f"https://data.sec.gov/submissions/CIK{cik}.json"
-        raw = edgar_get(url)
-        data = json.loads(raw.decode("utf-8"))
-        recent = data.get("filings", {}).get("recent", {})
-        filings = []
-        forms = recent.get("form", [])
-        for i in range(len(forms)):
-            filings.append({
-                "secFormType": forms[i],
-                "formType": forms[i],
-                "filingDate": recent.get("filingDate", [])[i] if i < len(recent.get("filingDate", [])) else "",
-                "reportDate": recent.get("reportDate", [])[i] if i < len(recent.get("reportDate", [])) else "",
-                "filingId": recent.get("accessionNumber", [])[i] if i < len(recent.get("accessionNumber", [])) else "",
-                "primaryDocument": recent.get("primaryDocument", [])[i] if i < len(recent.get("primaryDocument", [])) else "",
-                "description": recent.get("primaryDocDescription", [])[i] if i < len(recent.get("primaryDocDescription", [])) else forms[i],
-                "items": recent.get("items", [])[i] if i < len(recent.get("items", [])) else "",
-            })
+        data = edgar_submissions(cik)
+        if columnar:
+            return send_json(edgar_filings_page(cik, options, data))
+        columns = filing_columns(data.get("filings", {}).get("recent", {}))
+        filings = [
+            {
+                "secFormType": form,
+                "formType": form,
+                "filingDate": filing_date,
+                "reportDate": report_date,
+                "filingId": filing_id,
+                "primaryDocument": primary_document,
+                "description": description,
+                "items": items,
+            }
+            for filing_id, form, filing_date, report_date, primary_document, description, items
+            in zip(*columns.values())
+        ]
         send_json({
             "cik": cik,
             "name": data.get("name", ""),
@@ -312,8 +4502,7 @@ def handle_financials(params):
     if not ticker:
         return send_error("ticker is required", 400)
     try:
-        data = fiscal_get("/company/financials", {"ticker": ticker})
-        send_json(data)
+        send_fiscal("/company/financials", {"ticker": ticker})
     except urllib.error.HTTPError as e:
         send_error(f"fiscal.ai error: {e.code} {e.reason}", e.code)
     except Exception as e:
@@ -326,22 +4515,72 @@ def handle_ratios(params):
     if not ticker:
         return send_error("ticker is required", 400)
     try:
-        data = fiscal_get("/company/ratios", {"ticker": ticker})
-        send_json(data)
+        send_fiscal("/company/ratios", {"ticker": ticker})
     except urllib.error.HTTPError as e:
         send_error(f"fiscal.ai error: {e.code} {e.reason}", e.code)
     except Exception as e:
         send_error(str(e))
 
 
+def handle_facts(params):
+    """
+    GET endpoint: XBRL fact time series from facts.db (see ingest_facts).
+    Query params: tickers (comma-separated, CIKs also accepted), concepts
+    ("us-gaap:Revenues" or bare "Revenues"), period=annual|quarterly|instant|all,
+    from / to (period end, YYYY-MM-DD), unit (e.g. USD)
+    Returns {"period", "series": [{ticker, cik, name, concept, label, unit,
+    "periods": {start, end, value, fy, fp, form, filed, accession, frame}}],
+    "missing": [tickers with no facts ingested]}.
+    """
+    tickers = list(dict.fromkeys(t.strip().upper() for t in params.get("tickers", "").split(",") if t.strip()))
+    concepts = list(dict.fromkeys(c.strip() for c in params.get("concepts", "").split(",") if c.strip()))
+    period = params.get("period", "all")
+    if not tickers or not concepts:
+        return send_error("tickers and concepts are required", 400)
+    if len(tickers) > FACTS_MAX_TICKERS or len(concepts) > FACTS_MAX_CONCEPTS:
+        return send_error(f"at most {FACTS_MAX_TICKERS} tickers and {FACTS_MAX_CONCEPTS} concepts", 400)
+    if period not in FACT_PERIODS:
+        return send_error("period must be one of " + ", ".join(FACT_PERIODS), 400)
+    if not os.path.exists(FACTS_DB):
+        return send_error("Facts store not built — run api.py ingest-facts", 503)
+
+    try:
+        ticker_map = company_ticker_map()
+        # Share classes (GOOG, GOOGL) and a ticker plus its CIK map to one company.
+        ciks = {}
+        for ticker in tickers:
+            cik = ticker if ticker.isdigit() else ticker_map.cik(ticker)
+            if cik:
+                ciks.setdefault(int(cik), []).append(ticker)
+        conn = facts_db()
+        names = dict(conn.execute(
+            "SELECT cik, name FROM fact_companies WHERE cik IN (SELECT value FROM json_each(?))",
+            (json.dumps(list(ciks)),)))
+        series = query_facts(conn, names, concepts, period, params.get("from"), params.get("to"), params.get("unit"))
+    except Exception as e:
+        return send_error(f"Database error: {e}")
+
+    order = {ticker: i for i, ticker in enumerate(tickers)}
+    found = {ticker for cik in names for ticker in ciks[cik]}
+    body = json.dumps({
+        "period": period,
+        "series": sorted(
+            ({"ticker": ticker, "cik": str(cik).zfill(10), "name": names[cik], "concept": concept,
+              "label": label, "unit": unit, "periods": columns}
+             for cik, concept, label, unit, columns in series for ticker in ciks[cik]),
+            key=lambda s: order[s["ticker"]]),
+        "missing": [t for t in tickers if t not in found],
+    }) + "\n"
+    send_cached(cache_entry("facts", body.encode("utf-8"), time.time() + FACTS_CACHE_TTL), stale=0)
+
+
 def handle_stock(params):
     """Get stock prices via fiscal.ai."""
     ticker = params.get("ticker", "").upper()
     if not ticker:
         return send_error("ticker is required", 400)
     try:
-        data = fiscal_get("/company/stock", {"ticker": ticker})
-        send_json(data)
+        send_fiscal("/company/stock", {"ticker": ticker})
     except urllib.error.HTTPError as e:
         send_error(f"fiscal.ai error: {e.code} {e.reason}", e.code)
     except Exception as e:
@@ -354,8 +4593,7 @@ def handle_shares(params):
     if not ticker:
         return send_error("ticker is required", 400)
     try:
-        data = fiscal_get("/company/shares", {"ticker": ticker})
-        send_json(data)
+        send_fiscal("/company/shares", {"ticker": ticker})
     except urllib.error.HTTPError as e:
         send_error(f"fiscal.ai error: {e.code} {e.reason}", e.code)
     except Exception as e:
@@ -368,8 +4606,7 @@ def handle_segments(params):
     if not ticker:
         return send_error("ticker is required", 400)
     try:
-        data = fiscal_get("/company/segments", {"ticker": ticker})
-        send_json(data)
+        send_fiscal("/company/segments", {"ticker": ticker})
     except urllib.error.HTTPError as e:
         send_error(f"fiscal.ai error: {e.code} {e.reason}", e.code)
     except Exception as e:
@@ -377,31 +4614,97 @@ def handle_segments(params):
 
 
 def handle_search(params):
-    """EDGAR full-text search via EFTS API."""
+    """EDGAR full-text search via EFTS API.
+
+    The source is picked once per query. With source=auto, page 0 is answered
+    from the local full-text index (filings already processed by
+    /edgar/document) when that fills the page; every later auto page goes to
+    EFTS. Local responses are marked "source": "local" and "partial": true,
+    because their total only counts filings opened here. Clients page them
+    with source=local, which never leaves the box, so pages never mix
+    sources. source=efts skips the index. EFTS results are cached briefly
+    (efts_search), and when more hits remain the next page is fetched into
+    the cache after the response.
+    """
     q = params.get("q", "")
     forms = params.get("forms", "")
     page = int(params.get("page", 0))
-    start = page * 20
-
-    efts_params = urllib.parse.urlencode({
-        k: v for k, v in {
-            "q": q,
-            "forms": forms,
-            "start": str(start),
-        }.items() if v
-    })
+    start = page * EFTS_PAGE_SIZE
+    source = params.get("source", "auto")
+    if source not in ("auto", "local", "efts"):
+        return send_error("source must be auto, local or efts", 400)
+
+    local = None
+    if source == "local" or (source == "auto" and start == 0):
+        local = local_search(q, forms, start)
+        if local is not None and (source == "local" or local["hits"]["total"]["value"] >= EFTS_PAGE_SIZE):
+            return send_json(local)
+        if source == "local":
+            return send_json({"hits": {"total": {"value": 0, "relation": "partial"}, "hits": []},
+                              "source": "local", "partial": True})
 
-    url = f"https://efts.sec.gov/LATEST/search-index?{efts_params}"
     try:
-        raw = edgar_get(url)
-        data = json.loads(raw.decode("utf-8"))
-        send_json(data)
+        entry = efts_search(q, forms, start)
+        send_cached(entry, stale=0)
+        if efts_total(entry) > start + EFTS_PAGE_SIZE:
+            after_response(partial(prefetch_efts_page, q, forms, start + EFTS_PAGE_SIZE))
     except urllib.error.HTTPError as e:
         send_error(f"EDGAR search error: {e.code} {e.reason}", e.code)
     except Exception as e:
+        # EFTS unreachable: a partial local page beats an error. It is
+        # labelled local, so the client pages on with source=local.
+        if local is not None and local["hits"]["hits"]:
+            return send_json(local)
         send_error(str(e))
 
 
+def handle_search_batch(params):
+    """
+    Run one EFTS search per form type concurrently and merge them.
+    Query params: q, forms (comma-separated, up to EFTS_BATCH_MAX_FORMS), page.
+    Returns {"hits": {"total": {"value"}, "hits": [...]}, "forms": {form: total},
+    "errors": {form: message}} with hits ordered by score, duplicates dropped.
+    """
+    q = params.get("q", "")
+    forms = efts_query("", params.get("forms", ""), 0)[1].split(",")
+    forms = [f for f in forms if f]
+    if not q or not forms:
+        return send_error("q and forms are required", 400)
+    if len(forms) > EFTS_BATCH_MAX_FORMS:
+        return send_error(f"at most {EFTS_BATCH_MAX_FORMS} forms per batch", 400)
+    try:
+        start = int(params.get("page", 0)) * EFTS_PAGE_SIZE
+    except ValueError:
+        return send_error("page must be an integer", 400)
+
+    totals, errors, hits, seen = {}, {}, [], set()
+    with ThreadPoolExecutor(max_workers=len(forms)) as pool:
+        futures = {form: pool.submit(efts_search, q, form, start) for form in forms}
+    for form, future in futures.items():
+        try:
+            data = json.loads(future.result().body)
+        except urllib.error.HTTPError as e:
+            errors[form] = f"EDGAR search error: {e.code} {e.reason}"
+            continue
+        except Exception as e:
+            errors[form] = str(e)
+            continue
+        result = data.get("hits") or {}
+        totals[form] = (result.get("total") or {}).get("value", 0)
+        for hit in result.get("hits") or []:
+            if hit.get("_id") not in seen:
+                seen.add(hit.get("_id"))
+                hits.append(hit)
+    if errors and not totals:
+        return send_error("; ".join(f"{f}: {m}" for f, m in errors.items()), 502)
+    hits.sort(key=lambda h: -(h.get("_score") or 0))
+    send_json({
+        "hits": {"total": {"value": sum(totals.values())}, "hits": hits},
+        "forms": totals,
+        "errors": errors,
+    })
+
+
 def handle_filing_doc(params):
     """Fetch a filing document from EDGAR by accession number + document name."""
     filing_id = params.get("filingId", "").replace("-", "")
@@ -480,6 +4783,127 @@ def handle_edgar_proxy(params):
         send_error(str(e))
 
 
+def accepted_encodings(header):
+    """Parse an Accept-Encoding header into {coding: q}."""
+    accepted = {}
+    for item in header.split(","):
+        coding, _, q = item.strip().partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        try:
+            accepted[coding] = float(q.strip().removeprefix("q=")) if q else 1.0
+        except ValueError:
+            accepted[coding] = 0.0
+    return accepted
+
+
+def negotiate_filing_encoding(header):
+    """Best Content-Encoding for a filing: zstd, br, gzip (in that order on ties) or identity.
+
+    A missing Accept-Encoding gets identity: clients that send none
+    (urllib, curl without --compressed) generally can't decode anything else.
+    """
+    accepted = accepted_encodings(header)
+    best, best_q = "identity", 0.0
+    for coding in (*FILING_VARIANTS, "gzip"):
+        q = accepted.get(coding, accepted.get("*", 0.0))
+        if q > best_q:
+            best, best_q = coding, q
+    return best
+
+
+def parse_byte_range(header, size):
+    """
+    (start, end) inclusive for a single `bytes=` Range over `size` bytes, or
+    None when the header should be ignored (absent, malformed or multi-range).
+    Raises ValueError when the range is unsatisfiable.
+    """
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None
+    first, sep, last = (part.strip() for part in spec.partition("-"))
+    if not sep or not (first or last) or not all(p.isdigit() for p in (first, last) if p):
+        return None
+    if not first:
+        if int(last) == 0:
+            raise ValueError("unsatisfiable range")
+        return max(0, size - int(last)), size - 1
+    start = int(first)
+    end = int(last) if last else size - 1
+    if last and end < start:
+        return None
+    if start >= size:
+        raise ValueError("unsatisfiable range")
+    return start, min(end, size - 1)
+
+
+def wants_raw_document(params):
+    """format=raw, or an Accept header asking for HTML rather than JSON."""
+    if "format" in params:
+        return params["format"] == "raw"
+    accept = request_environ().get("HTTP_ACCEPT", "")
+    return "text/html" in accept and "application/json" not in accept
+
+
+def send_filing_document(key, gz):
+    """
+    Send a processed filing as text/html with a negotiated Content-Encoding.
+
+    gzip goes out as stored; br/zstd come from the store once built (the first
+    request gets gzip and queues the re-encoding). Encoded responses honour a
+    single-range Range request over the encoded bytes; identity is streamed.
+    """
+    environ = request_environ()
+    encoding = negotiate_filing_encoding(environ.get("HTTP_ACCEPT_ENCODING", ""))
+    body = gz
+    if encoding in FILING_VARIANTS:
+        body = _filing_store.get(key, FILING_VARIANTS[encoding])
+        if body is None:
+            after_response(partial(store_filing_variant, key, encoding, gz))
+            encoding, body = "gzip", gz
+    etag = f'"{key[:20]}-{encoding}"'
+    validators = [
+        ("ETag", etag),
+        ("Cache-Control", "public, max-age=31536000, immutable"),
+        ("Vary", "Accept, Accept-Encoding"),
+        ("Access-Control-Expose-Headers", "Accept-Ranges, Content-Range, ETag"),
+    ]
+    if etag_matches(etag):
+        current_response().start(304, [*validators, ("Access-Control-Allow-Origin", "*")])
+        return
+    headers = [*validators, ("Content-Type", "text/html; charset=utf-8")]
+
+    if encoding == "identity":
+        # The gzip trailer holds the uncompressed size (mod 2**32).
+        response = current_response()
+        response.start(200, [
+            *headers,
+            ("Access-Control-Allow-Origin", "*"),
+            ("Content-Length", str(int.from_bytes(gz[-4:], "little"))),
+        ])
+        for chunk in gunzip_chunks(gz):
+            response.write(chunk)
+        return
+
+    headers.append(("Accept-Ranges", "bytes"))
+    range_header = environ.get("HTTP_RANGE", "")
+    if_range = environ.get("HTTP_IF_RANGE", "")
+    if range_header and (not if_range or if_range.strip() == etag):
+        try:
+            span = parse_byte_range(range_header, len(body))
+        except ValueError:
+            return send_body(b"", 416, [*validators, ("Content-Range", f"bytes */{len(body)}")])
+        if span is not None:
+            start, end = span
+            return send_body(body[start:end + 1], 206, [
+                *headers,
+                ("Content-Encoding", encoding),
+                ("Content-Range", f"bytes {start}-{end}/{len(body)}"),
+            ])
+    send_body(body, 200, [*headers, ("Content-Encoding", encoding)])
+
+
 def handle_edgar_document(params):
     """
     Fetch full filing HTML from EDGAR Archives, strip XBRL inline tags,
@@ -487,7 +4911,12 @@ def handle_edgar_document(params):
     and return JSON {"html_b64gz": "..."}.
 
     This reduces ~2MB raw HTML to ~256KB encoded, suitable for efficient
-    transfer and client-side decompression.
+    transfer and client-side decompression. Results are kept in the filing
+    store, so repeat views skip EDGAR and compression.
+
+    With format=raw (or Accept: text/html) the document is sent as HTML with
+    Content-Encoding instead, skipping base64 and client-side gunzip; see
+    send_filing_document().
     """
     cik = params.get("cik", "")
     accession = params.get("accession", "").replace("-", "")
@@ -496,40 +4925,121 @@ def handle_edgar_document(params):
     if not cik or not accession or not filename:
         return send_error("cik, accession, and filename are required", 400)
 
-    url = f"https://www.sec.gov/Archives/edgar/data/{cik}/{accession}/{filename}"
     try:
-        raw = edgar_get(url)
-        html = raw.decode("utf-8", errors="replace")
-
-        # Strip XBRL inline tags (ix:* namespace elements), keep inner content
-        html = re.sub(r"<ix:[^>]+>", "", html, flags=re.IGNORECASE)
-        html = re.sub(r"</ix:[^>]+>", "", html, flags=re.IGNORECASE)
-        # Strip ix:header sections entirely
-        html = re.sub(r"<ix:header[\s\S]*?</ix:header>", "", html, flags=re.IGNORECASE)
-
-        # Rewrite relative URLs to absolute SEC paths
-        base_path = f"https://www.sec.gov/Archives/edgar/data/{cik}/{accession}/"
-        html = re.sub(
-            r'(href|src)="(?!https?://|//|#|mailto:)([^"]*)"',
-            lambda m: f'{m.group(1)}="{base_path}{m.group(2)}"',
-            html,
-        )
+        compressed = filing_document_gz(cik, accession, filename)
+        after_response(partial(index_filing_text, cik, accession, filename, compressed))
+        if wants_raw_document(params):
+            send_filing_document(FilingStore.key(cik, accession, filename), compressed)
+        else:
+            send_json({"html_b64gz": base64.b64encode(compressed).decode("ascii")})
+    except Exception as e:
+        # Failing mid-body (identity streaming, client disconnect): a second
+        # header block would corrupt the stream, so let the caller drop the
+        # connection instead.
+        if current_response().started:
+            raise
+        if isinstance(e, urllib.error.HTTPError):
+            send_error(f"EDGAR document error: {e.code} {e.reason}", e.code)
+        else:
+            send_error(str(e))
 
-        # Gzip-compress and base64-encode
-        compressed = gzip.compress(html.encode("utf-8"))
-        encoded = base64.b64encode(compressed).decode("ascii")
 
-        send_json({"html_b64gz": encoded})
+def handle_edgar_compare(params):
+    """
+    Compare two filings section by section on the server.
+    Query params: cik, a / a_file (earlier accession and document), b / b_file (later)
+    Returns {"cik", "a", "b", "sections": [{id, title, status, blocks_a, blocks_b, ops}],
+    "summary": {...}}; see compare_filings(). ops hold the changed blocks' text,
+    with unchanged runs collapsed to {"op": "equal", "count": N}.
+    """
+    cik = params.get("cik", "")
+    a = params.get("a", "").replace("-", ""), params.get("a_file", "")
+    b = params.get("b", "").replace("-", ""), params.get("b_file", "")
+    if not cik or not all(a) or not all(b):
+        return send_error("cik, a, a_file, b and b_file are required", 400)
+    try:
+        send_cached(compare_filings_cached(cik, a, b), stale=0)
     except urllib.error.HTTPError as e:
         send_error(f"EDGAR document error: {e.code} {e.reason}", e.code)
     except Exception as e:
         send_error(str(e))
 
 
+def handle_shards(path):
+    """
+    Serve a file written by build-shards. Hashed shard names never change
+    content, so they are immutable; manifest.json is revalidated by ETag.
+    The prebuilt .gz twin is sent when the client accepts gzip.
+    """
+    rel = path[len("/shards/"):]
+    if not _SHARD_PATH.fullmatch(rel):
+        return send_error("Not found", 404)
+    file_path = os.path.join(SHARDS_DIR, rel)
+    encoding = None
+    if accepted_encodings(request_environ().get("HTTP_ACCEPT_ENCODING", "")).get("gzip", 0) > 0 \
+            and os.path.exists(file_path + ".gz"):
+        file_path, encoding = file_path + ".gz", "gzip"
+    try:
+        with open(file_path, "rb") as f:
+            body = f.read()
+    except FileNotFoundError:
+        return send_error("Not found", 404)
+
+    if rel == "manifest.json":
+        cache_control = "no-cache"
+        etag = f'"{hashlib.sha256(body).hexdigest()[:20]}"'
+    else:
+        cache_control = "public, max-age=31536000, immutable"
+        etag = f'"{rel.rsplit(".", 2)[-2]}"'
+    if encoding:
+        etag = f'{etag[:-1]}-{encoding}"'
+    headers = [("ETag", etag), ("Cache-Control", cache_control), ("Vary", "Accept-Encoding")]
+    if etag_matches(etag):
+        current_response().start(304, [*headers, ("Access-Control-Allow-Origin", "*")])
+        return
+    headers.append(("Content-Type", "application/json; charset=utf-8"))
+    if encoding:
+        headers.append(("Content-Encoding", encoding))
+    send_body(body, 200, headers)
+
+
+def handle_metrics(params):
+    """
+    Per-route latency over the last `hours` (default 24, up to a week) from
+    metrics.db: requests, errors, mean/max and p50/p95/p99 in ms (bucket upper
+    bounds, about 10% resolution), and each span's mean ms and share of the
+    route's time. route=<"GET /path"> narrows it to one route. "upstream" is
+    this process's upstream client and single-flight counters.
+    """
+    try:
+        hours = int(params.get("hours", 24))
+    except ValueError:
+        return send_error("hours must be an integer", 400)
+    if not 1 <= hours <= METRICS_RETENTION_HOURS:
+        return send_error(f"hours must be between 1 and {METRICS_RETENTION_HOURS}", 400)
+    try:
+        routes = _metrics.summary(hours, params.get("route"))
+    except sqlite3.Error as e:
+        return send_error(f"Database error: {e}")
+    send_json({
+        "hours": hours,
+        "routes": routes,
+        "upstream": {**_upstream.stats()._asdict(), **_single_flight.stats()},
+    })
+
+
+def handle_upstream_stats(params):
+    """Upstream client counters for this process: requests, pool reuse, retries,
+    limiter waits, and single-flight leaders vs. coalesced requests."""
+    send_json({**_upstream.stats()._asdict(), **_single_flight.stats()})
+
+
 def handle_tables_similar(params):
     """
     GET endpoint: find similar tables in the SQLite DB.
-    Query params: headers (JSON array), row_labels (JSON array), ticker (optional filter)
+    Query params: headers (JSON array), row_labels (JSON array), ticker (optional filter),
+                  mode=approx + recall (optional, MinHash/LSH candidates for cross-company queries),
+                  limit / cursor / labels=0 / format=ndjson (optional, see _similar_options)
     Returns list of {filing_id, ticker, form_type, filed_date, table_idx, score, headers, row_labels}
     sorted by score descending, threshold 0.25.
     """
@@ -540,13 +5050,19 @@ def handle_tables_similar(params):
         return send_error("headers and row_labels must be valid JSON arrays", 400)
 
     ticker_filter = params.get("ticker", "").upper() or None
-    _find_and_return_similar(headers, row_labels, ticker_filter)
+    try:
+        approx_recall = _approx_recall(params.get("mode"), params.get("recall"))
+        options = _similar_options(params)
+    except ValueError as e:
+        return send_error(str(e), 400)
+    _find_and_return_similar(headers, row_labels, ticker_filter, approx_recall, **options)
 
 
 def handle_tables_find_similar(body_str):
     """
     POST endpoint: find similar tables in the SQLite DB.
-    Reads JSON body: {headers: [...], row_labels: [...], ticker?: "..."}
+    Reads JSON body: {headers: [...], row_labels: [...], ticker?: "...", mode?: "approx", recall?: 0.9,
+                      limit?: N, cursor?: "...", labels?: false, format?: "ndjson"}
     Returns list of {filing_id, ticker, form_type, filed_date, table_idx, score, headers, row_labels}
     sorted by score descending, threshold 0.25.
     """
@@ -558,75 +5074,237 @@ def handle_tables_find_similar(body_str):
     headers = body.get("headers", [])
     row_labels = body.get("row_labels", [])
     ticker_filter = str(body.get("ticker", "")).upper() or None
+    try:
+        approx_recall = _approx_recall(body.get("mode"), body.get("recall"))
+        options = _similar_options(body)
+    except ValueError as e:
+        return send_error(str(e), 400)
 
-    _find_and_return_similar(headers, row_labels, ticker_filter)
-
+    _find_and_return_similar(headers, row_labels, ticker_filter, approx_recall, **options)
 
-def _find_and_return_similar(headers, row_labels, ticker_filter=None):
-    """Shared logic for similar-table lookup."""
-    SIMILARITY_THRESHOLD = 0.25
 
-    if not os.path.exists(TABLES_DB):
-        return send_json([])
+def handle_tables_similar_batch(body_str):
+    """
+    POST endpoint: score many query tables in one pass over tables.db.
+    Reads JSON body: {queries: [{headers: [...], row_labels: [...], ticker?: "..."}, ...],
+                      ticker?: "..." (default filter for queries without one),
+                      exclude_filing?: "<filing id>", limit?: N (per query, default 10), labels?: false}
+    Returns {"results": [[...], ...]}: one result list per query, in query order,
+    each sorted by score descending like /tables/find-similar.
+    """
+    try:
+        body = json.loads(body_str) if body_str else {}
+    except json.JSONDecodeError:
+        return send_error("Invalid JSON body", 400)
 
+    items = body.get("queries") if isinstance(body, dict) else None
+    if not isinstance(items, list) or not items:
+        return send_error("queries must be a non-empty array", 400)
+    if len(items) > SIMILAR_BATCH_MAX_QUERIES:
+        return send_error(f"at most {SIMILAR_BATCH_MAX_QUERIES} queries per request", 400)
+    default_ticker = str(body.get("ticker") or "").upper() or None
+    queries = []
+    for item in items:
+        if not isinstance(item, dict) or not isinstance(item.get("headers", []), list) \
+                or not isinstance(item.get("row_labels", []), list):
+            return send_error("each query needs headers and row_labels arrays", 400)
+        queries.append((item.get("headers", []), item.get("row_labels", []),
+                        str(item.get("ticker") or "").upper() or default_ticker))
     try:
-        import sqlite3
-        conn = sqlite3.connect(TABLES_DB)
-        conn.row_factory = sqlite3.Row
+        limit = int(body.get("limit", SIMILAR_BATCH_DEFAULT_LIMIT))
+    except (TypeError, ValueError):
+        limit = 0
+    if limit < 1:
+        return send_error("limit must be a positive integer", 400)
+    include_labels = str(body.get("labels", "1")).lower() not in ("0", "false", "no")
 
-        if ticker_filter:
-            rows = conn.execute(
-                "SELECT * FROM tables WHERE ticker = ?", (ticker_filter,)
-            ).fetchall()
+    try:
+        if os.path.exists(TABLES_DB):
+            results = find_similar_tables_batch(tables_db(), queries, limit, body.get("exclude_filing") or None,
+                                                include_labels)
         else:
-            rows = conn.execute("SELECT * FROM tables").fetchall()
+            results = [[] for _ in queries]
+    except Exception as e:
+        return send_error(f"Database error: {e}")
+    send_json({"results": results})
 
-        conn.close()
 
-        results = []
-        for row in rows:
-            try:
-                db_headers = json.loads(row["headers"]) if row["headers"] else []
-                db_row_labels = json.loads(row["row_labels"]) if row["row_labels"] else []
-            except (json.JSONDecodeError, KeyError):
-                continue
+def handle_tables_lineage(params):
+    """
+    GET endpoint: a table's precomputed lineage (see update_table_lineage).
+    Query params: filing_id, table_idx, labels=0 (optional)
+    Returns {"table": {...}, "lineage": [...]}: the table's best match in each
+    earlier filing of its ticker, newest first, each with its score.
+    """
+    filing_id = params.get("filing_id", "")
+    try:
+        table_idx = int(params.get("table_idx", ""))
+    except ValueError:
+        return send_error("filing_id and table_idx are required", 400)
+    if not filing_id:
+        return send_error("filing_id and table_idx are required", 400)
+    include_labels = str(params.get("labels", "1")).lower() not in ("0", "false", "no")
 
-            score = sig_overlap(headers, row_labels, db_headers, db_row_labels)
-            if score >= SIMILARITY_THRESHOLD:
-                results.append({
-                    "filing_id": row["filing_id"],
-                    "ticker": row["ticker"],
-                    "form_type": row["form_type"],
-                    "filed_date": row["filed_date"],
-                    "table_idx": row["table_idx"],
-                    "score": round(score, 4),
-                    "headers": db_headers,
-                    "row_labels": db_row_labels,
-                    "row_count": row["row_count"] if "row_count" in row.keys() else 0,
-                })
-
-        results.sort(key=lambda x: x["score"], reverse=True)
+    try:
+        found = table_lineage(tables_db(), filing_id, table_idx) if os.path.exists(TABLES_DB) else None
+    except Exception as e:
+        return send_error(f"Database error: {e}")
+    if found is None:
+        return send_error("Table not found", 404)
+    table, lineage = found
+    send_json({
+        "table": similar_table_result(1.0, table, include_labels=include_labels),
+        "lineage": [similar_table_result(score, row, include_labels=include_labels) for score, row in lineage],
+    })
+
+
+def _approx_recall(mode, recall):
+    """Target recall for mode=approx, or None for exact lookups."""
+    if not mode or mode == "exact":
+        return None
+    if mode != "approx":
+        raise ValueError("mode must be 'exact' or 'approx'")
+    if recall in (None, ""):
+        return DEFAULT_APPROX_RECALL
+    try:
+        recall = float(recall)
+    except (TypeError, ValueError):
+        raise ValueError("recall must be a number in (0, 1]")
+    if not 0 < recall <= 1:
+        raise ValueError("recall must be a number in (0, 1]")
+    return recall
+
+
+def _similar_options(source):
+    """
+    Paging and output options shared by the similar-tables endpoints.
+
+    limit     — return the top N matches, selected with a bounded heap
+    cursor    — next_cursor from the previous page
+    labels    — 0/false leaves headers and row_labels out of each result
+    format    — "ndjson" streams one result per line
+
+    With limit or cursor the response is {"results": [...], "next_cursor": ...}
+    (NDJSON: a final {"next_cursor": ...} line); otherwise the plain list.
+    Unpaged NDJSON streams matches as they are found, in table order rather
+    than by score, so clients can render before the lookup finishes.
+    """
+    limit = source.get("limit")
+    if limit in (None, ""):
+        limit = None
+    else:
+        try:
+            limit = int(limit)
+        except (TypeError, ValueError):
+            limit = 0
+        if limit < 1:
+            raise ValueError("limit must be a positive integer")
+    cursor = source.get("cursor") or None
+    fmt = source.get("format") or "json"
+    if fmt not in ("json", "ndjson"):
+        raise ValueError("format must be 'json' or 'ndjson'")
+    return {
+        "limit": limit,
+        "after": decode_similar_cursor(str(cursor)) if cursor else None,
+        "paged": limit is not None or cursor is not None,
+        "include_labels": str(source.get("labels", "1")).lower() not in ("0", "false", "no"),
+        "fmt": fmt,
+    }
+
+
+def _find_and_return_similar(headers, row_labels, ticker_filter=None, approx_recall=None,
+                             limit=None, after=None, paged=False, include_labels=True, fmt="json"):
+    """Shared logic for similar-table lookup."""
+    try:
+        if os.path.exists(TABLES_DB):
+            matches = iter_similar_tables(tables_db(), headers, row_labels, ticker_filter,
+                                          approx_recall=approx_recall)
+        else:
+            matches = iter(())
+        if fmt == "ndjson" and not paged:
+            first = next(matches, None)
+        else:
+            page, next_cursor = top_similar_tables(matches, limit, after)
+            results = [similar_table_result(score, row, labels, include_labels) for score, _, row, labels in page]
+    except Exception as e:
+        return send_error(f"Database error: {e}")
+
+    if fmt == "ndjson" and not paged:
+        send_stream(_stream_similar(first, matches, include_labels), "application/x-ndjson")
+    elif fmt == "ndjson":
+        send_stream(_ndjson([*results, {"next_cursor": next_cursor}]), "application/x-ndjson")
+    elif paged:
+        send_json({"results": results, "next_cursor": next_cursor})
+    else:
         send_json(results)
+
+
+def _ndjson(items):
+    for item in items:
+        yield (json.dumps(item) + "\n").encode("utf-8")
+
+
+def _stream_similar(first, matches, include_labels):
+    """NDJSON lines for matches as they are found; a DB error ends the stream with an error line."""
+    if first is None:
+        return
+    try:
+        for score, _, row, labels in chain([first], matches):
+            yield from _ndjson([similar_table_result(score, row, labels, include_labels)])
     except Exception as e:
-        send_error(f"Database error: {e}")
+        yield from _ndjson([{"error": f"Database error: {e}"}])
 
 
 # ─────────────────────────────────────────────
 # Main router
 # ─────────────────────────────────────────────
-def main():
-    method = os.environ.get("REQUEST_METHOD", "GET").upper()
-    path = os.environ.get("PATH_INFO", "/").rstrip("/") or "/"
-    qs = os.environ.get("QUERY_STRING", "")
+def main(environ=None, stdin=None, response=None):
+    """Handle one request.
+
+    With no arguments this is the CGI entry point (os.environ, stdin, stdout).
+    The server passes a per-request environ, body stream and response writer.
+    """
+    _request.environ = os.environ if environ is None else environ
+    _request.stdin = stdin
+    _request.response = response or CGIResponse(sys.stdout.buffer)
+    _request.after = tasks = AfterResponseQueue()
+    _request.timer = timer = RequestTimer()
+    profiler = start_profile()
+    matched = True
+    try:
+        matched = _route() is not False
+    finally:
+        _request.response.finish()
+        environ = request_environ()
+        route = metrics_route(environ.get("REQUEST_METHOD", "GET").upper(),
+                              environ.get("PATH_INFO", "/").rstrip("/") or "/", matched)
+        if profiler is not None:
+            profiler.disable()
+            tasks.add(partial(dump_profile, profiler, route))
+        tasks.add(partial(record_request, route, timer))
+        if _persistent_process:
+            threading.Thread(target=tasks.run, daemon=True).start()
+        else:
+            if isinstance(_request.response, CGIResponse):
+                _request.response.close()
+            tasks.run()
+        _request.environ = _request.stdin = _request.response = _request.after = _request.timer = None
+
+
+def _route():
+    environ = request_environ()
+    method = environ.get("REQUEST_METHOD", "GET").upper()
+    path = environ.get("PATH_INFO", "/").rstrip("/") or "/"
+    qs = environ.get("QUERY_STRING", "")
     params = parse_qs(qs)
 
     # CORS preflight
     if method == "OPTIONS":
-        print("Status: 204")
-        print("Access-Control-Allow-Origin: *")
-        print("Access-Control-Allow-Methods: GET, POST, OPTIONS")
-        print("Access-Control-Allow-Headers: Content-Type")
-        print()
+        current_response().start(204, [
+            ("Access-Control-Allow-Origin", "*"),
+            ("Access-Control-Allow-Methods", "GET, POST, OPTIONS"),
+            ("Access-Control-Allow-Headers", "Content-Type, Range"),
+        ])
         return
 
     # Route dispatch
@@ -639,6 +5317,9 @@ def main():
     elif path == "/companies/filings":
         handle_companies_filings(params)
 
+    elif path == "/companies/dashboard":
+        handle_companies_dashboard(params)
+
     elif path == "/edgar/filings":
         handle_edgar_filings(params)
 
@@ -648,6 +5329,9 @@ def main():
     elif path == "/ratios":
         handle_ratios(params)
 
+    elif path == "/facts":
+        handle_facts(params)
+
     elif path == "/stock":
         handle_stock(params)
 
@@ -660,6 +5344,9 @@ def main():
     elif path == "/search":
         handle_search(params)
 
+    elif path == "/search/batch":
+        handle_search_batch(params)
+
     elif path == "/filing/doc":
         handle_filing_doc(params)
 
@@ -675,6 +5362,18 @@ def main():
     elif path == "/edgar/document":
         handle_edgar_document(params)
 
+    elif path == "/edgar/compare":
+        handle_edgar_compare(params)
+
+    elif path == "/metrics":
+        handle_metrics(params)
+
+    elif path == "/upstream/stats":
+        handle_upstream_stats(params)
+
+    elif path.startswith("/shards/"):
+        handle_shards(path)
+
     elif path == "/tables/similar":
         if method == "POST":
             body = read_body()
@@ -682,6 +5381,16 @@ def main():
         else:
             handle_tables_similar(params)
 
+    elif path == "/tables/similar/batch":
+        if method == "POST":
+            body = read_body()
+            handle_tables_similar_batch(body)
+        else:
+            send_error("Method not allowed — use POST", 405)
+
+    elif path == "/tables/lineage":
+        handle_tables_lineage(params)
+
     elif path == "/tables/find-similar":
         if method == "POST":
             body = read_body()
@@ -691,7 +5400,299 @@ def main():
 
     else:
         send_error(f"Not found: {path}", 404)
+        return False
+
+
+# ─────────────────────────────────────────────
+# Server mode
+# ─────────────────────────────────────────────
+class ServerResponse:
+    """Response writer for APIRequestHandler.
+
+    Uses Content-Length when the handler supplies one, chunked encoding otherwise.
+    """
+
+    def __init__(self, handler):
+        self.handler = handler
+        self.started = False
+        self.chunked = False
+
+    def start(self, status=200, headers=()):
+        headers = timing_headers(status, headers)
+        h = self.handler
+        h.send_response(status)
+        names = set()
+        for name, value in headers:
+            h.send_header(name, value)
+            names.add(name.lower())
+        if status != 204 and status != 304 and "content-length" not in names:
+            h.send_header("Transfer-Encoding", "chunked")
+            # A HEAD response has no body, not even the zero-length last chunk.
+            self.chunked = h.command != "HEAD"
+        h.end_headers()
+        self.started = True
+
+    def write(self, data):
+        if not data or self.handler.command == "HEAD":
+            return
+        if self.chunked:
+            self.handler.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+        else:
+            self.handler.wfile.write(data)
+
+    def flush(self):
+        self.handler.wfile.flush()
+
+    def finish(self):
+        if self.chunked:
+            self.handler.wfile.write(b"0\r\n\r\n")
+            self.chunked = False
+        self.handler.wfile.flush()
+
+
+def static_path_allowed(url_path):
+    """True if serve() may answer url_path (no query string) from the static allowlist."""
+    parts = [p for p in urllib.parse.unquote(url_path).split("/") if p]
+    if any(p.startswith(".") or "\\" in p for p in parts):
+        return False
+    if not parts:
+        return True
+    if len(parts) == 1:
+        return parts[0] in STATIC_FILES or parts[0].endswith(".js")
+    return "/".join(parts).startswith(STATIC_DIRS)
+
+
+class APIRequestHandler(SimpleHTTPRequestHandler):
+    """Serves API_PREFIX through main() and allowlisted static files (static_path_allowed)."""
+
+    protocol_version = "HTTP/1.1"
+    server_version = "WamSEC/1.0"
+
+    def do_GET(self):
+        if not self._dispatch_api():
+            super().do_GET()
+
+    def do_HEAD(self):
+        if not self._dispatch_api():
+            super().do_HEAD()
+
+    def do_POST(self):
+        if not self._dispatch_api():
+            self.send_error(405)
+
+    def send_head(self):
+        path = self.path.split("?", 1)[0].split("#", 1)[0]
+        if not static_path_allowed(path):
+            self.send_error(404)
+            return None
+        return super().send_head()
+
+    def list_directory(self, path):
+        self.send_error(404)
+        return None
+
+    def do_OPTIONS(self):
+        if not self._dispatch_api():
+            self.send_error(405)
+
+    def _dispatch_api(self):
+        path, _, qs = self.path.partition("?")
+        if path != API_PREFIX and not path.startswith(API_PREFIX + "/"):
+            return False
+        environ = {
+            "REQUEST_METHOD": self.command,
+            "PATH_INFO": urllib.parse.unquote(path[len(API_PREFIX):]) or "/",
+            "QUERY_STRING": qs,
+            "CONTENT_LENGTH": self.headers.get("Content-Length", ""),
+            "CONTENT_TYPE": self.headers.get("Content-Type", ""),
+            "REMOTE_ADDR": self.client_address[0],
+            "SERVER_PROTOCOL": self.request_version,
+        }
+        for name, value in self.headers.items():
+            environ["HTTP_" + name.upper().replace("-", "_")] = value
+        response = ServerResponse(self)
+        try:
+            main(environ, self.rfile, response)
+        except Exception as e:
+            self.log_error("Unhandled error on %s: %r", self.path, e)
+            if not response.started:
+                body = (json.dumps({"error": str(e)}) + "\n").encode("utf-8")
+                response.start(500, [
+                    ("Content-Type", "application/json"),
+                    ("Access-Control-Allow-Origin", "*"),
+                    ("Content-Length", str(len(body))),
+                ])
+                response.write(body)
+                response.finish()
+            else:
+                self.close_connection = True
+        return True
+
+
+def _warm_up():
+    """Load tickers and build the search index before the first request needs them."""
+    try:
+        company_search_index(load_company_tickers())
+    except Exception as e:
+        print(f"Warm-up failed: {e}", file=sys.stderr)
+
+
+def serve(host=SERVER_HOST, port=SERVER_PORT, profile_rate=None):
+    """Run the threaded server until interrupted.
+
+    Runs from the cgi-bin directory so relative state paths (tables.db,
+    company_tickers.json) resolve the same way they do under CGI.
+    profile_rate overrides PROFILE_SAMPLE_RATE.
+    """
+    global _persistent_process, PROFILE_SAMPLE_RATE
+    _persistent_process = True
+    if profile_rate is not None:
+        PROFILE_SAMPLE_RATE = profile_rate
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    os.chdir(script_dir)
+    threading.Thread(target=_warm_up, daemon=True).start()
+    site_root = os.path.dirname(script_dir)
+    handler = partial(APIRequestHandler, directory=site_root)
+    httpd = ThreadingHTTPServer((host, port), handler)
+    httpd.daemon_threads = True
+    print(f"WamSEC serving http://{host}:{port}/ (API at {API_PREFIX})", file=sys.stderr)
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        httpd.server_close()
+
+
+# ─────────────────────────────────────────────
+# Command line
+# ─────────────────────────────────────────────
+def _state_path(path, default):
+    """A CLI path option: as given (relative to the caller's cwd), else `default` under cgi-bin/."""
+    return os.path.abspath(path) if path else os.path.join(os.path.dirname(os.path.abspath(__file__)), default)
+
+
+def cli(argv):
+    import argparse
+
+    parser = argparse.ArgumentParser(prog="api.py", description="WamSEC backend")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("serve", help="run the long-running threaded HTTP server")
+    p.add_argument("--host", default=SERVER_HOST)
+    p.add_argument("--port", type=int, default=SERVER_PORT)
+    p.add_argument("--profile-rate", type=float, default=None,
+                   help="share of requests (0-1) to run under cProfile, dumped to cgi-bin/profiles/")
+
+    p = sub.add_parser("index-tables", help="build, refresh or migrate the similar-tables index in tables.db")
+    p.add_argument("--db", default=None, help="path to tables.db (default: cgi-bin/tables.db)")
+    p.add_argument("--rebuild", action="store_true", help="reindex every row")
+
+    p = sub.add_parser("link-tables", help="precompute each table's matches in earlier filings (/tables/lineage)")
+    p.add_argument("--db", default=None, help="path to tables.db (default: cgi-bin/tables.db)")
+    p.add_argument("--rebuild", action="store_true", help="relink every filing")
+    p.add_argument("--tickers", default="", help="comma-separated tickers (default: all)")
+
+    p = sub.add_parser("ingest-tables", help="fetch filings and extract their tables into tables.db")
+    p.add_argument("--db", default=None, help="path to tables.db (default: cgi-bin/tables.db)")
+    p.add_argument("--tickers", default="", help="comma-separated tickers")
+    p.add_argument("--from", dest="date_from", default=None, help="first filing date (YYYY-MM-DD)")
+    p.add_argument("--to", dest="date_to", default=None, help="last filing date (YYYY-MM-DD)")
+    p.add_argument("--forms", default=",".join(INGEST_DEFAULT_FORMS), help="comma-separated form types")
+    p.add_argument("--workers", type=int, default=None, help="parser processes (default: CPU count)")
+    p.add_argument("--batch", type=int, default=25, help="filings per SQLite transaction")
+
+    p = sub.add_parser("ingest-facts", help="load SEC companyfacts (XBRL) into facts.db for /facts")
+    p.add_argument("--db", default=None, help="path to facts.db (default: cgi-bin/facts.db)")
+    p.add_argument("--tickers", default="", help="comma-separated tickers")
+    p.add_argument("--fixtures", default=None,
+                   help="directory of CIK##########.json files (e.g. unzipped companyfacts.zip) to read"
+                        " instead of data.sec.gov; without --tickers every file is loaded")
+    p.add_argument("--workers", type=int, default=4, help="download/parse threads")
+    p.add_argument("--max-age", type=float, default=24, help="hours before a downloaded company is refetched")
+    p.add_argument("--refresh", action="store_true", help="reload every company")
+
+    p = sub.add_parser("build-shards", help="write the /shards/ manifest and content-hashed shards")
+    p.add_argument("--out", default=None, help="output directory (default: ../shards)")
+    p.add_argument("--db", default=None, help="path to tables.db (its tickers are listed, not sharded)")
+    p.add_argument("--tables-index", default=None, help="path to tables_index.js")
+    p.add_argument("--tickers-js", default=None, help="path to company_tickers.js")
+
+    p = sub.add_parser("warm-filings", help="preload the filing store and full-text index with the filings in embedded_data.js")
+    p.add_argument("--data", default=None, help="path to embedded_data.js")
+    p.add_argument("--forms", default="", help="comma-separated form types to include (default: all)")
+    p.add_argument("--delay", type=float, default=0.1, help="seconds between EDGAR requests")
+
+    args = parser.parse_args(argv)
+    if args.command == "serve":
+        serve(args.host, args.port, args.profile_rate)
+    elif args.command == "index-tables":
+        db_path = _state_path(args.db, TABLES_DB)
+        if not os.path.exists(db_path):
+            parser.error(f"{db_path} not found (run ingest-tables first)")
+        conn = sqlite3.connect(db_path)
+        n = index_tables(conn, rebuild=args.rebuild)
+        conn.close()
+        print(f"Indexed {n} tables in {db_path}", file=sys.stderr)
+    elif args.command == "link-tables":
+        tickers = {t.strip().upper() for t in args.tickers.split(",") if t.strip()}
+        db_path = _state_path(args.db, TABLES_DB)
+        if not os.path.exists(db_path):
+            parser.error(f"{db_path} not found (run ingest-tables first)")
+        conn = sqlite3.connect(db_path)
+        started = time.monotonic()
+        filings, links = update_table_lineage(conn, rebuild=args.rebuild, tickers=tickers or None)
+        conn.close()
+        print(f"Linked {filings} filings ({links} table links) in {time.monotonic() - started:.1f} s",
+              file=sys.stderr)
+    elif args.command == "warm-filings":
+        data_path = os.path.abspath(args.data) if args.data else None
+        # Same relative paths as CGI: the store lives under cgi-bin/.
+        os.chdir(os.path.dirname(os.path.abspath(__file__)))
+        forms = {f.strip() for f in args.forms.split(",") if f.strip()}
+        stored, fetched, failed = warm_filings(data_path or EMBEDDED_DATA_JS, forms, args.delay)
+        print(f"Filing store: {fetched} fetched, {stored} already stored, {failed} failed", file=sys.stderr)
+    elif args.command == "build-shards":
+        paths = [os.path.abspath(x) if x else None for x in (args.out, args.db, args.tables_index, args.tickers_js)]
+        # Defaults are relative to cgi-bin/, like the CGI process.
+        os.chdir(os.path.dirname(os.path.abspath(__file__)))
+        out_dir, db_path, tables_js, tickers_js = (
+            x or default for x, default in zip(paths, (SHARDS_DIR, TABLES_DB, TABLES_INDEX_JS, COMPANY_TICKERS_JS)))
+        manifest = build_shards(out_dir, db_path, tables_js, tickers_js)
+        meta = manifest["tables"]["meta"]
+        print(f"Wrote {len(manifest['tables']['tickers'])} ticker shards ({meta['tables_count']} tables),"
+              f" {len(manifest['tokens']['files'])} token shards and {len(manifest['companies']['files'])}"
+              f" company shards to {os.path.abspath(out_dir)}", file=sys.stderr)
+    elif args.command == "ingest-facts":
+        tickers = [t.strip().upper() for t in args.tickers.split(",") if t.strip()]
+        if not tickers and not args.fixtures:
+            parser.error("ingest-facts needs --tickers or --fixtures")
+        db_path = _state_path(args.db, FACTS_DB)
+        fixtures = os.path.abspath(args.fixtures) if args.fixtures else None
+        os.chdir(os.path.dirname(os.path.abspath(__file__)))
+        conn = sqlite3.connect(db_path)
+        companies, facts, skipped, failed, secs = ingest_facts(
+            conn, facts_jobs(tickers, fixtures), args.workers, args.max_age * 3600, args.refresh)
+        conn.close()
+        print(f"Ingested {facts} facts for {companies} companies in {secs:.1f} s,"
+              f" {skipped} up to date, {failed} failed", file=sys.stderr)
+    elif args.command == "ingest-tables":
+        tickers = [t.strip().upper() for t in args.tickers.split(",") if t.strip()]
+        if not tickers and not args.date_from:
+            parser.error("ingest-tables needs --tickers or --from")
+        db_path = _state_path(args.db, TABLES_DB)
+        os.chdir(os.path.dirname(os.path.abspath(__file__)))
+        forms = [f.strip().upper() for f in args.forms.split(",") if f.strip()]
+        jobs = list(ingest_jobs(tickers, args.date_from, args.date_to, forms))
+        conn = sqlite3.connect(db_path)
+        done, tables, failed, secs = ingest_tables(conn, jobs, args.workers, args.batch)
+        conn.close()
+        print(f"Ingested {tables} tables from {done} filings in {secs:.1f} s"
+              f" ({tables / max(secs, 1e-9):.1f} tables/s), {failed} failed", file=sys.stderr)
 
 
 if __name__ == "__main__":
-    main()
+    if len(sys.argv) > 1 and "GATEWAY_INTERFACE" not in os.environ:
+        cli(sys.argv[1:])
+    else:
+        main()
@@ -0,0 +1,111 @@
+"""Range handling for /edgar/document?format=raw: parse_byte_range and 206/416/If-Range."""
+
+import gzip
+import io
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "cgi-bin"))
+
+import api  # noqa: E402
+
+UNSATISFIABLE = "416"
+
+
+@pytest.mark.parametrize("header, size, expected", [
+    ("bytes=0-99", 1000, (0, 99)),
+    ("bytes=0-0", 1000, (0, 0)),
+    ("bytes=999-999", 1000, (999, 999)),
+    ("bytes=500-", 1000, (500, 999)),
+    ("bytes=900-5000", 1000, (900, 999)),
+    ("bytes=-100", 1000, (900, 999)),
+    ("bytes=-5000", 1000, (0, 999)),          # suffix longer than the body: all of it
+    ("bytes=-0", 1000, UNSATISFIABLE),
+    ("bytes=1000-", 1000, UNSATISFIABLE),     # start at the size
+    ("bytes=2000-3000", 1000, UNSATISFIABLE),  # start beyond the size
+    ("bytes=5-3", 1000, None),                # last < first: ignored
+    ("bytes=0-1,5-6", 1000, None),            # multi-range: ignored
+    ("bytes=-", 1000, None),
+    ("bytes=a-b", 1000, None),
+    ("bytes=1", 1000, None),
+    ("items=0-1", 1000, None),
+    (" BYTES = 1-2 ", 1000, (1, 2)),
+])
+def test_parse_byte_range(header, size, expected):
+    if expected == UNSATISFIABLE:
+        with pytest.raises(ValueError):
+            api.parse_byte_range(header, size)
+    else:
+        assert api.parse_byte_range(header, size) == expected
+
+
+class Response:
+    def __init__(self):
+        self.status = None
+        self.headers = {}
+        self.body = io.BytesIO()
+        self.started = False
+
+    def start(self, status=200, headers=()):
+        self.status, self.headers, self.started = status, dict(headers), True
+
+    def write(self, data):
+        self.body.write(data)
+
+    def flush(self):
+        pass
+
+    def finish(self):
+        pass
+
+
+KEY = "ab" * 32
+GZ = gzip.compress(b"<html>" + b"x" * 5000 + b"</html>")
+ETAG = f'"{KEY[:20]}-gzip"'
+
+
+@pytest.fixture
+def send(tmp_path, monkeypatch):
+    monkeypatch.setattr(api, "_filing_store", api.FilingStore(str(tmp_path / "filings")))
+
+    def send(**headers):
+        environ = {"HTTP_ACCEPT_ENCODING": "gzip"}
+        environ.update(("HTTP_" + k.upper(), v) for k, v in headers.items())
+        response = Response()
+        monkeypatch.setattr(api._request, "environ", environ, raising=False)
+        monkeypatch.setattr(api._request, "response", response, raising=False)
+        api.send_filing_document(KEY, GZ)
+        return response
+    return send
+
+
+@pytest.mark.parametrize("headers, status, body, content_range", [
+    ({}, 200, GZ, None),
+    ({"range": "bytes=0-0"}, 206, GZ[:1], f"bytes 0-0/{len(GZ)}"),
+    ({"range": "bytes=10-19"}, 206, GZ[10:20], f"bytes 10-19/{len(GZ)}"),
+    ({"range": "bytes=-10"}, 206, GZ[-10:], f"bytes {len(GZ) - 10}-{len(GZ) - 1}/{len(GZ)}"),
+    ({"range": f"bytes=-{len(GZ) * 2}"}, 206, GZ, f"bytes 0-{len(GZ) - 1}/{len(GZ)}"),
+    ({"range": "bytes=-0"}, 416, b"", f"bytes */{len(GZ)}"),
+    ({"range": f"bytes={len(GZ)}-"}, 416, b"", f"bytes */{len(GZ)}"),
+    ({"range": "bytes=5-3"}, 200, GZ, None),
+    ({"range": "bytes=0-1,4-5"}, 200, GZ, None),
+    ({"range": "bytes=0-9", "if_range": ETAG}, 206, GZ[:10], f"bytes 0-9/{len(GZ)}"),
+    ({"range": "bytes=0-9", "if_range": '"stale"'}, 200, GZ, None),
+])
+def test_send_filing_document_ranges(send, headers, status, body, content_range):
+    response = send(**headers)
+    assert response.status == status
+    assert response.body.getvalue() == body
+    assert response.headers.get("Content-Range") == content_range
+    if status != 416:
+        assert response.headers["Content-Encoding"] == "gzip"
+        assert response.headers["Accept-Ranges"] == "bytes"
+
+
+def test_send_filing_document_not_modified(send):
+    response = send(if_none_match=ETAG, range="bytes=0-9")
+    assert response.status == 304
+    assert response.body.getvalue() == b""
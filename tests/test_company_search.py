@@ -0,0 +1,77 @@
+"""CompanySearchIndex must rank exactly like the linear scan it replaces."""
+
+import json
+import os
+import random
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "cgi-bin"))
+
+from api import CompanySearchIndex, scan_companies  # noqa: E402
+
+
+def company_tickers():
+    """company_tickers.js reshaped like SEC's company_tickers.json."""
+    with open(os.path.join(ROOT, "company_tickers.js"), encoding="utf-8") as f:
+        text = f.read()
+    data, _ = json.JSONDecoder().raw_decode(text, text.index("{"))
+    return {
+        str(i): {"cik_str": entry["cik"], "ticker": ticker, "title": entry["name"]}
+        for i, (ticker, entry) in enumerate(data.items())
+    }
+
+
+def queries(tickers_data, rng, n):
+    entries = list(tickers_data.values())
+    letters = "ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789 "
+    out = ["A", "AA", "Z", "APPLE", "INC", "CORP", "XQZ", "&", "-", "BRK.B", "1"]
+    while len(out) < n:
+        entry = rng.choice(entries)
+        ticker, name = entry["ticker"].upper(), entry["title"].upper()
+        kind = rng.randrange(6)
+        if kind == 0:
+            q = ticker[:rng.randint(1, len(ticker))]
+        elif kind == 1:
+            q = name[:rng.randint(1, min(len(name), 12))]
+        elif kind == 2:
+            start = rng.randrange(len(name))
+            q = name[start:start + rng.randint(1, 6)]
+        elif kind == 3:
+            q = rng.choice(name.split())
+        elif kind == 4:
+            # One or two typos in a ticker: the Levenshtein tiers.
+            q = list(ticker)
+            for _ in range(rng.randint(1, 2)):
+                q[rng.randrange(len(q))] = rng.choice(letters[:-1])
+            q = "".join(q)
+        else:
+            q = "".join(rng.choice(letters) for _ in range(rng.randint(1, 5)))
+        q = q.strip()
+        if q:
+            out.append(q)
+    return out
+
+
+def test_index_matches_scan():
+    tickers_data = company_tickers()
+    index = CompanySearchIndex(tickers_data)
+    for q in queries(tickers_data, random.Random(0), 80):
+        # The scan's stable sort makes any limit a prefix of a longer one.
+        want = scan_companies(tickers_data, q, 50)
+        for limit in (1, 10, 50):
+            assert index.search(q, limit) == want[:limit], (q, limit)
+
+
+def test_index_matches_scan_on_duplicates_and_blanks():
+    # Repeated tickers/names and empty fields exercise the tie order.
+    tickers_data = {
+        "0": {"cik_str": 1, "ticker": "ABC", "title": "Abc Holdings"},
+        "1": {"cik_str": 2, "ticker": "ABC", "title": "Abc Holdings"},
+        "2": {"cik_str": 3, "ticker": "", "title": "Blank Ticker Co"},
+        "3": {"cik_str": 4, "ticker": "ABD", "title": ""},
+        "4": {"cik_str": 5, "ticker": "XABC", "title": "The ABC Group"},
+    }
+    index = CompanySearchIndex(tickers_data)
+    for q in ("ABC", "AB", "A", "ABD", "ABX", "BLANK", "GROUP", "C", "ZZZ"):
+        assert index.search(q, 10) == scan_companies(tickers_data, q, 10), q
@@ -0,0 +1,161 @@
+"""XBRL facts: companyfacts_rows, ingest-facts from fixtures and the /facts endpoint."""
+
+import io
+import json
+import os
+import sqlite3
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "cgi-bin"))
+
+import api  # noqa: E402
+
+APPLE = {
+    "cik": 320193,
+    "entityName": "Apple Inc.",
+    "facts": {
+        "us-gaap": {
+            "Revenues": {
+                "label": "Revenues",
+                "units": {"USD": [
+                    # FY2023 as first filed, then restated in the FY2024 10-K (which has no frame).
+                    {"start": "2022-09-25", "end": "2023-09-30", "val": 383285, "fy": 2023, "fp": "FY",
+                     "form": "10-K", "filed": "2023-11-03", "accn": "0000320193-23-000106", "frame": "CY2023"},
+                    {"start": "2022-09-25", "end": "2023-09-30", "val": 383300, "fy": 2024, "fp": "FY",
+                     "form": "10-K", "filed": "2024-11-01", "accn": "0000320193-24-000123"},
+                    {"start": "2023-09-30", "end": "2024-09-28", "val": 391035, "fy": 2024, "fp": "FY",
+                     "form": "10-K", "filed": "2024-11-01", "accn": "0000320193-24-000123", "frame": "CY2024"},
+                    {"start": "2024-06-30", "end": "2024-09-28", "val": 94930, "fy": 2024, "fp": "Q4",
+                     "form": "10-K", "filed": "2024-11-01", "accn": "0000320193-24-000123"},
+                    {"start": "2024-06-30", "end": "2024-09-28", "val": "n/a"},
+                    {"start": "2024-06-30", "end": "2024-09-28", "val": True},
+                    {"start": "bad", "end": "2024-09-28", "val": 1},
+                ]},
+            },
+        },
+        "dei": {
+            "EntityCommonStockSharesOutstanding": {
+                "label": "Shares outstanding",
+                "units": {"shares": [
+                    {"end": "2024-10-18", "val": 15115823000, "fy": 2024, "fp": "FY", "form": "10-K",
+                     "filed": "2024-11-01", "accn": "0000320193-24-000123", "frame": "CY2024Q3I"},
+                ]},
+            },
+        },
+    },
+}
+
+
+def test_companyfacts_rows_keeps_latest_filing():
+    rows = {(r[0], r[3], r[4]): r for r in api.companyfacts_rows(APPLE)}
+    assert len(rows) == 4
+    restated = rows[("us-gaap:Revenues", "2022-09-25", "2023-09-30")]
+    # The restatement wins, and keeps the frame only the original carried.
+    assert restated[6] == 383300 and restated[10] == "2024-11-01" and restated[12] == "CY2023"
+    assert rows[("us-gaap:Revenues", "2023-09-30", "2024-09-28")][5] == 364
+    assert rows[("us-gaap:Revenues", "2024-06-30", "2024-09-28")][5] == 90
+    instant = rows[("dei:EntityCommonStockSharesOutstanding", "", "2024-10-18")]
+    assert instant[1] == "Shares outstanding" and instant[2] == "shares" and instant[5] == 0
+
+
+@pytest.fixture
+def fixtures(tmp_path):
+    directory = tmp_path / "companyfacts"
+    directory.mkdir()
+    (directory / "CIK0000320193.json").write_text(json.dumps(APPLE))
+    msft = {"cik": 789019, "entityName": "MICROSOFT CORP", "facts": {"us-gaap": {"Revenues": {"units": {"USD": [
+        {"start": "2023-07-01", "end": "2024-06-30", "val": 245122, "fy": 2024, "fp": "FY", "form": "10-K",
+         "filed": "2024-07-30", "accn": "0000950170-24-087843"}]}}}}}
+    (directory / "CIK0000789019.json").write_text(json.dumps(msft))
+    return directory
+
+
+@pytest.fixture
+def tickers(monkeypatch):
+    # AAPL and AAPX share a CIK, as share classes do.
+    ticker_map = api.TickerMap({
+        "0": {"cik_str": 320193, "ticker": "AAPL", "title": "Apple Inc."},
+        "1": {"cik_str": 320193, "ticker": "AAPX", "title": "Apple Inc."},
+        "2": {"cik_str": 789019, "ticker": "MSFT", "title": "MICROSOFT CORP"},
+        "3": {"cik_str": 1018724, "ticker": "AMZN", "title": "AMAZON COM INC"},
+    })
+    monkeypatch.setattr(api, "company_ticker_map", lambda: ticker_map)
+    return ticker_map
+
+
+def test_ingest_facts_from_fixtures(tmp_path, fixtures, tickers):
+    conn = sqlite3.connect(str(tmp_path / "facts.db"))
+    jobs = list(api.facts_jobs(fixtures=str(fixtures)))
+    assert [(j.cik, j.ticker) for j in jobs] == [(320193, "AAPL"), (789019, "MSFT")]
+    companies, facts, skipped, failed, _ = api.ingest_facts(conn, jobs, workers=2)
+    assert (companies, facts, skipped, failed) == (2, 5, 0, 0)
+    # Unchanged fixture files are skipped unless refresh is set.
+    assert api.ingest_facts(conn, jobs)[:4] == (0, 0, 2, 0)
+    assert api.ingest_facts(conn, jobs, refresh=True)[:4] == (2, 5, 0, 0)
+    assert conn.execute("SELECT COUNT(*) FROM facts").fetchone()[0] == 5
+    assert conn.execute("SELECT COUNT(*) FROM fact_concepts").fetchone()[0] == 2
+
+
+def test_ingest_facts_cli(tmp_path, fixtures, tickers, monkeypatch):
+    monkeypatch.chdir(tmp_path)  # cli() moves into cgi-bin/; monkeypatch restores the cwd
+    db_path = tmp_path / "out" / "facts.db"
+    db_path.parent.mkdir()
+    api.cli(["ingest-facts", "--fixtures", str(fixtures), "--db", str(db_path)])
+    conn = sqlite3.connect(str(db_path))
+    assert conn.execute("SELECT COUNT(*) FROM fact_companies").fetchone()[0] == 2
+
+
+class Response:
+    def __init__(self):
+        self.status = None
+        self.headers = {}
+        self.body = io.BytesIO()
+        self.started = False
+
+    def start(self, status=200, headers=()):
+        self.status, self.headers, self.started = status, dict(headers), True
+
+    def write(self, data):
+        self.body.write(data)
+
+    def flush(self):
+        pass
+
+    def finish(self):
+        pass
+
+
+def get(path, qs):
+    response = Response()
+    api.main({"REQUEST_METHOD": "GET", "PATH_INFO": path, "QUERY_STRING": qs}, io.BytesIO(), response)
+    return response.status, json.loads(response.body.getvalue())
+
+
+def test_facts_endpoint(tmp_path, fixtures, tickers, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    status, body = get("/facts", "tickers=AAPL&concepts=Revenues")
+    assert status == 503
+
+    conn = sqlite3.connect(api.FACTS_DB)
+    api.ingest_facts(conn, list(api.facts_jobs(fixtures=str(fixtures))))
+    conn.close()
+
+    status, body = get("/facts", "tickers=aapx,MSFT,AMZN,AAPL,320193&concepts=Revenues&period=annual")
+    assert status == 200
+    # Every ticker that maps to a CIK gets its own copy of that CIK's series, in request order.
+    assert [s["ticker"] for s in body["series"]] == ["AAPX", "MSFT", "AAPL", "320193"]
+    assert body["missing"] == ["AMZN"]
+    apple = body["series"][0]
+    assert apple["cik"] == "0000320193" and apple["name"] == "Apple Inc."
+    assert apple["periods"]["end"] == ["2023-09-30", "2024-09-28"]
+    assert apple["periods"]["value"] == [383300, 391035]
+
+    status, body = get("/facts", "tickers=AAPL&concepts=us-gaap:Revenues&period=quarterly")
+    assert [s["periods"]["value"] for s in body["series"]] == [[94930]]
+    status, body = get("/facts", "tickers=AAPL&concepts=EntityCommonStockSharesOutstanding&period=instant")
+    assert body["series"][0]["unit"] == "shares"
+    status, body = get("/facts", "tickers=AAPL&concepts=Revenues&period=weekly")
+    assert status == 400
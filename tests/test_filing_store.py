@@ -0,0 +1,114 @@
+"""FilingStore: running size file, daily resync and LRU eviction by mtime."""
+
+import os
+import struct
+import sys
+import time
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "cgi-bin"))
+
+import api  # noqa: E402
+
+
+def key(i):
+    return api.FilingStore.key("320193", f"0000320193-25-{i:06d}", "doc.htm")
+
+
+def size_file(store):
+    """(total, walked_at) recorded in the store's size file, or None."""
+    try:
+        with open(os.path.join(store.root, store.SIZE_FILE), "rb") as f:
+            raw = f.read()
+    except FileNotFoundError:
+        return None
+    return struct.unpack("qd", raw) if len(raw) == 16 else None
+
+
+def on_disk(store):
+    total = 0
+    for dirpath, _, names in os.walk(store.root):
+        total += sum(os.path.getsize(os.path.join(dirpath, n)) for n in names if n.endswith(api.FILING_STORE_SUFFIXES))
+    return total
+
+
+@pytest.fixture
+def store(tmp_path):
+    return api.FilingStore(str(tmp_path / "filings"), max_bytes=10000)
+
+
+def age(store, k, seconds):
+    path = store.path(k)
+    mtime = time.time() - seconds
+    os.utime(path, (mtime, mtime))
+
+
+def test_get_put_roundtrip(store):
+    assert store.get(key(1)) is None
+    store.put(key(1), b"gz bytes")
+    store.put(key(1), b"br bytes", ".br")
+    assert store.get(key(1)) == b"gz bytes"
+    assert store.get(key(1), ".br") == b"br bytes"
+
+
+def test_evicts_oldest_past_max_bytes(store):
+    for i in range(8):
+        store.put(key(i), b"x" * 1000)
+        age(store, key(i), 1000 - i)  # key(0) is the least recently used
+    assert store.evict() == 0
+    assert size_file(store)[0] == on_disk(store) == 8000
+
+    for i in range(8, 12):
+        store.put(key(i), b"x" * 1000)
+    assert size_file(store)[0] == 12000
+    # 12000 > 10000: evict down to 90% of the cap, oldest first.
+    assert store.evict() == 3
+    assert [store.get(key(i)) is None for i in range(12)] == [True] * 3 + [False] * 9
+    assert size_file(store)[0] == on_disk(store) == 9000
+
+
+def test_hits_refresh_the_lru_clock(store):
+    for i in range(10):
+        store.put(key(i), b"x" * 1000)
+        age(store, key(i), 2 * store.TOUCH_INTERVAL + 10 - i)
+    store.get(key(0))  # older than TOUCH_INTERVAL, so the hit touches it
+    store.put(key(10), b"x" * 1000)
+    store.evict()
+    assert store.get(key(0)) is not None
+    assert store.get(key(1)) is None and store.get(key(2)) is None
+
+
+def test_overwrites_are_counted_once(store):
+    store.evict()  # seed the size file
+    store.put(key(1), b"x" * 1000)
+    store.put(key(1), b"y" * 400)
+    assert size_file(store)[0] == on_disk(store) == 400
+
+
+def test_evict_skips_the_walk_while_under_the_cap(store, monkeypatch):
+    store.put(key(1), b"x" * 1000)
+    store.evict()
+    walks = []
+    real_walk = store._evict_walk
+    monkeypatch.setattr(store, "_evict_walk", lambda: walks.append(1) or real_walk())
+    store.put(key(2), b"x" * 1000)
+    store.evict()
+    assert walks == []
+    assert size_file(store)[0] == 2000
+
+
+def test_daily_resync_corrects_drift(store):
+    store.put(key(1), b"x" * 1000)
+    store.evict()
+    # A file removed behind the store's back leaves the running total high.
+    os.remove(store.path(key(1)))
+    store.put(key(2), b"x" * 500)
+    assert size_file(store)[0] == 1500
+    with open(os.path.join(store.root, store.SIZE_FILE), "r+b") as f:
+        f.write(struct.pack("qd", 1500, time.time() - store.RESYNC_INTERVAL - 1))
+    store.evict()
+    total, walked_at = size_file(store)
+    assert total == on_disk(store) == 500
+    assert walked_at > time.time() - 60
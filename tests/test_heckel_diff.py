@@ -0,0 +1,98 @@
+"""heckel_diff() accounts for every block once; compare_filings() sums its ops."""
+
+import gzip
+import os
+import random
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "cgi-bin"))
+
+from api import compare_filings, heckel_diff  # noqa: E402
+
+
+def edit(old, rng):
+    """old with a few random deletes, inserts and moves."""
+    new = list(old)
+    for _ in range(rng.randrange(6)):
+        k = rng.random()
+        if k < 0.3 and new:
+            del new[rng.randrange(len(new))]
+        elif k < 0.6:
+            new.insert(rng.randrange(len(new) + 1), rng.randrange(20))
+        elif new:
+            block = new.pop(rng.randrange(len(new)))
+            new.insert(rng.randrange(len(new) + 1), block)
+    return new
+
+
+def test_random_edits_are_fully_accounted():
+    rng = random.Random(0)
+    for _ in range(3000):
+        # A small alphabet makes repeated blocks (no unique anchor) common.
+        old = [rng.randrange(12) for _ in range(rng.randrange(30))]
+        new = edit(old, rng)
+        ops = heckel_diff(old, new)
+        # Every new block once, in order; every old block once.
+        assert [j for _, _, j in ops if j is not None] == list(range(len(new))), (old, new, ops)
+        assert sorted(i for _, i, _ in ops if i is not None) == list(range(len(old))), (old, new, ops)
+        for op, i, j in ops:
+            if op in ("equal", "moved"):
+                assert old[i] == new[j]
+        # Equal blocks keep old order; identical inputs are all equal.
+        equal = [i for op, i, _ in ops if op == "equal"]
+        assert equal == sorted(equal)
+        if old == new:
+            assert all(op == "equal" for op, _, _ in ops)
+
+
+def test_edge_cases():
+    assert heckel_diff([], []) == []
+    assert heckel_diff([], [1, 1]) == [("insert", None, 0), ("insert", None, 1)]
+    assert heckel_diff([1, 1], []) == [("delete", 0, None), ("delete", 1, None)]
+    assert heckel_diff([1, 2, 3], [3, 1, 2]) == [("moved", 2, 0), ("equal", 0, 1), ("equal", 1, 2)]
+
+
+def filing(sections):
+    body = "".join(
+        f"<p><b>Item {item}. {title}</b></p>" + "".join(f"<p>{p}</p>" for p in paras)
+        for item, title, paras in sections
+    )
+    return gzip.compress(f"<html><body><div>ACME CORP FORM 10-K</div>{body}</body></html>".encode("utf-8"))
+
+
+def test_compare_summary_matches_ops():
+    business = [f"business paragraph {i}" for i in range(30)]
+    risks = [f"risk factor {i} could hurt results" for i in range(40)]
+    a = filing([("1", "Business", business), ("1A", "Risk Factors", risks), ("3", "Legal Proceedings", ["none"])])
+    b = filing([
+        ("1", "Business", business),
+        ("1A", "Risk Factors", risks[:10] + ["a new risk"] + risks[10:30] + risks[31:] + [risks[0] + " (moved)"]),
+        ("9A", "Controls and Procedures", ["controls are effective"]),
+    ])
+    result = compare_filings(a, b)
+    assert {s["id"]: s["status"] for s in result["sections"]} == {
+        "cover": "unchanged", "item 1": "unchanged", "item 1a": "changed", "item 9a": "added", "item 3": "removed",
+    }
+
+    summary = result["summary"]
+    counts = {"insert": 0, "delete": 0, "moved": 0}
+    for section in result["sections"]:
+        blocks_a = blocks_b = 0
+        for op in section["ops"]:
+            if op["op"] == "equal":
+                blocks_a += op["count"]
+                blocks_b += op["count"]
+                continue
+            counts[op["op"]] += 1
+            blocks_a += op["op"] in ("delete", "moved")
+            blocks_b += op["op"] in ("insert", "moved")
+        assert (blocks_a, blocks_b) == (section["blocks_a"], section["blocks_b"]), section["id"]
+    assert (summary["blocks_inserted"], summary["blocks_deleted"], summary["blocks_moved"]) == \
+        (counts["insert"], counts["delete"], counts["moved"])
+    assert (summary["sections_changed"], summary["sections_added"], summary["sections_removed"]) == (1, 1, 1)
+    assert summary["blocks_inserted"] >= 2 and summary["blocks_deleted"] >= 1
+
+    same = compare_filings(a, a)
+    assert all(s["status"] == "unchanged" for s in same["sections"])
+    assert not any(same["summary"].values())
@@ -0,0 +1,147 @@
+"""Table lineage: update_table_lineage / link-tables and the /tables/lineage endpoint."""
+
+import io
+import json
+import os
+import sqlite3
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "cgi-bin"))
+
+import api  # noqa: E402
+
+INCOME_ROWS = ["Revenue", "Cost of revenue", "Gross profit", "Net income"]
+BALANCE = (["", "December 31"], ["Cash", "Receivables", "Total assets", "Total liabilities"])
+
+
+def income(year):
+    return ["", str(year), str(year - 1)], INCOME_ROWS
+
+
+def add_filing(conn, ticker, filing_id, filed_date, tables):
+    conn.executemany(
+        "INSERT INTO tables (filing_id, ticker, form_type, filed_date, table_idx, headers, row_labels, row_count)"
+        " VALUES (?, ?, '10-K', ?, ?, ?, ?, ?)",
+        [(filing_id, ticker, filed_date, idx, json.dumps(headers), json.dumps(rows), len(rows))
+         for idx, (headers, rows) in enumerate(tables)])
+    conn.commit()
+
+
+@pytest.fixture
+def conn(tmp_path):
+    conn = sqlite3.connect(str(tmp_path / "tables.db"))
+    conn.row_factory = sqlite3.Row
+    conn.executescript(api.TABLES_SCHEMA)
+    add_filing(conn, "AAA", "aaa-2022", "2022-02-01", [income(2021), BALANCE])
+    add_filing(conn, "AAA", "aaa-2023", "2023-02-01", [income(2022), BALANCE])
+    # Same labels under another ticker: never linked to AAA.
+    add_filing(conn, "BBB", "bbb-2023", "2023-03-01", [income(2022)])
+    return conn
+
+
+def chain(conn, filing_id, table_idx):
+    _, lineage = api.table_lineage(conn, filing_id, table_idx)
+    return [(row["filing_id"], row["table_idx"], round(score, 4)) for score, row in lineage]
+
+
+def test_links_each_table_to_its_best_match_per_earlier_filing(conn):
+    assert api.table_lineage(conn, "aaa-2023", 0)[1] == []  # not linked yet
+    assert api.update_table_lineage(conn) == (3, 2)
+    # Headers share one of three years (0.6 / 3) and the row labels all match (0.4).
+    assert chain(conn, "aaa-2023", 0) == [("aaa-2022", 0, 0.6)]
+    assert chain(conn, "aaa-2023", 1) == [("aaa-2022", 1, 1.0)]
+    assert chain(conn, "aaa-2022", 0) == []
+    assert chain(conn, "bbb-2023", 0) == []
+    assert api.table_lineage(conn, "aaa-2023", 9) is None
+    assert api.update_table_lineage(conn) == (0, 0)
+
+
+def test_new_filings_are_linked_in_both_directions(conn):
+    api.update_table_lineage(conn)
+    add_filing(conn, "AAA", "aaa-2024", "2024-02-01", [income(2023), BALANCE])
+    assert api.update_table_lineage(conn) == (1, 4)
+    # Newest first; the 2022 income table shares no header years but still passes on its rows.
+    assert chain(conn, "aaa-2024", 0) == [("aaa-2023", 0, 0.6), ("aaa-2022", 0, 0.4)]
+    assert chain(conn, "aaa-2024", 1) == [("aaa-2023", 1, 1.0), ("aaa-2022", 1, 1.0)]
+
+    # A backfilled older filing becomes a prior of every later one.
+    add_filing(conn, "AAA", "aaa-2021", "2021-02-01", [income(2020), BALANCE])
+    assert api.update_table_lineage(conn) == (1, 6)
+    assert chain(conn, "aaa-2023", 1) == [("aaa-2022", 1, 1.0), ("aaa-2021", 1, 1.0)]
+    assert chain(conn, "aaa-2024", 0) == [("aaa-2023", 0, 0.6), ("aaa-2022", 0, 0.4), ("aaa-2021", 0, 0.4)]
+    assert chain(conn, "aaa-2021", 0) == []
+
+    assert api.update_table_lineage(conn, rebuild=True) == (5, 12)
+
+
+def test_changed_rows_are_relinked(conn):
+    api.update_table_lineage(conn)
+    conn.execute("UPDATE tables SET row_labels = ? WHERE filing_id = 'aaa-2022' AND table_idx = 0",
+                 (json.dumps(["Segment A", "Segment B"]),))
+    conn.commit()
+    assert chain(conn, "aaa-2023", 0) == []  # the trigger dropped the stale link
+    assert api.update_table_lineage(conn) == (1, 1)
+    assert chain(conn, "aaa-2023", 0) == []
+    assert chain(conn, "aaa-2023", 1) == [("aaa-2022", 1, 1.0)]
+
+    conn.execute("DELETE FROM tables WHERE filing_id = 'aaa-2022' AND table_idx = 1")
+    conn.commit()
+    assert chain(conn, "aaa-2023", 1) == []
+
+
+def test_link_tables_cli(tmp_path, conn, capsys):
+    conn.close()
+    api.cli(["link-tables", "--db", str(tmp_path / "tables.db"), "--tickers", "bbb"])
+    assert "Linked 1 filings (0 table links)" in capsys.readouterr().err
+    api.cli(["link-tables", "--db", str(tmp_path / "tables.db")])
+    assert "Linked 2 filings (2 table links)" in capsys.readouterr().err
+    with pytest.raises(SystemExit):
+        api.cli(["link-tables", "--db", str(tmp_path / "missing.db")])
+    assert "missing.db not found" in capsys.readouterr().err
+
+
+class Response:
+    def __init__(self):
+        self.status = None
+        self.headers = {}
+        self.body = io.BytesIO()
+        self.started = False
+
+    def start(self, status=200, headers=()):
+        self.status, self.headers, self.started = status, dict(headers), True
+
+    def write(self, data):
+        self.body.write(data)
+
+    def flush(self):
+        pass
+
+    def finish(self):
+        pass
+
+
+def get(qs):
+    response = Response()
+    environ = {"REQUEST_METHOD": "GET", "PATH_INFO": "/tables/lineage", "QUERY_STRING": qs}
+    api.main(environ, io.BytesIO(), response)
+    return response.status, json.loads(response.body.getvalue())
+
+
+def test_lineage_endpoint(tmp_path, conn, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    api.update_table_lineage(conn)
+    conn.close()
+
+    status, body = get("filing_id=aaa-2023&table_idx=0")
+    assert status == 200
+    assert body["table"]["filing_id"] == "aaa-2023" and body["table"]["headers"] == ["", "2022", "2021"]
+    assert [(m["filing_id"], m["table_idx"], m["score"]) for m in body["lineage"]] == [("aaa-2022", 0, 0.6)]
+    assert body["lineage"][0]["row_labels"] == INCOME_ROWS
+
+    status, body = get("filing_id=aaa-2023&table_idx=0&labels=0")
+    assert "headers" not in body["table"] and "row_labels" not in body["lineage"][0]
+    assert get("filing_id=aaa-2023&table_idx=7")[0] == 404
+    assert get("filing_id=aaa-2023")[0] == 400
@@ -0,0 +1,184 @@
+"""fiscal.ai response cache: TTL, stale-while-revalidate, ETags and LRU accounting."""
+
+import io
+import json
+import os
+import sqlite3
+import sys
+import time
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "cgi-bin"))
+
+import api  # noqa: E402
+
+PROFILE = "/company/profile"
+
+
+class Response:
+    def __init__(self):
+        self.status = None
+        self.headers = {}
+        self.body = io.BytesIO()
+        self.started = False
+
+    def start(self, status=200, headers=()):
+        self.status, self.headers, self.started = status, dict(headers), True
+
+    def write(self, data):
+        self.body.write(data)
+
+    def flush(self):
+        pass
+
+    def finish(self):
+        pass
+
+
+def get(path, qs="", **headers):
+    """Run one CGI-mode request through main(); after-response tasks run before it returns."""
+    environ = {"REQUEST_METHOD": "GET", "PATH_INFO": path, "QUERY_STRING": qs}
+    environ.update(("HTTP_" + k.upper(), v) for k, v in headers.items())
+    response = Response()
+    api.main(environ, io.BytesIO(), response)
+    return response
+
+
+class Upstream:
+    """Stub for fiscal_fetch: serves `version` and answers 304 when the ETag matches."""
+
+    def __init__(self):
+        self.version = 1
+        self.calls = []
+
+    def __call__(self, path, params=None, etag=None):
+        self.calls.append((path, etag))
+        current = f'"v{self.version}"'
+        if etag == current:
+            return None, etag
+        return json.dumps({"ticker": params["ticker"], "version": self.version}).encode(), current
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    cache = api.ResponseCache(str(tmp_path / "cache.db"))
+    monkeypatch.setattr(api, "_response_cache", cache)
+    return cache
+
+
+@pytest.fixture
+def upstream(monkeypatch):
+    stub = Upstream()
+    monkeypatch.setattr(api, "fiscal_fetch", stub)
+    return stub
+
+
+def age(cache, seconds):
+    """Move every entry's expiry `seconds` into the past."""
+    cache.conn().execute("UPDATE responses SET expires_at = expires_at - ?", (seconds,))
+
+
+def test_fresh_hits_skip_upstream(cache, upstream):
+    first = get("/companies/profile", "ticker=aapl")
+    second = get("/companies/profile", "ticker=AAPL")
+    assert first.status == second.status == 200
+    assert json.loads(second.body.getvalue()) == {"ticker": "AAPL", "version": 1}
+    assert first.headers["ETag"] == second.headers["ETag"]
+    assert len(upstream.calls) == 1
+
+
+def test_if_none_match_gets_304(cache, upstream):
+    etag = get("/companies/profile", "ticker=AAPL").headers["ETag"]
+    response = get("/companies/profile", "ticker=AAPL", if_none_match=etag)
+    assert response.status == 304
+    assert response.body.getvalue() == b""
+    assert "max-age=" in response.headers["Cache-Control"]
+
+
+def test_expired_past_stale_window_is_fetched_live(cache, upstream):
+    get("/companies/profile", "ticker=AAPL")
+    upstream.version = 2
+    age(cache, api.FISCAL_CACHE_TTL[PROFILE] + api.FISCAL_STALE_SECONDS + 1)
+    response = get("/companies/profile", "ticker=AAPL")
+    assert json.loads(response.body.getvalue())["version"] == 2
+    assert len(upstream.calls) == 2
+
+
+def test_stale_entry_is_served_then_refreshed_once(cache, upstream):
+    get("/companies/profile", "ticker=AAPL")
+    upstream.version = 2
+    age(cache, api.FISCAL_CACHE_TTL[PROFILE] + 1)
+    stale = get("/companies/profile", "ticker=AAPL")
+    # The stale body goes out; the refresh ran after the response.
+    assert json.loads(stale.body.getvalue())["version"] == 1
+    assert len(upstream.calls) == 2
+    fresh = get("/companies/profile", "ticker=AAPL")
+    assert json.loads(fresh.body.getvalue())["version"] == 2
+    assert len(upstream.calls) == 2
+
+
+def test_claim_refresh_is_exclusive_for_the_lease(cache, upstream):
+    get("/companies/profile", "ticker=AAPL")
+    key = cache.conn().execute("SELECT key FROM responses").fetchone()[0]
+    assert cache.claim_refresh(key, lease=60)
+    assert not cache.claim_refresh(key, lease=60)
+    assert not cache.claim_refresh("missing", lease=60)
+
+
+def test_upstream_304_extends_the_entry(cache, upstream):
+    get("/companies/profile", "ticker=AAPL")
+    age(cache, api.FISCAL_CACHE_TTL[PROFILE] + api.FISCAL_STALE_SECONDS + 1)
+    response = get("/companies/profile", "ticker=AAPL")
+    assert upstream.calls[-1] == (PROFILE, '"v1"')
+    assert json.loads(response.body.getvalue())["version"] == 1
+    expires_at = cache.conn().execute("SELECT expires_at FROM responses").fetchone()[0]
+    assert expires_at > time.time() + api.FISCAL_CACHE_TTL[PROFILE] - 60
+
+
+def test_cache_write_failure_still_answers(cache, upstream, monkeypatch):
+    def locked(*args, **kwargs):
+        raise sqlite3.OperationalError("database is locked")
+
+    monkeypatch.setattr(cache, "put", locked)
+    response = get("/companies/profile", "ticker=AAPL")
+    assert response.status == 200
+    assert json.loads(response.body.getvalue())["version"] == 1
+
+
+def total_size(cache):
+    conn = cache.conn()
+    tracked = conn.execute("SELECT total FROM cache_size").fetchone()[0]
+    actual = conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+    return tracked, actual
+
+
+def test_lru_eviction_and_size_accounting(tmp_path):
+    cache = api.ResponseCache(str(tmp_path / "cache.db"), max_bytes=1000)
+    conn = cache.conn()
+    for i in range(5):
+        cache.put(f"k{i}", b"x" * 100, 60)
+    # Re-putting a key replaces its size rather than adding to it.
+    cache.put("k0", b"y" * 300, 60)
+    assert total_size(cache) == (700, 700)
+    # k1 becomes the most recently used; k2 is now the oldest.
+    conn.execute("UPDATE responses SET accessed_at = accessed_at + 1000 WHERE key = 'k1'")
+    for i in range(5, 9):
+        cache.put(f"k{i}", b"x" * 100, 60)
+    keys = {k for k, in conn.execute("SELECT key FROM responses")}
+    assert "k2" not in keys and "k1" in keys
+    tracked, actual = total_size(cache)
+    assert tracked == actual <= 1000
+
+
+def test_size_total_is_seeded_for_an_existing_cache(tmp_path):
+    path = str(tmp_path / "cache.db")
+    conn = sqlite3.connect(path)
+    conn.executescript(api.CACHE_SCHEMA.split("CREATE TABLE IF NOT EXISTS cache_size")[0])
+    conn.execute("INSERT INTO responses (key, body, etag, expires_at, accessed_at, size)"
+                 " VALUES ('a', x'00', '\"e\"', 0, 0, 123)")
+    conn.commit()
+    conn.close()
+    assert total_size(api.ResponseCache(path)) == (123, 123)
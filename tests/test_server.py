@@ -0,0 +1,71 @@
+"""Server mode: keep-alive framing and the static allowlist."""
+
+import http.client
+import os
+import sys
+import threading
+from functools import partial
+from http.server import ThreadingHTTPServer
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "cgi-bin"))
+
+import api  # noqa: E402
+
+
+def _stream_route():
+    # No Content-Length, so a GET goes out chunked.
+    response = api.current_response()
+    response.start(200, [("Content-Type", "text/plain")])
+    response.write(b"hello ")
+    response.write(b"world")
+
+
+@pytest.fixture
+def server(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)  # runtime state (metrics, caches) stays out of the tree
+    monkeypatch.setattr(api, "_route", _stream_route)
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), partial(api.APIRequestHandler, directory=ROOT))
+    httpd.daemon_threads = True
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield httpd.server_address[1]
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_head_then_get_on_one_connection(server):
+    conn = http.client.HTTPConnection("127.0.0.1", server, timeout=5)
+    conn.request("HEAD", api.API_PREFIX + "/stream")
+    head = conn.getresponse()
+    assert head.status == 200
+    assert head.read() == b""
+    # Stray chunk framing after the HEAD would be parsed as this status line.
+    conn.request("GET", api.API_PREFIX + "/stream")
+    get = conn.getresponse()
+    assert get.status == 200
+    assert get.getheader("Transfer-Encoding") == "chunked"
+    assert get.read() == b"hello world"
+    conn.close()
+
+
+@pytest.mark.parametrize("path, status", [
+    ("/", 200),
+    ("/index.html", 200),
+    ("/app.js", 200),
+    ("/.git/config", 404),
+    ("/cgi-bin/", 404),
+    ("/cgi-bin/tables.db", 404),
+    ("/cgi-bin//api.py", 404),
+    ("/%2e%2e/etc/passwd", 404),
+    ("/bench/", 404),
+    ("/README.md", 404),
+])
+def test_static_allowlist(server, path, status):
+    conn = http.client.HTTPConnection("127.0.0.1", server, timeout=5)
+    conn.request("GET", path)
+    response = conn.getresponse()
+    response.read()
+    assert response.status == status
+    conn.close()
@@ -0,0 +1,75 @@
+"""find_similar_tables_batch() must return, per query, what find_similar_tables() does."""
+
+import json
+import os
+import random
+import sqlite3
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "cgi-bin"))
+sys.path.insert(0, os.path.join(ROOT, "bench"))
+
+from api import find_similar_tables, find_similar_tables_batch, index_tables  # noqa: E402
+from bench_similar_index import TICKERS, build_db, make_signature  # noqa: E402
+
+LIMIT = 10
+
+
+@pytest.fixture
+def conn(tmp_path):
+    conn = build_db(str(tmp_path / "tables.db"), 3000)
+    conn.row_factory = sqlite3.Row
+    yield conn
+    conn.close()
+
+
+def queries(conn, rng):
+    """Stored tables (with and without their own ticker), fresh signatures and degenerate ones."""
+    out = []
+    for headers, rows, ticker in conn.execute(
+        "SELECT headers, row_labels, ticker FROM tables ORDER BY random() LIMIT 20"
+    ).fetchall():
+        out.append((json.loads(headers), json.loads(rows), rng.choice([None, ticker, rng.choice(TICKERS)])))
+    for _ in range(8):
+        headers, rows = make_signature(rng)
+        out.append((headers, rows, rng.choice([None, rng.choice(TICKERS)])))
+    out += [([], [], None), ([""], ["x"], None), ([], [" "], TICKERS[1])]
+    return out
+
+
+def expected(conn, queries, exclude_filing=None, use_index=True):
+    want = []
+    for headers, rows, ticker in queries:
+        found = find_similar_tables(conn, headers, rows, ticker, use_index=use_index)
+        want.append([r for r in found if r["filing_id"] != exclude_filing][:LIMIT])
+    return want
+
+
+def check(conn, rng, exclude_filing=None, use_index=True):
+    qs = queries(conn, rng)
+    got = find_similar_tables_batch(conn, qs, LIMIT, exclude_filing, use_index=use_index)
+    assert got == expected(conn, qs, exclude_filing, use_index)
+    return got
+
+
+def test_batch_matches_single_scan(conn):
+    results = check(conn, random.Random(0), use_index=False)
+    assert any(results)
+
+
+def test_batch_matches_single_indexed(conn):
+    index_tables(conn)
+    rng = random.Random(1)
+    check(conn, rng)
+    check(conn, rng, exclude_filing="0000000000-25-000003")
+    # Rows added after index_tables() sit in table_index_dirty until reindexed.
+    conn.execute(
+        "INSERT INTO tables (filing_id, ticker, form_type, filed_date, table_idx, headers, row_labels, row_count)"
+        " SELECT filing_id || 'x', ticker, form_type, filed_date, table_idx, headers, row_labels, row_count"
+        " FROM tables WHERE rowid < 200"
+    )
+    conn.commit()
+    check(conn, rng)
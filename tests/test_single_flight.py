@@ -0,0 +1,107 @@
+"""SingleFlight: one fn() per key across threads, and across processes via the lock file."""
+
+import multiprocessing
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "cgi-bin"))
+
+import api  # noqa: E402
+
+
+def test_concurrent_threads_share_one_call(tmp_path):
+    flight = api.SingleFlight(str(tmp_path / "inflight"))
+    calls = []
+    release = threading.Event()
+
+    def fetch():
+        calls.append(threading.current_thread().name)
+        release.wait(5)
+        return b"body"
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(flight.do("k", fetch))) for _ in range(8)]
+    for t in threads:
+        t.start()
+    while flight.stats()["coalesced"] < len(threads) - 1:
+        time.sleep(0.01)
+    release.set()
+    for t in threads:
+        t.join(5)
+    assert len(calls) == 1
+    assert results == [b"body"] * len(threads)
+    assert flight.stats() == {"leaders": 1, "coalesced": 7, "coalesced_across_processes": 0}
+    # The key is free again once the call is done.
+    assert flight.do("k", lambda: b"again") == b"again"
+
+
+def test_errors_reach_every_waiter(tmp_path):
+    flight = api.SingleFlight(str(tmp_path / "inflight"))
+    release = threading.Event()
+
+    def fail():
+        release.wait(5)
+        raise ValueError("upstream down")
+
+    errors = []
+
+    def call():
+        try:
+            flight.do("k", fail)
+        except ValueError as e:
+            errors.append(str(e))
+
+    threads = [threading.Thread(target=call) for _ in range(4)]
+    for t in threads:
+        t.start()
+    while flight.stats()["coalesced"] < 3:
+        time.sleep(0.01)
+    release.set()
+    for t in threads:
+        t.join(5)
+    assert errors == ["upstream down"] * 4
+
+
+def _leader(directory, share, started, finished):
+    flight = api.SingleFlight(directory)
+
+    def fetch():
+        started.set()
+        time.sleep(0.5)
+        finished.value = time.time()
+        return b"from child"
+
+    flight.do("k", fetch, share=share)
+
+
+@pytest.mark.skipif(api.fcntl is None, reason="needs fcntl record locks")
+@pytest.mark.parametrize("share", [True, False])
+def test_forked_process_waits_for_the_leader(tmp_path, share):
+    directory = str(tmp_path / "inflight")
+    ctx = multiprocessing.get_context("fork")
+    started, finished = ctx.Event(), ctx.Value("d", 0.0)
+    child = ctx.Process(target=_leader, args=(directory, share, started, finished))
+    child.start()
+    assert started.wait(5)
+
+    flight = api.SingleFlight(directory)
+    ran = []
+
+    def fetch():
+        ran.append(time.time())
+        return b"from parent"
+
+    result = flight.do("k", fetch, share=share)
+    child.join(5)
+    assert child.exitcode == 0
+    assert flight.stats()["coalesced_across_processes"] == 1
+    if share:
+        # The leader published its bytes; this process never ran fetch().
+        assert result == b"from child" and not ran
+    else:
+        assert result == b"from parent" and ran[0] >= finished.value
@@ -0,0 +1,133 @@
+"""UpstreamClient retries and connection reuse against a local stub; RateLimiter across processes."""
+
+import multiprocessing
+import os
+import sys
+import threading
+import time
+import urllib.error
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "cgi-bin"))
+
+import api  # noqa: E402
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Answers from the server's `script` (a list of (status, headers)), then 200s."""
+
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.requests.append(self.path)
+            status, headers = server.script.pop(0) if server.script else (200, {})
+        body = f"{status} {self.path}".encode()
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        # Drop the connection without announcing it, like an upstream idle timeout.
+        self.close_connection = server.drop_after
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stub():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    server.daemon_threads = True
+    server.lock = threading.Lock()
+    server.requests = []
+    server.script = []
+    server.drop_after = False
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    server.url = f"http://127.0.0.1:{server.server_address[1]}"
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def client(tmp_path):
+    return api.UpstreamClient(limits={}, state_dir=str(tmp_path / "ratelimit"))
+
+
+def fetch(client, url):
+    with client.get(url, timeout=5) as resp:
+        return resp.status, resp.read()
+
+
+def test_retries_429_and_503_then_succeeds(stub, client):
+    stub.script = [(503, {"Retry-After": "0"}), (429, {"Retry-After": "0"})]
+    assert fetch(client, stub.url + "/a") == (200, b"200 /a")
+    stats = client.stats()
+    assert (stats.requests, stats.retries) == (3, 2)
+    # The retried exchanges reused one kept-alive connection.
+    assert stats.connections_opened == 1
+
+
+def test_gives_up_after_the_retry_budget(stub, client, monkeypatch):
+    monkeypatch.setattr(api, "UPSTREAM_RETRIES", 2)
+    stub.script = [(429, {"Retry-After": "0"})] * 5
+    with pytest.raises(urllib.error.HTTPError) as e:
+        fetch(client, stub.url + "/b")
+    assert e.value.code == 429
+    assert len(stub.requests) == 3
+
+
+def test_other_errors_are_not_retried(stub, client):
+    stub.script = [(404, {})]
+    with pytest.raises(urllib.error.HTTPError) as e:
+        fetch(client, stub.url + "/missing")
+    assert e.value.code == 404
+    assert e.value.read() == b"404 /missing"
+    assert client.stats().retries == 0
+
+
+def test_redirects_are_followed(stub, client):
+    stub.script = [(302, {"Location": "/there"})]
+    assert fetch(client, stub.url + "/here") == (200, b"200 /there")
+
+
+def test_stale_pooled_connection_is_replaced(stub, client):
+    stub.drop_after = True
+    assert fetch(client, stub.url + "/1") == (200, b"200 /1")
+    time.sleep(0.1)  # let the server close its end
+    assert fetch(client, stub.url + "/2") == (200, b"200 /2")
+    stats = client.stats()
+    assert stats.connections_reused == 1
+    assert stats.connections_opened == 2
+    assert stub.requests == ["/1", "/2"]
+
+
+def _take_tokens(path, rate, n, out):
+    limiter = api.RateLimiter(path, rate)
+    for _ in range(n):
+        limiter.acquire()
+        out.put(time.time())
+
+
+@pytest.mark.skipif(api.fcntl is None, reason="needs fcntl for the shared bucket file")
+def test_token_bucket_spaces_requests_across_processes(tmp_path):
+    path = str(tmp_path / "ratelimit" / "sec.gov.bucket")
+    rate, per_process, processes = 20.0, 5, 3
+    ctx = multiprocessing.get_context("fork")
+    out = ctx.Queue()
+    workers = [ctx.Process(target=_take_tokens, args=(path, rate, per_process, out)) for _ in range(processes)]
+    for worker in workers:
+        worker.start()
+    stamps = sorted(out.get(timeout=10) for _ in range(per_process * processes))
+    for worker in workers:
+        worker.join(10)
+    gaps = [b - a for a, b in zip(stamps, stamps[1:])]
+    # Burst 1: every token after the first waits its 1/rate share.
+    assert min(gaps) > 0.8 / rate
+    assert stamps[-1] - stamps[0] >= (len(stamps) - 1) / rate * 0.9